@@ -1,16 +1,29 @@
 # -*- coding: utf-8 -*-
 import os
 import json
-from typing import List, Dict, Any, Optional
-from openai import OpenAI
+import time
+import asyncio
+import inspect
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Optional, Iterator
 from dotenv import load_dotenv
 
 from core.agent_state import AgentState
 from core.prompt_templates import SYSTEM_PROMPT
+from core.context_budget import context_budget, compact_tool_output
+from core.prefetch import prefetcher, last_user_text
+from core.response_cache import response_cache
+from utils.single_flight import single_flight_group
+from utils.tool_cache import tool_result_cache
+from utils.tracing import tracer, set_current_span
+from utils.llm_gateway import llm_gateway
+from tools.market_context import market_context, new_market_context
 
 # Import tools
 from tools.real_time_tool import get_stock_price
-from tools.sentiment_tool import analyze_sentiment
+from tools.sentiment_tool import analyze_sentiment, analyze_sentiment_batch
 from tools.rag_tool import query_financial_reports
 from tools.visualization_tool import plot_stock_history
 from tools.portfolio_tool import analyze_portfolio
@@ -18,22 +31,57 @@ from tools.backtest_tool import backtest_strategy
 
 load_dotenv()
 
+# 单轮内并发执行工具调用的线程数
+TOOL_WORKERS = int(os.getenv("AGENT_TOOL_WORKERS", "4"))
+# ainvoke 在多个会话之间共享的工具线程池大小
+ASYNC_TOOL_WORKERS = int(os.getenv("AGENT_ASYNC_TOOL_WORKERS", "32"))
+# 单个工具调用的超时（秒），未列出的工具使用 DEFAULT_TOOL_TIMEOUT
+DEFAULT_TOOL_TIMEOUT = float(os.getenv("AGENT_TOOL_TIMEOUT", "120"))
+# 工具调用排队等待空闲线程的最长时间（秒），不计入工具自身的超时
+TOOL_QUEUE_TIMEOUT = float(os.getenv("AGENT_TOOL_QUEUE_TIMEOUT", "300"))
+TOOL_TIMEOUTS = {
+    "get_stock_price": 60,
+    "analyze_sentiment": 90,
+    "analyze_sentiment_batch": 300,
+    "query_financial_reports": 120,
+    "plot_stock_history": 60,
+    "analyze_portfolio": 180,
+    "backtest_strategy": 90,
+}
+# 工具结果缓存有效期（秒），0 表示不缓存；图表结果写入固定文件路径，不缓存
+TOOL_CACHE_TTLS = {
+    "get_stock_price": 60,
+    "analyze_sentiment": 1800,
+    "analyze_sentiment_batch": 1800,
+    "query_financial_reports": 24 * 3600,
+    "plot_stock_history": 0,
+    "analyze_portfolio": 600,
+    "backtest_strategy": 3600,
+}
+
 class AlphaScoutAgent:
-    def __init__(self):
-        self.api_key = os.getenv("api_key")
-        self.api_base = os.getenv("api_base")
-        self.model = "deepseek-chat"
-        if not self.api_key:
+    def __init__(self, tool_workers: int = TOOL_WORKERS, tool_timeouts: Optional[Dict[str, float]] = None,
+                 async_tool_workers: int = ASYNC_TOOL_WORKERS, tool_cache_ttls: Optional[Dict[str, float]] = None):
+        if not os.getenv("api_key"):
             raise ValueError("api_key not found in environment variables.")
             
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url=self.api_base
-        )
+        # 模型客户端、并发上限、token 预算和重试由进程级共享的 LLM 网关负责
+        self.llm = llm_gateway
+        
+        self.tool_timeouts = dict(TOOL_TIMEOUTS, **(tool_timeouts or {}))
+        self.tool_cache_ttls = dict(TOOL_CACHE_TTLS, **(tool_cache_ttls or {}))
+        self.tool_cache = tool_result_cache
+        self.context_budget = context_budget
+        self.prefetcher = prefetcher
+        self.response_cache = response_cache
+        self._tool_executor = ThreadPoolExecutor(max_workers=tool_workers, thread_name_prefix="tool")
+        # 阻塞的数据源/pandas 工具在 ainvoke 中卸载到该线程池执行
+        self._async_tool_executor = ThreadPoolExecutor(max_workers=async_tool_workers, thread_name_prefix="async-tool")
         
         self.tools_map = {
             "get_stock_price": self._get_stock_price_wrapper,
             "analyze_sentiment": analyze_sentiment,
+            "analyze_sentiment_batch": analyze_sentiment_batch,
             "query_financial_reports": query_financial_reports,
             "plot_stock_history": plot_stock_history,
             "analyze_portfolio": analyze_portfolio,
@@ -64,11 +112,27 @@ class AlphaScoutAgent:
                         "type": "object",
                         "properties": {
                             "ticker": {"type": "string", "description": "Stock ticker symbol"},
+                            "summary": {"type": "boolean", "description": "Whether key drivers and a narrative summary are needed (slower); omit for a quick score"},
                         },
                         "required": ["ticker"],
                     },
                 },
             },
+            {
+                "type": "function",
+                "function": {
+                    "name": "analyze_sentiment_batch",
+                    "description": "Analyzes market sentiment for several stock tickers in one call (e.g. a watchlist). Prefer it over repeated analyze_sentiment calls.",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "tickers": {"type": "array", "items": {"type": "string"}, "description": "List of stock ticker symbols"},
+                            "summary": {"type": "boolean", "description": "Whether key drivers and a narrative summary are needed (slower); omit for a quick score"},
+                        },
+                        "required": ["tickers"],
+                    },
+                },
+            },
             {
                 "type": "function",
                 "function": {
@@ -142,75 +206,332 @@ class AlphaScoutAgent:
         except Exception as e:
             return f"Error fetching stock price: {str(e)}"
 
-    def invoke(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _execute_tool(self, function_name: str, arguments: str):
+        """执行单个工具调用，异常转换为错误信息返回给模型"""
+        tool_func = self.tools_map.get(function_name)
+        if not tool_func:
+            return f"Error: Tool {function_name} not found."
+        with tracer.span(f"tool.{function_name}", "tool") as span:
+            try:
+                function_args = json.loads(arguments)
+                ttl = self.tool_cache_ttls.get(function_name, 0)
+                if ttl <= 0:
+                    print(f"Executing tool: {function_name}({function_args})")
+                    return tool_func(**function_args)
+                
+                key = self.tool_cache.make_key(function_name, function_args)
+                hit, result = self.tool_cache.get(key)
+                span.set(cache_hit=hit)
+                if hit:
+                    print(f"⚡ Tool cache hit: {function_name}({function_args})")
+                    return result
+                
+                def run():
+                    print(f"Executing tool: {function_name}({function_args})")
+                    result = tool_func(**function_args)
+                    self.tool_cache.put(key, result, ttl)
+                    return result
+                
+                # 相同的调用同时到达时只执行一次
+                return single_flight_group.do(("tool", key), run)
+            except Exception as e:
+                span.set(error=str(e))
+                return f"Error executing tool: {str(e)}"
+
+    def _submit_tool(self, function_name: str, arguments: str, context: Optional[contextvars.Context] = None):
         """
-        Processes a conversation and returns the updated messages.
-        This implements the tool-calling loop manually.
+        提交一个工具调用到线程池，返回 (future, timing)。
+        timing 记录提交时间和开始执行的时间：超时从工具开始执行时计算，排队等待空闲线程的时间不计入。
+        """
+        # 复制上下文，使 contextvars（如请求级行情上下文）在工具线程中可见
+        ctx = context.copy() if context is not None else contextvars.copy_context()
+        timing = {"submitted": time.monotonic()}
+
+        def run():
+            timing["started"] = time.monotonic()
+            return ctx.run(self._execute_tool, function_name, arguments)
+
+        return self._tool_executor.submit(run), timing
+
+    def _tool_result(self, function_name: str, future, timing: dict):
+        """等待工具结果，超时的调用返回错误信息（后台线程不会被强制终止）"""
+        timeout = self.tool_timeouts.get(function_name, DEFAULT_TOOL_TIMEOUT)
+        while True:
+            started = timing.get("started")
+            if started is not None:
+                wait = started + timeout - time.monotonic()
+            else:
+                queued_until = timing["submitted"] + TOOL_QUEUE_TIMEOUT
+                if time.monotonic() >= queued_until and future.cancel():
+                    return f"Error executing tool: {function_name} timed out waiting for a free worker."
+                # 尚未开始执行：等到开始执行后再按开始时间计算剩余时间
+                wait = min(timeout, queued_until - time.monotonic())
+            try:
+                return future.result(timeout=max(0.0, wait))
+            except FutureTimeoutError:
+                started = timing.get("started")
+                if started is not None and time.monotonic() >= started + timeout:
+                    return f"Error executing tool: {function_name} timed out."
+
+    def _run_tool_calls(self, tool_calls) -> List[Dict[str, Any]]:
+        """并发执行同一轮中的全部工具调用，按原顺序返回 tool 消息"""
+        submitted = [(tool_call, *self._submit_tool(tool_call.function.name, tool_call.function.arguments))
+                     for tool_call in tool_calls]
+        return [
+            self._tool_message(tool_call.id, tool_call.function.name,
+                               self._tool_result(tool_call.function.name, future, timing))
+            for tool_call, future, timing in submitted
+        ]
+
+    @staticmethod
+    def _tool_message(tool_call_id: str, function_name: str, result) -> Dict[str, Any]:
+        return {
+            "role": "tool",
+            "tool_call_id": tool_call_id,
+            "name": function_name,
+            # 工具结果压缩为紧凑文本，减少后续每次调用模型的提示词
+            "content": compact_tool_output(function_name, result)
+        }
+
+    @staticmethod
+    def _assistant_message(response_message) -> Dict[str, Any]:
+        # OpenAI response message needs to be converted back to dict for the next call
+        msg_dict = {
+            "role": "assistant",
+            "content": response_message.content,
+        }
+        if response_message.tool_calls:
+            msg_dict["tool_calls"] = [
+                {
+                    "id": tool_call.id,
+                    "type": "function",
+                    "function": {
+                        "name": tool_call.function.name,
+                        "arguments": tool_call.function.arguments
+                    }
+                } for tool_call in response_message.tool_calls
+            ]
+        return msg_dict
+
+    @property
+    def model(self) -> str:
+        return self.llm.model
+
+    def _chat(self, current_messages: List[Dict[str, Any]]):
+        """调用一次模型（非流式），延迟和 token 用量由网关记录"""
+        return self.llm.chat(
+            self.context_budget.fit(current_messages),
+            tools=self.tools_schema,
+            tool_choice="auto"
+        )
+
+    async def _arun_tool_call(self, tool_call) -> Dict[str, Any]:
+        """异步执行单个工具调用：协程工具直接 await，阻塞工具卸载到线程池"""
+        function_name = tool_call.function.name
+        timeout = self.tool_timeouts.get(function_name, DEFAULT_TOOL_TIMEOUT)
+        tool_func = self.tools_map.get(function_name)
+        try:
+            if inspect.iscoroutinefunction(tool_func):
+                function_args = json.loads(tool_call.function.arguments)
+                print(f"Executing tool: {function_name}({function_args})")
+                result = await asyncio.wait_for(tool_func(**function_args), timeout)
+            else:
+                loop = asyncio.get_running_loop()
+                ctx = contextvars.copy_context()
+                future = loop.run_in_executor(self._async_tool_executor, ctx.run, self._execute_tool,
+                                              function_name, tool_call.function.arguments)
+                result = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            result = f"Error executing tool: {function_name} timed out."
+        except Exception as e:
+            result = f"Error executing tool: {str(e)}"
+        return self._tool_message(tool_call.id, function_name, result)
+
+    async def ainvoke(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Async version of invoke built on AsyncOpenAI.
+        LLM requests do not block the event loop and blocking tools run in a shared thread pool,
+        so one process can serve many conversations concurrently, e.g.
+            await asyncio.gather(*(agent.ainvoke(m) for m in conversations))
         """
-        # Ensure system prompt is present
         if not any(m["role"] == "system" for m in messages):
             messages.insert(0, {"role": "system", "content": SYSTEM_PROMPT})
             
         current_messages = list(messages)
+        # 语义缓存需要编码问题、识别股票时可能下载代码表，放到线程池中执行，不阻塞其他会话
+        loop = asyncio.get_running_loop()
+        cached = await loop.run_in_executor(self._async_tool_executor, self.response_cache.lookup, current_messages)
+        if cached is not None:
+            return {"messages": current_messages + cached}
         
-        # Max iteration to prevent infinite loops
-        for _ in range(5):
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=current_messages,
+        with tracer.span("agent.ainvoke", "agent", model=self.model), market_context():
+            # 第一次模型请求期间在后台预取用户提到的股票数据
+            self.prefetcher.start(last_user_text(current_messages))
+            for iteration in range(5):
+                with tracer.span("agent.iteration", "agent", iteration=iteration):
+                    response = await self.llm.achat(
+                        self.context_budget.fit(current_messages),
+                        tools=self.tools_schema,
+                        tool_choice="auto"
+                    )
+                
+                    response_message = response.choices[0].message
+                    current_messages.append(self._assistant_message(response_message))
+                
+                    if not response_message.tool_calls:
+                        await loop.run_in_executor(self._async_tool_executor, self.response_cache.store,
+                                                   messages, current_messages[len(messages):])
+                        return {"messages": current_messages}
+                
+                    # gather 保持工具调用的原始顺序
+                    current_messages.extend(await asyncio.gather(
+                        *(self._arun_tool_call(tool_call) for tool_call in response_message.tool_calls)))
+        
+            return {"messages": current_messages}
+
+    def _stream_events(self, messages: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        invoke(stream=True) 的实现。以流式方式请求模型，依次产出事件:
+            {"type": "token", "content": ...}            模型输出的文本片段
+            {"type": "tool_call", "id", "name", "arguments"}  工具参数已完整，开始执行
+            {"type": "tool_result", "id", "name", "content"}  工具执行结果（按调用顺序）
+            {"type": "done", "messages": [...]}          对话结束，包含完整消息列表
+        工具调用的参数按 index 增量拼接；出现下一个 index 即说明前一个调用的参数已完整，
+        此时立即提交执行，不必等待整条消息生成结束。
+        """
+        current_messages = list(messages)
+        # 生成器会跨越调用方的多次 next()，不能用 with 设置 contextvars，这里显式传给每个工具
+        request_context = new_market_context()
+        root_span = tracer.start_span("agent.stream", "agent", model=self.model)
+        set_current_span(request_context, root_span)
+        self.prefetcher.start(last_user_text(current_messages), request_context)
+        try:
+            yield from self._stream_iterations(current_messages, request_context, root_span)
+        finally:
+            root_span.finish()
+        
+        yield {"type": "done", "messages": current_messages}
+
+    def _stream_iterations(self, current_messages, request_context, root_span):
+        for iteration in range(5):
+            llm_span = tracer.start_span("llm.chat", "llm", parent=root_span, model=self.model,
+                                         iteration=iteration, stream=True)
+            # token 用量（开启 include_usage 后最后一个 chunk 只包含用量）由网关记录到 llm_span
+            response = self.llm.stream(
+                self.context_budget.fit(current_messages),
+                span=llm_span,
                 tools=self.tools_schema,
                 tool_choice="auto"
             )
             
-            response_message = response.choices[0].message
+            content_parts = []
+            calls = []
+            submitted = []
+            
+            def submit_ready(count):
+                """提交前 count 个尚未执行的工具调用，返回对应的 tool_call 事件"""
+                events = []
+                while len(submitted) < count:
+                    call = calls[len(submitted)]
+                    call["id"] = call["id"] or f"call_{len(submitted)}"
+                    submitted.append(self._submit_tool(call["name"], call["arguments"], request_context))
+                    events.append({"type": "tool_call", **call})
+                return events
             
-            # OpenAI response message needs to be converted back to dict for the next call
-            msg_dict = {
-                "role": "assistant",
-                "content": response_message.content,
-            }
-            if response_message.tool_calls:
+            for chunk in response:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    if not content_parts:
+                        llm_span.set(time_to_first_token=llm_span.elapsed())
+                    content_parts.append(delta.content)
+                    yield {"type": "token", "content": delta.content}
+                for tool_delta in delta.tool_calls or []:
+                    yield from submit_ready(tool_delta.index)
+                    while len(calls) <= tool_delta.index:
+                        calls.append({"id": None, "name": "", "arguments": ""})
+                    call = calls[tool_delta.index]
+                    if tool_delta.id:
+                        call["id"] = tool_delta.id
+                    if tool_delta.function is not None:
+                        call["name"] += tool_delta.function.name or ""
+                        call["arguments"] += tool_delta.function.arguments or ""
+            yield from submit_ready(len(calls))
+            llm_span.finish()
+            
+            msg_dict = {"role": "assistant", "content": "".join(content_parts) or None}
+            if calls:
                 msg_dict["tool_calls"] = [
-                    {
-                        "id": tool_call.id,
-                        "type": "function",
-                        "function": {
-                            "name": tool_call.function.name,
-                            "arguments": tool_call.function.arguments
-                        }
-                    } for tool_call in response_message.tool_calls
+                    {"id": call["id"], "type": "function",
+                     "function": {"name": call["name"], "arguments": call["arguments"]}}
+                    for call in calls
                 ]
-            
             current_messages.append(msg_dict)
             
-            if not response_message.tool_calls:
-                # No more tools to call, return the final response
-                return {"messages": current_messages}
-                
-            # Execute tool calls
-            for tool_call in response_message.tool_calls:
-                function_name = tool_call.function.name
-                function_args = json.loads(tool_call.function.arguments)
-                
-                print(f"Executing tool: {function_name}({function_args})")
+            if not calls:
+                return
+            
+            for call, (future, timing) in zip(calls, submitted):
+                tool_message = self._tool_message(call["id"], call["name"],
+                                                  self._tool_result(call["name"], future, timing))
+                current_messages.append(tool_message)
+                yield {"type": "tool_result", "id": call["id"], "name": call["name"],
+                       "content": tool_message["content"]}
+
+    def invoke(self, messages: List[Dict[str, Any]], stream: bool = False):
+        """
+        Processes a conversation and returns the updated messages.
+        This implements the tool-calling loop manually.
+        With stream=True, returns a generator of events instead (see _stream_events), e.g.
+            for event in agent.invoke(messages, stream=True):
+                if event["type"] == "token": print(event["content"], end="")
+        """
+        # Ensure system prompt is present
+        if not any(m["role"] == "system" for m in messages):
+            messages.insert(0, {"role": "system", "content": SYSTEM_PROMPT})
+        
+        if stream:
+            return self._stream_events(messages)
+            
+        current_messages = list(messages)
+        cached = self.response_cache.lookup(current_messages)
+        if cached is not None:
+            return {"messages": current_messages + cached}
+        
+        # Max iteration to prevent infinite loops
+        with tracer.span("agent.invoke", "agent", model=self.model), market_context():
+            # 第一次模型请求期间在后台预取用户提到的股票数据
+            self.prefetcher.start(last_user_text(current_messages))
+            for iteration in range(5):
+                with tracer.span("agent.iteration", "agent", iteration=iteration):
+                    response = self._chat(current_messages)
+                    response_message = response.choices[0].message
+                    current_messages.append(self._assistant_message(response_message))
                 
-                tool_func = self.tools_map.get(function_name)
-                if tool_func:
-                    try:
-                        result = tool_func(**function_args)
-                    except Exception as e:
-                        result = f"Error executing tool: {str(e)}"
-                else:
-                    result = f"Error: Tool {function_name} not found."
+                    if not response_message.tool_calls:
+                        # No more tools to call, return the final response
+                        self.response_cache.store(messages, current_messages[len(messages):])
+                        return {"messages": current_messages}
                     
-                current_messages.append({
-                    "role": "tool",
-                    "tool_call_id": tool_call.id,
-                    "name": function_name,
-                    "content": str(result)
-                })
+                    # Execute tool calls of this turn concurrently, keeping their order
+                    current_messages.extend(self._run_tool_calls(response_message.tool_calls))
         
-        return {"messages": current_messages}
+            return {"messages": current_messages}
+
+_agent = None
+_agent_lock = threading.Lock()
+
+def get_agent() -> AlphaScoutAgent:
+    """返回进程级共享的 Agent，第一次调用时创建（缺少 api_key 时在此处报错，而不是导入模块时）"""
+    global _agent
+    with _agent_lock:
+        if _agent is None:
+            _agent = AlphaScoutAgent()
+        return _agent
 
-# For backward compatibility or singleton usage
-agent = AlphaScoutAgent()
+def __getattr__(name):
+    # For backward compatibility or singleton usage: `from core.agent import agent` 时才创建
+    if name == "agent":
+        return get_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
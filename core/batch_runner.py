@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+批量问答
+
+从 JSONL 读取问题，并发交给同一个 AlphaScoutAgent 处理（所有问题共享进程内的行情缓存、
+工具结果缓存和新闻缓存），结果逐行追加写入输出 JSONL。输出文件同时作为检查点：
+重新运行时跳过已成功的问题，崩溃后可直接续跑。
+
+输入每行一个 JSON 对象，问题取自 question / body / content 字段，编号取自 id / request_id 字段
+（缺失时使用行号）；也可以直接提供 OpenAI 格式的 messages。
+
+用法:
+    python -m core.batch_runner questions.jsonl answers.jsonl --concurrency 4 --llm-rate 2
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, Optional
+
+from utils.rate_limiter import rate_limiters
+
+# 同时处理的问题数
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+QUESTION_FIELDS = ("question", "body", "content")
+ID_FIELDS = ("id", "request_id")
+
+
+def load_questions(input_path: str) -> list:
+    """读取输入 JSONL，返回 [(编号, 原始记录)]，跳过空行"""
+    questions = []
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            question_id = next((str(record[k]) for k in ID_FIELDS if record.get(k) is not None), str(line_no))
+            questions.append((question_id, record))
+    return questions
+
+
+def load_checkpoint(output_path: str) -> set:
+    """返回输出文件中已成功完成的问题编号；最后一行写到一半（崩溃）时忽略该行"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if result.get("status") == "ok":
+                done.add(str(result["id"]))
+    return done
+
+
+def _has_partial_line(path: str) -> bool:
+    """文件非空且不以换行结尾"""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return False
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+
+def _build_messages(record: dict) -> list:
+    if record.get("messages"):
+        return [dict(m) for m in record["messages"]]
+    question = next((record[k] for k in QUESTION_FIELDS if record.get(k)), None)
+    if question is None:
+        raise ValueError(f"记录中没有问题字段 {QUESTION_FIELDS}")
+    if record.get("title"):
+        question = f"{record['title']}\n\n{question}"
+    return [{"role": "user", "content": question}]
+
+
+class BatchRunner:
+    """并发执行一批问题并把结果写入 JSONL，支持断点续跑"""
+
+    def __init__(self, agent=None, concurrency: int = BATCH_CONCURRENCY):
+        if agent is None:
+            from core.agent import get_agent
+            agent = get_agent()
+        self.agent = agent
+        self.concurrency = concurrency
+        self._write_lock = threading.Lock()
+
+    def _run_one(self, question_id: str, record: dict) -> Dict[str, Any]:
+        start = time.perf_counter()
+        result = {"id": question_id}
+        try:
+            messages = self.agent.invoke(_build_messages(record))["messages"]
+            result.update(status="ok", answer=messages[-1].get("content"),
+                          tools=[m["name"] for m in messages if m["role"] == "tool"])
+        except Exception as e:
+            result.update(status="error", error=f"{type(e).__name__}: {e}")
+        result["elapsed"] = round(time.perf_counter() - start, 3)
+        return result
+
+    def _write(self, f, result: dict):
+        with self._write_lock:
+            f.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+            # 每条结果立即落盘，崩溃时最多丢失正在处理的问题
+            f.flush()
+            os.fsync(f.fileno())
+
+    def run(self, input_path: str, output_path: str, limit: Optional[int] = None) -> dict:
+        questions = load_questions(input_path)
+        done = load_checkpoint(output_path)
+        pending = [(qid, record) for qid, record in questions if qid not in done]
+        if limit is not None:
+            pending = pending[:limit]
+        print(f"📋 Batch: {len(questions)} questions, {len(done)} already done, {len(pending)} to run")
+
+        summary = {"total": len(questions), "skipped": len(questions) - len(pending), "ok": 0, "error": 0}
+        if not pending:
+            return summary
+
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        unterminated = _has_partial_line(output_path)
+        with open(output_path, "a", encoding="utf-8") as f, \
+                ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch") as executor:
+            # 崩溃时最后一行可能没有写完，另起一行，避免与新结果拼接在一起
+            if unterminated:
+                f.write("\n")
+            futures = [executor.submit(self._run_one, qid, record) for qid, record in pending]
+            for future in as_completed(futures):
+                result = future.result()
+                self._write(f, result)
+                summary[result["status"]] += 1
+                print(f"{'✅' if result['status'] == 'ok' else '❌'} [{result['id']}] {result['elapsed']}s "
+                      f"({summary['ok'] + summary['error']}/{len(pending)})")
+        return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a JSONL batch of questions through AlphaScoutAgent")
+    parser.add_argument("input", help="输入 JSONL")
+    parser.add_argument("output", help="输出 JSONL（同时作为检查点）")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="同时处理的问题数")
+    parser.add_argument("--llm-rate", type=float, default=None, help="LLM 请求速率上限（次/秒）")
+    parser.add_argument("--provider-rate", type=float, default=None, help="每个行情数据源的请求速率上限（次/秒）")
+    parser.add_argument("--limit", type=int, default=None, help="本次最多处理的问题数")
+    args = parser.parse_args(argv)
+
+    if args.llm_rate is not None:
+        rate_limiters.configure("llm", args.llm_rate)
+    if args.provider_rate is not None:
+        for provider in ("tushare", "yfinance", "akshare"):
+            rate_limiters.configure(provider, args.provider_rate)
+
+    summary = BatchRunner(concurrency=args.concurrency).run(args.input, args.output, limit=args.limit)
+    print(f"🏁 Batch finished: {summary}")
+    return 0 if summary["error"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
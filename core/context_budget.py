@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Agent 上下文预算管理
+
+- 工具结果压缩：dict/list 转为紧凑 JSON，去掉空字段和冗余字段，数字保留有效位数，长文本截断
+- 提示词预算：每次调用模型前估算消息的 token 数，超出预算时先缩短较早的工具结果，
+  再按轮次丢弃最早的对话；assistant 的 tool_calls 与对应的 tool 消息总是一起保留或丢弃
+"""
+import os
+import json
+import math
+import numbers
+from typing import List, Dict, Any
+
+# 每次调用模型时提示词的 token 预算
+CONTEXT_TOKEN_BUDGET = int(os.getenv("AGENT_CONTEXT_TOKENS", "12000"))
+# 单个工具结果的最大字符数
+TOOL_OUTPUT_MAX_CHARS = int(os.getenv("AGENT_TOOL_OUTPUT_CHARS", "2000"))
+# 超出预算时，较早的工具结果缩短到的字符数
+STALE_TOOL_OUTPUT_CHARS = 300
+# 数字保留的有效位数
+SIGNIFICANT_DIGITS = 6
+# 每条消息的固定开销（role、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# 各工具结果中对模型没有额外信息的字段
+REDUNDANT_FIELDS = {
+    # summary 只是 total_return / buy_and_hold_return 的复述
+    "backtest_strategy": {"summary"},
+    "analyze_sentiment": {"source"},
+}
+
+TRUNCATED_MARK = "…(truncated)"
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符约 1 token/字，其余约 4 字符/token"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if '　' <= ch <= '鿿' or '＀' <= ch <= '￯')
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    tokens = MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message.get("content") or "")
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call["function"]
+        tokens += estimate_tokens(function["name"]) + estimate_tokens(function["arguments"])
+    return tokens
+
+
+def _compact_value(value, drop: set):
+    if isinstance(value, dict):
+        compacted = {}
+        for key, item in value.items():
+            if key in drop:
+                continue
+            item = _compact_value(item, drop)
+            if item is None or item == "" or item == [] or item == {}:
+                continue
+            compacted[key] = item
+        return compacted
+    if isinstance(value, (list, tuple)):
+        return [_compact_value(item, drop) for item in value]
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Real):
+        value = float(value)
+        if math.isnan(value) or math.isinf(value):
+            return None
+        return float(f"{value:.{SIGNIFICANT_DIGITS}g}")
+    if isinstance(value, str):
+        return value.strip()
+    return str(value)
+
+
+def truncate_text(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + TRUNCATED_MARK
+
+
+def compact_tool_output(function_name: str, result, max_chars: int = TOOL_OUTPUT_MAX_CHARS) -> str:
+    """将工具结果转换为发送给模型的紧凑文本"""
+    if isinstance(result, str):
+        # 已是 JSON 字符串的结果（如 get_stock_price）同样压缩
+        try:
+            parsed = json.loads(result)
+        except ValueError:
+            parsed = None
+        if not isinstance(parsed, (dict, list)):
+            # 普通文本：合并多余的空行
+            lines = [line.rstrip() for line in result.strip().splitlines()]
+            text = "\n".join(line for i, line in enumerate(lines) if line or (i and lines[i - 1]))
+            return truncate_text(text, max_chars)
+        result = parsed
+    if isinstance(result, (dict, list, tuple)):
+        compacted = _compact_value(result, REDUNDANT_FIELDS.get(function_name, set()))
+        text = json.dumps(compacted, ensure_ascii=False, separators=(",", ":"), default=str)
+        return truncate_text(text, max_chars)
+    return truncate_text(str(result), max_chars)
+
+
+def _group_units(messages: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """把消息分组：带 tool_calls 的 assistant 消息和其后的 tool 消息为一组，其余每条消息一组"""
+    units = []
+    for message in messages:
+        if message["role"] == "tool" and units and units[-1][0].get("tool_calls"):
+            units[-1].append(message)
+        else:
+            units.append([message])
+    return units
+
+
+class ContextBudget:
+    """在调用模型前把消息列表裁剪到 token 预算之内，不修改传入的消息"""
+
+    def __init__(self, max_tokens: int = CONTEXT_TOKEN_BUDGET, stale_tool_chars: int = STALE_TOOL_OUTPUT_CHARS):
+        self.max_tokens = max_tokens
+        self.stale_tool_chars = stale_tool_chars
+
+    def count(self, messages: List[Dict[str, Any]]) -> int:
+        return sum(message_tokens(m) for m in messages)
+
+    def fit(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        系统提示和最后一条用户消息之后的内容（当前轮）始终保留；
+        超出预算时先缩短之前轮次的工具结果，仍超出则从最早的轮次开始整组丢弃。
+        """
+        total = self.count(messages)
+        if total <= self.max_tokens:
+            return messages
+
+        system = [m for m in messages if m["role"] == "system"]
+        rest = [m for m in messages if m["role"] != "system"]
+        last_user = max((i for i, m in enumerate(rest) if m["role"] == "user"), default=0)
+        history, current = rest[:last_user], rest[last_user:]
+
+        units = _group_units(history)
+        for unit in units:
+            for i, message in enumerate(unit):
+                if total <= self.max_tokens:
+                    break
+                if message["role"] == "tool" and len(message.get("content") or "") > self.stale_tool_chars:
+                    shortened = dict(message, content=truncate_text(message["content"], self.stale_tool_chars))
+                    total -= message_tokens(message) - message_tokens(shortened)
+                    unit[i] = shortened
+
+        while units and total > self.max_tokens:
+            total -= sum(message_tokens(m) for m in units.pop(0))
+
+        # 丢弃后不能以孤立的 assistant/tool 消息开头
+        while units and units[0][0]["role"] != "user":
+            units.pop(0)
+
+        return system + [m for unit in units for m in unit] + current
+
+
+# 进程级默认实例
+context_budget = ContextBudget()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+推测性预取
+
+SYSTEM_PROMPT 要求模型先查询价格并生成图表，因此只要用户消息中提到了股票，
+第一轮工具调用基本可以预知。Agent 在发出第一次模型请求的同时，
+从用户消息中识别股票代码/公司名称，在后台预先加载行情、基本面和新闻，
+等模型返回工具调用时数据已经就绪（行情写入请求级行情上下文，新闻写入新闻缓存）。
+"""
+import os
+import re
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from tools.real_time_tool import get_stock_price
+from tools.sentiment_tool import fetch_news
+from tools.symbol_master import symbol_master, canonicalize_ticker
+
+PREFETCH_ENABLED = os.getenv("AGENT_PREFETCH", "1") == "1"
+# 每条消息最多预取的股票数量，避免误识别时发出大量请求
+MAX_PREFETCH_TICKERS = int(os.getenv("AGENT_PREFETCH_TICKERS", "3"))
+PREFETCH_WORKERS = int(os.getenv("AGENT_PREFETCH_WORKERS", "4"))
+
+# 6位A股代码（可带后缀）、带前缀的A股代码、港股代码、美股代码（2-5个大写字母）
+_A_SHARE = re.compile(r'(?<![\dA-Za-z])(?:SH|SZ|BJ)?\d{6}(?:\.(?:SH|SZ|BJ))?(?![\dA-Za-z])', re.IGNORECASE)
+_HK = re.compile(r'(?<![\dA-Za-z])\d{4,5}\.HK(?![A-Za-z])', re.IGNORECASE)
+_US = re.compile(r'(?<![\dA-Za-z.])[A-Z]{2,5}(?![\dA-Za-z])')
+# 紧跟金额/数量单位或前面是货币符号的数字是金额，不是股票代码
+_AMOUNT_UNIT = re.compile(r'\s*(?:元|块|万|亿|股|手|美元|港元|%|％)')
+_CURRENCY_SIGNS = ('¥', '￥', '$')
+
+# 常见的大写缩写，不是股票代码
+NOT_TICKERS = {
+    "AI", "API", "PE", "PB", "PS", "EPS", "ROE", "ROA", "MACD", "RSI", "SMA", "EMA", "MA", "KDJ", "BOLL",
+    "ETF", "IPO", "CEO", "CFO", "CTO", "USD", "CNY", "RMB", "HKD", "GDP", "CPI", "PPI", "PMI", "OK",
+    "US", "USA", "UK", "EU", "HK", "CN", "TTM", "YOY", "QOQ", "YTD", "ESG", "FED", "SEC", "PDF", "VS",
+}
+
+
+def _looks_like_a_share(text: str, match) -> bool:
+    """
+    带交易所前缀/后缀的代码直接接受；不带的6位数字也可能是金额，
+    只有代码表可用且其中存在该代码、并且不像金额时才接受（代码表未加载时不猜测）。
+    """
+    raw = match.group()
+    if not raw.isdigit():
+        return True
+    if _AMOUNT_UNIT.match(text, match.end()) or text[:match.start()].rstrip().endswith(_CURRENCY_SIGNS):
+        return False
+    return symbol_master.ensure_loaded() and symbol_master.is_listed(raw)
+
+
+def extract_tickers(text: str, max_tickers: int = MAX_PREFETCH_TICKERS) -> List[str]:
+    """从用户消息中识别股票，按出现顺序返回去重后的标准代码"""
+    found = []
+    found += [(m.start(), m.group()) for m in _A_SHARE.finditer(text) if _looks_like_a_share(text, m)]
+    found += [(m.start(), m.group()) for m in _HK.finditer(text)]
+    found += [(m.start(), m.group()) for m in _US.finditer(text) if m.group() not in NOT_TICKERS]
+
+    # 中文公司名：只使用已加载的代码表，不阻塞请求
+    if any('一' <= ch <= '鿿' for ch in text):
+        for symbol, name in symbol_master.names().items():
+            if len(name) >= 2 and name in text:
+                found.append((text.index(name), symbol))
+
+    tickers = []
+    for _, raw in sorted(found):
+        try:
+            ticker = canonicalize_ticker(raw)
+        except Exception:
+            continue
+        if ticker not in tickers:
+            tickers.append(ticker)
+        if len(tickers) >= max_tickers:
+            break
+    return tickers
+
+
+def _warm(name: str, fn, ticker: str):
+    try:
+        fn(ticker)
+    except Exception as e:
+        print(f"⚠️  预取 {name} 失败 {ticker}: {e}")
+
+
+class Prefetcher:
+    """在后台线程中预取行情和新闻，失败只记录日志，不影响请求"""
+
+    def __init__(self, workers: int = PREFETCH_WORKERS, enabled: bool = PREFETCH_ENABLED):
+        self.enabled = enabled
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+
+    def start(self, text: str, context: Optional[contextvars.Context] = None) -> List[str]:
+        """
+        识别 text 中的股票并提交预取任务，立即返回识别到的股票代码。
+        context 为预取任务运行的 contextvars 上下文（默认复制当前上下文），
+        应包含本次请求的行情上下文，工具调用才能复用预取的行情。
+        """
+        if not self.enabled or not text:
+            return []
+        try:
+            tickers = extract_tickers(text)
+        except Exception as e:
+            print(f"⚠️  识别股票代码失败: {e}")
+            return []
+        if tickers:
+            print(f"🚀 Prefetching {tickers}...")
+        base = context if context is not None else contextvars.copy_context()
+        for ticker in tickers:
+            self._executor.submit(base.copy().run, _warm, "price", get_stock_price, ticker)
+            self._executor.submit(base.copy().run, _warm, "news", fetch_news, ticker)
+        return tickers
+
+
+def last_user_text(messages: list) -> str:
+    for message in reversed(messages):
+        if message["role"] == "user":
+            content = message.get("content")
+            return content if isinstance(content, str) else ""
+    return ""
+
+
+# 进程级共享实例
+prefetcher = Prefetcher()
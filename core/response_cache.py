@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+回答缓存
+
+同一交易时段内，很多用户会问几乎相同的问题（"帮我分析一下贵州茅台"），每次都要跑完整的多轮工具调用。
+开启后（RESPONSE_CACHE=1），AlphaScoutAgent.invoke 在调用模型之前先查询本缓存：
+
+- 精确匹配：规范化后的问题文本完全相同
+- 语义匹配（RESPONSE_CACHE_SEMANTIC=1）：使用 RAG 同款 sentence-transformers 模型计算问题向量，
+  余弦相似度超过阈值且提到的股票完全相同时视为同一问题
+
+缓存的回答记录了所依赖股票的行情缓存版本 (fetched_at)。行情被更新或已不新鲜时回答失效，
+下次提问会重新执行工具调用。只缓存单轮问题（除系统提示外只有一条用户消息）。
+"""
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+from utils.tool_cache import is_error_result
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "0") == "1"
+SEMANTIC_ENABLED = os.getenv("RESPONSE_CACHE_SEMANTIC", "0") == "1"
+# 语义匹配的余弦相似度阈值
+SEMANTIC_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.92"))
+# 回答的最长有效期（秒），不依赖行情数据的回答只受此限制
+RESPONSE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+
+_PUNCTUATION = re.compile(r'[\s，。！？、,.!?;；:：~～"\'“”‘’]+')
+
+
+def normalize_question(text: str) -> str:
+    """去除空白和标点、统一大小写"""
+    return _PUNCTUATION.sub('', text).lower()
+
+
+def single_question(messages: List[Dict[str, Any]]) -> Optional[str]:
+    """单轮对话返回用户问题，多轮对话返回 None（回答依赖上下文，不缓存）"""
+    conversation = [m for m in messages if m["role"] != "system"]
+    if len(conversation) != 1 or conversation[0]["role"] != "user":
+        return None
+    content = conversation[0].get("content")
+    return content if isinstance(content, str) and content.strip() else None
+
+
+def tickers_from_tool_calls(answer: List[Dict[str, Any]]) -> List[str]:
+    """从回答的工具调用参数中收集用到的股票（ticker / tickers 参数和 holdings 的键）"""
+    from tools.symbol_master import canonicalize_ticker
+
+    tickers = []
+    for message in answer:
+        for tool_call in message.get("tool_calls") or []:
+            try:
+                arguments = json.loads(tool_call["function"]["arguments"])
+            except ValueError:
+                continue
+            raw = []
+            if isinstance(arguments.get("ticker"), str):
+                raw.append(arguments["ticker"])
+            if isinstance(arguments.get("tickers"), list):
+                raw.extend(t for t in arguments["tickers"] if isinstance(t, str))
+            if isinstance(arguments.get("holdings"), dict):
+                raw.extend(arguments["holdings"])
+            for ticker in raw:
+                try:
+                    ticker = canonicalize_ticker(ticker)
+                except Exception:
+                    continue
+                if ticker not in tickers:
+                    tickers.append(ticker)
+    return tickers
+
+
+class ResponseCache:
+    """按问题缓存完整回答（问题之后新增的全部消息），LRU 淘汰，线程安全"""
+
+    def __init__(self, enabled: bool = RESPONSE_CACHE_ENABLED, semantic: bool = SEMANTIC_ENABLED,
+                 threshold: float = SEMANTIC_THRESHOLD, ttl: int = RESPONSE_TTL,
+                 max_size: int = RESPONSE_CACHE_SIZE, embed=None):
+        self.enabled = enabled
+        self.semantic = semantic
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_size = max_size
+        self._embed = embed
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "invalidated": 0}
+
+    # ---------- 依赖项 ----------
+
+    def _embedding(self, text: str):
+        """返回单位化的问题向量；模型不可用时关闭语义匹配"""
+        import numpy as np
+        if self._embed is None:
+            try:
+                from tools.rag_tool import get_embedding_function
+                self._embed = get_embedding_function()
+            except Exception as e:
+                print(f"⚠️  语义缓存不可用，仅使用精确匹配: {e}")
+                self.semantic = False
+                return None
+        vector = np.asarray(self._embed([text])[0], dtype=float)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def _question_tickers(question: str) -> List[str]:
+        from core.prefetch import extract_tickers
+        try:
+            return sorted(extract_tickers(question, max_tickers=10))
+        except Exception:
+            return []
+
+    @staticmethod
+    def _fingerprints(tickers: List[str]) -> Optional[dict]:
+        """{ticker: fetched_at}；任一股票没有新鲜的行情缓存时返回 None"""
+        from tools.stock_cache import stock_cache
+        fingerprints = {}
+        for ticker in tickers:
+            fingerprint = stock_cache.fingerprint(ticker)
+            if fingerprint is None or not fingerprint[1]:
+                return None
+            fingerprints[ticker] = fingerprint[0]
+        return fingerprints
+
+    # ---------- 查询与写入 ----------
+
+    def _valid(self, entry: dict) -> bool:
+        if time.time() - entry["created_at"] > self.ttl:
+            return False
+        return self._fingerprints(list(entry["fingerprints"])) == entry["fingerprints"]
+
+    def lookup(self, messages: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """返回缓存的回答消息（问题之后的消息），未命中返回 None"""
+        if not self.enabled:
+            return None
+        question = single_question(messages)
+        if question is None:
+            return None
+        key = normalize_question(question)
+
+        with self._lock:
+            entry = self._entries.get(key)
+        kind = "exact_hits"
+        if entry is None and self.semantic:
+            entry = self._semantic_match(question)
+            kind = "semantic_hits"
+
+        if entry is not None and not self._valid(entry):
+            with self._lock:
+                self._entries.pop(entry["key"], None)
+                self._stats["invalidated"] += 1
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(entry["key"])
+            self._stats[kind] += 1
+        print(f"⚡ Response cache hit ({kind.split('_')[0]}): {question[:30]}")
+        return [dict(m) for m in entry["answer"]]
+
+    def _semantic_match(self, question: str) -> Optional[dict]:
+        vector = self._embedding(question)
+        if vector is None:
+            return None
+        tickers = self._question_tickers(question)
+        with self._lock:
+            candidates = [e for e in self._entries.values()
+                          if e.get("vector") is not None and e["question_tickers"] == tickers]
+        best, best_score = None, self.threshold
+        for entry in candidates:
+            score = float(vector @ entry["vector"])
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    def store(self, messages: List[Dict[str, Any]], answer: List[Dict[str, Any]]):
+        """缓存回答；回答中有工具错误时不缓存"""
+        if not self.enabled or not answer:
+            return
+        question = single_question(messages)
+        if question is None:
+            return
+        if any(m["role"] == "tool" and is_error_result(m.get("content")) for m in answer):
+            return
+        fingerprints = self._fingerprints(tickers_from_tool_calls(answer))
+        if fingerprints is None:
+            # 依赖的行情没有写入缓存（例如数据源失败），无法判断何时失效
+            return
+
+        key = normalize_question(question)
+        entry = {
+            "key": key,
+            "answer": [dict(m) for m in answer],
+            "fingerprints": fingerprints,
+            "question_tickers": self._question_tickers(question),
+            "created_at": time.time(),
+            "vector": self._embedding(question) if self.semantic else None,
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats, size=len(self._entries))
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# 进程级共享实例
+response_cache = ResponseCache()
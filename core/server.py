@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+常驻服务模式
+
+进程启动时一次性导入数据源库、创建 OpenAI 客户端（连接池在请求之间复用）、加载代码表、
+Chroma 向量库和 embedding 模型，之后所有对话共享同一个 AlphaScoutAgent 和进程内缓存。
+
+接口:
+    POST /invoke   {"messages": [...]} 或 {"question": "..."}，可选 "stream": true 以 NDJSON 逐行返回事件
+    GET  /health   存活检查和预加载状态
+    GET  /metrics  请求数、延迟以及各缓存/数据源统计
+
+用法:
+    python -m core.server --port 8000
+    python -m core.server --unix-socket /tmp/alpha_scout.sock
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+from socketserver import ThreadingMixIn
+
+from utils.single_flight import single_flight_group
+from utils.tool_cache import tool_result_cache
+
+SERVER_HOST = os.getenv("ALPHA_SCOUT_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("ALPHA_SCOUT_PORT", "8000"))
+# 请求体大小上限（字节）
+MAX_BODY_BYTES = 1 << 20
+
+
+class ServerMetrics:
+    """请求计数和延迟统计"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self._lock = threading.Lock()
+
+    def begin(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+
+    def end(self, latency: float, error: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            self.errors += int(error)
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            done = self.requests - self.in_flight
+            return {
+                "uptime": round(time.time() - self.started_at, 1),
+                "requests": self.requests,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "avg_latency": round(self.total_latency / done, 3) if done else 0.0,
+                "max_latency": round(self.max_latency, 3),
+            }
+
+
+class AlphaScoutService:
+    """持有常驻的 Agent 和预加载状态"""
+
+    def __init__(self, agent=None):
+        self.agent = agent
+        self.metrics = ServerMetrics()
+        self.warm = {}
+
+    def preload(self, rag: bool = True):
+        """导入并初始化所有重量级依赖；单项失败只记录，不影响服务启动"""
+        start = time.perf_counter()
+        if self.agent is None:
+            from core.agent import get_agent
+            self.agent = get_agent()
+        self.warm["agent"] = True
+        # 创建共享的模型客户端（连接池）
+        from utils.llm_gateway import llm_gateway
+        llm_gateway.client
+
+        from tools.symbol_master import symbol_master
+        self.warm["symbol_master"] = symbol_master.ensure_loaded(blocking=True)
+
+        if rag:
+            try:
+                from tools.rag_tool import warm_up
+                self.warm["rag_chunks"] = warm_up()
+            except Exception as e:
+                print(f"⚠️  RAG 预加载失败: {e}")
+                self.warm["rag_chunks"] = None
+        self.warm["preload_seconds"] = round(time.perf_counter() - start, 2)
+        print(f"🔥 Preloaded in {self.warm['preload_seconds']}s: {self.warm}")
+
+    def health(self) -> dict:
+        return {"status": "ok" if self.agent is not None else "starting",
+                "uptime": self.metrics.snapshot()["uptime"], "warm": self.warm}
+
+    def metrics_snapshot(self) -> dict:
+        from tools.stock_cache import get_cache_stats
+        from tools.real_time_tool import provider_router
+        from core.response_cache import response_cache
+        from tools.sentiment_store import sentiment_store
+        from tools.news_store import news_store
+        from utils.llm_gateway import llm_gateway
+        return {
+            "server": self.metrics.snapshot(),
+            "llm": llm_gateway.stats(),
+            "stock_cache": get_cache_stats(),
+            "tool_cache": tool_result_cache.stats(),
+            "response_cache": response_cache.stats(),
+            "sentiment_store": sentiment_store.stats(),
+            "news_store": news_store.stats(),
+            "single_flight": single_flight_group.stats(),
+            "providers": provider_router.stats(),
+        }
+
+
+def _messages_from_body(body: dict) -> list:
+    if body.get("messages"):
+        return body["messages"]
+    if body.get("question"):
+        return [{"role": "user", "content": body["question"]}]
+    raise ValueError("请求需要包含 messages 或 question 字段")
+
+
+def make_handler(service: AlphaScoutService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def address_string(self):
+            # Unix socket 没有客户端地址
+            return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+        def _send_json(self, status: int, payload: dict):
+            data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _write_chunk(self, payload: dict):
+            data = (json.dumps(payload, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, service.health())
+            elif self.path == "/metrics":
+                self._send_json(200, service.metrics_snapshot())
+            else:
+                self._send_json(404, {"error": f"unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/invoke":
+                self._send_json(404, {"error": f"unknown path {self.path}"})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY_BYTES:
+                self._send_json(413, {"error": "request body too large"})
+                return
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+                messages = _messages_from_body(body)
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+                return
+
+            service.metrics.begin()
+            start = time.perf_counter()
+            error = False
+            self._streaming = False
+            try:
+                if body.get("stream"):
+                    self._stream(messages)
+                else:
+                    result = service.agent.invoke(messages)
+                    self._send_json(200, {"messages": result["messages"],
+                                          "answer": result["messages"][-1].get("content")})
+            except Exception as e:
+                error = True
+                print(f"❌ /invoke failed: {e}")
+                if self._streaming:
+                    self.close_connection = True
+                else:
+                    self._send_json(500, {"error": str(e)})
+            finally:
+                service.metrics.end(time.perf_counter() - start, error)
+
+        def _stream(self, messages: list):
+            """以 chunked 编码逐行返回 token / tool_call / tool_result / done 事件"""
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self._streaming = True
+            try:
+                for event in service.agent.invoke(messages, stream=True):
+                    self._write_chunk(event)
+            except Exception as e:
+                self._write_chunk({"type": "error", "error": str(e)})
+                raise
+            finally:
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+    return Handler
+
+
+class UnixHTTPServer(ThreadingMixIn, HTTPServer):
+    """监听 Unix socket 的多线程 HTTP 服务"""
+    address_family = socket.AF_UNIX
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        self.socket.bind(self.server_address)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+def create_server(service: AlphaScoutService, host: str = SERVER_HOST, port: int = SERVER_PORT,
+                  unix_socket: str = None):
+    handler = make_handler(service)
+    if unix_socket:
+        return UnixHTTPServer(unix_socket, handler)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run AlphaScoutAgent as a resident HTTP service")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--unix-socket", default=None, help="监听 Unix socket 而不是 TCP 端口")
+    parser.add_argument("--no-rag", action="store_true", help="启动时不预加载向量库和 embedding 模型")
+    args = parser.parse_args(argv)
+
+    service = AlphaScoutService()
+    service.preload(rag=not args.no_rag)
+    server = create_server(service, args.host, args.port, args.unix_socket)
+    where = args.unix_socket or f"http://{args.host}:{args.port}"
+    print(f"🚀 Alpha Scout server listening on {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.unlink(args.unix_socket)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+导入耗时基准：在全新的子进程中多次导入模块，报告耗时中位数以及被导入的重量级依赖。
+
+用法:
+    python test/bench_import_time.py                 # 默认测量 core.agent
+    python test/bench_import_time.py tools core.server --runs 5
+对比改动前后: git stash && python test/bench_import_time.py && git stash pop && python test/bench_import_time.py
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["yfinance", "tushare", "akshare", "matplotlib", "pypdf", "chromadb", "openai",
+                 "sentence_transformers", "pandas", "pyarrow"]
+
+_PROBE = """
+import sys, json, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"elapsed": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module: str, runs: int = 3) -> dict:
+    timings, loaded = [], []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                                cwd=PROJECT_ROOT, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result["elapsed"])
+        loaded = result["loaded"]
+    return {"module": module, "median_seconds": round(statistics.median(timings), 3), "heavy_loaded": loaded}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold import time of project modules")
+    parser.add_argument("modules", nargs="*", default=["core.agent"])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args(argv)
+    for module in args.modules:
+        result = measure(module, args.runs)
+        print(f"⏱️  {result['module']}: {result['median_seconds']}s, heavy modules loaded: {result['heavy_loaded']}")
+
+
+if __name__ == "__main__":
+    main()
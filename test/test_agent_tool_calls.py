@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import json
+import asyncio
+from types import SimpleNamespace
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("api_key", "test-key")
+
+from core.agent import AlphaScoutAgent
+from utils.llm_gateway import LLMGateway
+
+
+def _tool_call(call_id, name, **arguments):
+    return SimpleNamespace(id=call_id, type="function",
+                           function=SimpleNamespace(name=name, arguments=json.dumps(arguments)))
+
+
+class FakeCompletions:
+    """第一次返回工具调用，第二次返回最终回答"""
+
+    def __init__(self, tool_calls):
+        self.responses = [
+            SimpleNamespace(content=None, tool_calls=tool_calls),
+            SimpleNamespace(content="done", tool_calls=None),
+        ]
+
+    def create(self, **kwargs):
+        message = self.responses.pop(0)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def _agent(tool_calls, **kwargs):
+    agent = AlphaScoutAgent(**kwargs)
+    agent.llm = LLMGateway(client=SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(tool_calls))))
+    return agent
+
+
+def test_tool_calls_run_concurrently_in_order():
+    agent = _agent([
+        _tool_call("1", "slow", ticker="AAPL"),
+        _tool_call("2", "fast", ticker="AAPL"),
+        _tool_call("3", "slow", ticker="MSFT"),
+    ], tool_workers=4)
+
+    def slow(ticker):
+        time.sleep(0.3)
+        return f"slow {ticker}"
+
+    agent.tools_map = {"slow": slow, "fast": lambda ticker: f"fast {ticker}"}
+
+    start = time.perf_counter()
+    messages = agent.invoke([{"role": "user", "content": "hi"}])["messages"]
+    elapsed = time.perf_counter() - start
+
+    tool_messages = [m for m in messages if m["role"] == "tool"]
+    assert [m["tool_call_id"] for m in tool_messages] == ["1", "2", "3"]
+    assert [m["content"] for m in tool_messages] == ["slow AAPL", "fast AAPL", "slow MSFT"]
+    assert elapsed < 0.55
+    assert messages[-1]["content"] == "done"
+
+
+def test_tool_timeout_and_errors():
+    agent = _agent([
+        _tool_call("1", "hang"),
+        _tool_call("2", "missing"),
+    ], tool_timeouts={"hang": 0.1})
+    agent.tools_map = {"hang": lambda: time.sleep(1)}
+
+    messages = agent.invoke([{"role": "user", "content": "hi"}])["messages"]
+    tool_messages = [m for m in messages if m["role"] == "tool"]
+    assert "timed out" in tool_messages[0]["content"]
+    assert "not found" in tool_messages[1]["content"]
+
+
+def test_tool_timeout_starts_when_tool_runs():
+    # 调用数多于线程数：排队等待的时间不计入超时
+    agent = _agent([_tool_call(str(i), "slow", ticker=f"T{i}") for i in range(5)],
+                   tool_workers=2, tool_timeouts={"slow": 0.2})
+
+    def slow(ticker):
+        time.sleep(0.1)
+        return f"slow {ticker}"
+
+    agent.tools_map = {"slow": slow}
+    messages = agent.invoke([{"role": "user", "content": "hi"}])["messages"]
+    assert [m["content"] for m in messages if m["role"] == "tool"] == [f"slow T{i}" for i in range(5)]
+
+
+def test_ainvoke_multiplexes_conversations():
+    class StatelessAsyncCompletions:
+        """根据最后一条消息决定返回工具调用还是最终回答"""
+
+        async def create(self, messages, **kwargs):
+            await asyncio.sleep(0.05)
+            last = messages[-1]
+            if last["role"] == "user":
+                message = SimpleNamespace(content=None, tool_calls=[
+                    _tool_call(last["content"], "slow", ticker=last["content"])])
+            else:
+                message = SimpleNamespace(content=last["content"], tool_calls=None)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    agent = AlphaScoutAgent()
+    agent.llm = LLMGateway(async_client=SimpleNamespace(chat=SimpleNamespace(completions=StatelessAsyncCompletions())))
+
+    def slow(ticker):
+        time.sleep(0.2)
+        return f"price {ticker}"
+
+    agent.tools_map = {"slow": slow}
+
+    async def main():
+        return await asyncio.gather(*(agent.ainvoke([{"role": "user", "content": f"T{i}"}]) for i in range(10)))
+
+    start = time.perf_counter()
+    results = asyncio.run(main())
+    elapsed = time.perf_counter() - start
+
+    for i, result in enumerate(results):
+        assert result["messages"][-1]["content"] == f"price T{i}"
+    # 10 个会话并发，总耗时接近单个会话
+    assert elapsed < 1.0
+
+
+def test_ainvoke_response_cache_does_not_block_other_conversations():
+    class FinalAnswerCompletions:
+        async def create(self, messages, **kwargs):
+            await asyncio.sleep(0.01)
+            message = SimpleNamespace(content=f"answer {messages[-1]['content']}", tool_calls=None)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    class SlowResponseCache:
+        """模拟第一次语义查询时加载模型"""
+
+        def lookup(self, messages):
+            if messages[-1]["content"] == "T0":
+                time.sleep(0.5)
+            return None
+
+        def store(self, messages, answer):
+            pass
+
+    agent = AlphaScoutAgent()
+    agent.llm = LLMGateway(async_client=SimpleNamespace(chat=SimpleNamespace(completions=FinalAnswerCompletions())))
+    agent.response_cache = SlowResponseCache()
+    finished = {}
+    start = time.perf_counter()
+
+    async def converse(i):
+        result = await agent.ainvoke([{"role": "user", "content": f"T{i}"}])
+        finished[i] = time.perf_counter() - start
+        return result
+
+    async def main():
+        return await asyncio.gather(*(converse(i) for i in range(5)))
+
+    results = asyncio.run(main())
+    assert [r["messages"][-1]["content"] for r in results] == [f"answer T{i}" for i in range(5)]
+    # 其他会话不等待 T0 的缓存查询
+    assert max(finished[i] for i in range(1, 5)) < 0.3
+    assert finished[0] >= 0.5
+
+
+def test_stream_starts_tools_before_message_completes():
+    started = {}
+
+    def _chunk(content=None, tool_calls=None):
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content, tool_calls=tool_calls))])
+
+    def _tool_delta(index, call_id=None, name=None, arguments=None):
+        return SimpleNamespace(index=index, id=call_id, function=SimpleNamespace(name=name, arguments=arguments))
+
+    class StreamingCompletions:
+        def __init__(self):
+            self.calls = 0
+
+        def create(self, stream=False, **kwargs):
+            assert stream
+            self.calls += 1
+            if self.calls == 1:
+                return self._first()
+            return iter([_chunk("最终"), _chunk("回答")])
+
+        def _first(self):
+            yield _chunk("正在查询")
+            yield _chunk(tool_calls=[_tool_delta(0, "a", "price", '{"tick')])
+            yield _chunk(tool_calls=[_tool_delta(0, arguments='er": "AAPL"}')])
+            yield _chunk(tool_calls=[_tool_delta(1, "b", "price", '{"ticker": "MSFT"}')])
+            # 第一个工具应在消息结束前已开始执行
+            time.sleep(0.1)
+            assert "AAPL" in started
+
+    agent = AlphaScoutAgent()
+    agent.llm = LLMGateway(client=SimpleNamespace(chat=SimpleNamespace(completions=StreamingCompletions())))
+
+    def price(ticker):
+        started[ticker] = time.perf_counter()
+        return f"price {ticker}"
+
+    agent.tools_map = {"price": price}
+
+    events = list(agent.invoke([{"role": "user", "content": "hi"}], stream=True))
+    types = [e["type"] for e in events]
+    assert types[0] == "token"
+    assert [e["id"] for e in events if e["type"] == "tool_call"] == ["a", "b"]
+    assert [e["content"] for e in events if e["type"] == "tool_result"] == ["price AAPL", "price MSFT"]
+    assert "".join(e["content"] for e in events if e["type"] == "token") == "正在查询最终回答"
+
+    messages = events[-1]["messages"]
+    assert types[-1] == "done"
+    assert messages[2]["tool_calls"][0]["function"]["arguments"] == '{"ticker": "AAPL"}'
+    assert messages[-1] == {"role": "assistant", "content": "最终回答"}
+
+
+def test_repeated_tool_calls_served_from_cache():
+    agent = _agent([_tool_call("1", "counted", ticker="aapl")], tool_cache_ttls={"counted": 60})
+    agent.tool_cache = type(agent.tool_cache)()
+    calls = []
+    agent.tools_map = {"counted": lambda ticker: calls.append(ticker) or f"result {ticker}"}
+
+    first = agent._execute_tool("counted", json.dumps({"ticker": "aapl"}))
+    second = agent._execute_tool("counted", json.dumps({"ticker": "AAPL "}))
+    assert first == second == "result aapl"
+    assert len(calls) == 1
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import time
+import threading
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.batch_runner import BatchRunner
+from utils.rate_limiter import TokenBucket
+
+
+class FakeAgent:
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def invoke(self, messages):
+        question = messages[-1]["content"]
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        if question in self.fail:
+            raise RuntimeError("boom")
+        return {"messages": messages + [{"role": "assistant", "content": f"answer to {question}"}]}
+
+
+def _write_questions(path, n):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n):
+            f.write(json.dumps({"request_id": f"q{i}", "body": f"question {i}"}) + "\n")
+
+
+def test_batch_runs_concurrently_and_resumes(tmp_path):
+    input_path, output_path = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    _write_questions(input_path, 6)
+
+    agent = FakeAgent(fail={"question 2"})
+    summary = BatchRunner(agent, concurrency=3).run(str(input_path), str(output_path))
+    assert summary == {"total": 6, "skipped": 0, "ok": 5, "error": 1}
+    assert agent.max_active == 3
+
+    # 模拟崩溃时写了一半的行
+    with open(output_path, "a", encoding="utf-8") as f:
+        f.write('{"id": "q5", "sta')
+
+    # 续跑只重新执行失败的问题
+    summary = BatchRunner(FakeAgent(), concurrency=3).run(str(input_path), str(output_path))
+    assert summary == {"total": 6, "skipped": 5, "ok": 1, "error": 0}
+    results = [json.loads(line) for line in output_path.read_text(encoding="utf-8").splitlines()
+               if line.endswith("}")]
+    ok = {r["id"]: r["answer"] for r in results if r["status"] == "ok"}
+    assert ok["q2"] == "answer to question 2" and len(ok) == 6
+
+
+def test_token_bucket_rate():
+    bucket = TokenBucket(rate=20, capacity=1)
+    start = time.perf_counter()
+    for _ in range(5):
+        bucket.acquire()
+    # 第一个令牌立即可用，其余 4 个按 20 个/秒补充
+    assert 0.15 <= time.perf_counter() - start < 0.5
+    assert TokenBucket(rate=0).acquire() == 0.0
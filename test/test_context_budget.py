@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from core.context_budget import ContextBudget, compact_tool_output, TRUNCATED_MARK
+
+
+def test_compact_tool_output():
+    result = {
+        "ticker": "AAPL",
+        "final_value": np.float64(123456.789123),
+        "trades": np.int64(4),
+        "total_return": "23.46%",
+        "summary": "Strategy SMA_Crossover achieved a 23.46% return ...",
+        "note": None,
+    }
+    compacted = compact_tool_output("backtest_strategy", result)
+    assert json.loads(compacted) == {"ticker": "AAPL", "final_value": 123457.0, "trades": 4, "total_return": "23.46%"}
+    assert " " not in compacted
+
+    # JSON 字符串同样压缩，长文本截断
+    assert compact_tool_output("get_stock_price", '{"pe_ratio": 28.123456789}') == '{"pe_ratio":28.1235}'
+    assert compact_tool_output("query_financial_reports", "x" * 50, max_chars=10) == "x" * 10 + TRUNCATED_MARK
+
+
+def _turn(i, tool_chars):
+    return [
+        {"role": "user", "content": f"question {i}"},
+        {"role": "assistant", "content": None, "tool_calls": [
+            {"id": f"c{i}", "type": "function", "function": {"name": "query_financial_reports", "arguments": "{}"}}]},
+        {"role": "tool", "tool_call_id": f"c{i}", "name": "query_financial_reports", "content": "r" * tool_chars},
+        {"role": "assistant", "content": f"answer {i}"},
+    ]
+
+
+def test_fit_shortens_then_drops_old_turns():
+    system = {"role": "system", "content": "prompt"}
+    messages = [system] + _turn(1, 4000) + _turn(2, 4000) + [{"role": "user", "content": "latest"}]
+
+    budget = ContextBudget(max_tokens=10000)
+    assert budget.fit(messages) is messages
+
+    # 预算足够容纳缩短后的历史：工具结果被截断，轮次保留
+    fitted = ContextBudget(max_tokens=300, stale_tool_chars=100).fit(messages)
+    assert len(fitted) == len(messages)
+    assert all(len(m["content"]) < 200 for m in fitted if m["role"] == "tool")
+    assert len(messages[3]["content"]) == 4000
+
+    # 预算更小时从最早的轮次开始丢弃，tool_calls 与 tool 消息成对保留
+    fitted = ContextBudget(max_tokens=120, stale_tool_chars=100).fit(messages)
+    assert fitted[0] is system and fitted[1]["content"] == "question 2"
+    assert fitted[-1]["content"] == "latest"
+    call_ids = [c["id"] for m in fitted for c in m.get("tool_calls", [])]
+    assert call_ids == [m["tool_call_id"] for m in fitted if m["role"] == "tool"]
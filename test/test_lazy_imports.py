@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_import_time import measure
+from utils import lazy_imports
+
+
+def test_importing_agent_skips_heavy_dependencies():
+    result = measure("core.agent", runs=1)
+    for module in ["yfinance", "tushare", "akshare", "matplotlib", "pypdf", "chromadb", "openai"]:
+        assert module not in result["heavy_loaded"]
+
+
+def test_proxy_is_read_at_first_use(monkeypatch):
+    # 模拟 load_dotenv() 在导入 lazy_imports 之后才设置代理
+    monkeypatch.setattr(lazy_imports, "_proxy_applied", False)
+    monkeypatch.setenv("ALPHA_SCOUT_PROXY", "http://proxy.example:8080")
+    monkeypatch.delenv("HTTP_PROXY", raising=False)
+    monkeypatch.delenv("HTTPS_PROXY", raising=False)
+    lazy_imports.apply_proxy()
+    assert os.environ["HTTP_PROXY"] == os.environ["HTTPS_PROXY"] == "http://proxy.example:8080"
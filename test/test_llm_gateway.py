@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from utils.llm_gateway import LLMGateway, is_retryable
+
+
+class APIStatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def _response(content="ok", prompt_tokens=10, completion_tokens=5):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                           usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens))
+
+
+class ScriptedCompletions:
+    """按顺序抛出给定的异常，之后返回正常响应"""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if self.errors:
+            raise self.errors.pop(0)
+        return _response()
+
+
+def _gateway(completions, **kwargs):
+    return LLMGateway(client=SimpleNamespace(chat=SimpleNamespace(completions=completions)),
+                      retry_base=0.01, **kwargs)
+
+
+def test_retries_rate_limit_and_records_usage():
+    completions = ScriptedCompletions([APIStatusError(429), APIStatusError(503)])
+    gateway = _gateway(completions, model="test-model")
+
+    response = gateway.chat([{"role": "user", "content": "hi"}], temperature=0)
+    assert response.choices[0].message.content == "ok"
+    assert [c["model"] for c in completions.calls] == ["test-model"] * 3
+    stats = gateway.stats()
+    assert stats["retries"] == 2 and stats["errors"] == 2 and stats["calls"] == 3
+    assert stats["prompt_tokens"] == 10 and stats["completion_tokens"] == 5
+
+
+def test_non_retryable_errors_raise_immediately():
+    assert not is_retryable(APIStatusError(401))
+    completions = ScriptedCompletions([APIStatusError(400)])
+    with pytest.raises(APIStatusError):
+        _gateway(completions).chat([{"role": "user", "content": "hi"}])
+    assert len(completions.calls) == 1
+
+
+def test_concurrency_cap():
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    class SlowCompletions:
+        def create(self, **kwargs):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            return _response()
+
+    gateway = _gateway(SlowCompletions(), max_concurrency=2)
+    threads = [threading.Thread(target=gateway.chat, args=([{"role": "user", "content": "hi"}],)) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak[0] == 2
+    assert gateway.stats()["in_flight"] == 0
+
+
+def test_async_calls_share_the_cap_and_slot_wait_times_out():
+    active, peak = [0], [0]
+
+    class SlowAsyncCompletions:
+        async def create(self, **kwargs):
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            await asyncio.sleep(0.05)
+            active[0] -= 1
+            return _response()
+
+    gateway = LLMGateway(async_client=SimpleNamespace(chat=SimpleNamespace(completions=SlowAsyncCompletions())),
+                         max_concurrency=2, slot_timeout=5)
+
+    async def run():
+        return await asyncio.gather(*[gateway.achat([{"role": "user", "content": "hi"}]) for _ in range(6)])
+
+    assert len(asyncio.run(run())) == 6
+    assert peak[0] == 2 and gateway.stats()["in_flight"] == 0
+
+    # 槽位被占满时，同步调用等待 slot_timeout 后超时
+    gateway.slot_timeout = 0.1
+    gateway._slots.acquire()
+    gateway._slots.acquire()
+    with pytest.raises(TimeoutError):
+        gateway.chat([{"role": "user", "content": "hi"}])
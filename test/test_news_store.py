@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import news_store as news_store_module
+from tools.news_store import NewsStore
+
+NAMES = {"600519.SH": "贵州茅台", "000858.SZ": "五粮液"}
+
+
+def _store(tmp_path, **kwargs):
+    return NewsStore(path=str(tmp_path / "news.jsonl"), refresh_interval=0, names=lambda: NAMES, **kwargs)
+
+
+def _flash(content, time):
+    return {"title": content[:40], "summary": content, "content": content,
+            "publish_time": f"2024-01-02 {time}", "source": "Cailianshe"}
+
+
+def test_index_by_code_and_company_name(tmp_path):
+    store = _store(tmp_path)
+    added = store.ingest([
+        _flash("贵州茅台发布年报，净利润增长19%", "09:00:00"),
+        _flash("白酒板块走强，五粮液(000858)涨超5%", "10:00:00"),
+        _flash("央行开展逆回购操作", "11:00:00"),
+    ])
+    assert added == 3
+    assert [item["title"][:4] for item in store.lookup("600519.SH")] == ["贵州茅台"]
+    assert [item["title"][:4] for item in store.lookup("000858")] == ["白酒板块"]
+
+    # 重复新闻只补充索引
+    assert store.ingest([_flash("贵州茅台发布年报，净利润增长19%", "09:00:00")], keys=["000858"]) == 0
+    assert [item["publish_time"] for item in store.lookup("000858")] == ["2024-01-02 10:00:00", "2024-01-02 09:00:00"]
+
+    # 重启后从本地文件恢复索引
+    assert len(_store(tmp_path).lookup("600519")) == 1
+
+
+def test_eviction_and_fallback_to_feed(monkeypatch, tmp_path):
+    store = _store(tmp_path, max_items=2)
+    store.ingest([_flash(f"贵州茅台新闻{i}", f"0{i}:00:00") for i in range(3)])
+    assert [item["title"] for item in store.lookup("600519")] == ["贵州茅台新闻2", "贵州茅台新闻1"]
+
+    def broken(code):
+        raise ConnectionError("eastmoney down")
+
+    monkeypatch.setattr(news_store_module, "fetch_eastmoney", broken)
+    monkeypatch.setattr(news_store_module, "fetch_cailianshe", lambda: [_flash("五粮液提价", "12:00:00")])
+    assert store.refresh_ticker("000858.SZ") == 1
+    assert store.lookup("000858")[0]["title"] == "五粮液提价"
+
+
+def test_matcher_is_reused_and_log_is_compacted(tmp_path):
+    calls = []
+
+    def names():
+        calls.append(1)
+        return NAMES
+
+    store = NewsStore(path=str(tmp_path / "news.jsonl"), max_items=3, refresh_interval=0, names=names)
+    for i in range(5):
+        store.ingest([_flash(f"五粮液新闻{i}", f"0{i}:00:00"), _flash(f"贵州茅台新闻{i}", f"0{i}:30:00")])
+    # 名称匹配器只构建一次
+    assert len(calls) == 1
+
+    # 每次收录只追加新增条目，超过 max_items 两倍时压缩为当前内容
+    with open(tmp_path / "news.jsonl", encoding="utf-8") as f:
+        assert len(f.readlines()) <= 2 * 3
+    restarted = _store(tmp_path, max_items=3)
+    assert [item["title"] for item in restarted.lookup("600519")] == ["贵州茅台新闻4", "贵州茅台新闻3"]
+    assert [item["title"] for item in restarted.lookup("000858")] == ["五粮液新闻4"]
+
+
+def test_same_announcement_title_is_not_merged_across_companies(tmp_path):
+    store = _store(tmp_path)
+
+    def notice(company):
+        return {"title": "关于召开2023年年度股东大会的通知", "summary": f"{company}董事会决定召开股东大会...",
+                "publish_time": "2024-04-30 00:00:00", "source": "EastMoney"}
+
+    assert store.ingest([notice("贵州茅台")], keys=["600519"]) == 1
+    assert store.ingest([notice("五粮液")], keys=["000858"]) == 1
+    assert [item["summary"][:4] for item in store.lookup("600519")] == ["贵州茅台"]
+    assert [item["summary"][:3] for item in store.lookup("000858")] == ["五粮液"]
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import time
+import threading
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.prefetch as prefetch
+import tools.symbol_master as symbol_master_module
+from tools.symbol_master import SymbolMaster
+from tools.market_context import market_context, current_market_context
+
+
+def _use_master(monkeypatch, tmp_path):
+    path = tmp_path / "symbol_master.json"
+    symbols = [{"symbol": "600519.SH", "name": "贵州茅台"}, {"symbol": "000001.SZ", "name": "平安银行"},
+               {"symbol": "600000.SH", "name": "浦发银行"}]
+    path.write_text(json.dumps({"updated_at": time.time(), "symbols": symbols}, ensure_ascii=False), encoding="utf-8")
+    master = SymbolMaster(path=str(path))
+    monkeypatch.setattr(symbol_master_module, "symbol_master", master)
+    monkeypatch.setattr(prefetch, "symbol_master", master)
+
+
+def test_extract_tickers(monkeypatch, tmp_path):
+    _use_master(monkeypatch, tmp_path)
+    assert prefetch.extract_tickers("对比一下平安银行和AAPL的MACD，再看看600519") == ["000001.SZ", "AAPL", "600519.SH"]
+    # 不在代码表中的6位数字（如金额）和常见缩写不识别
+    assert prefetch.extract_tickers("用100000元回测，PE和RSI怎么样") == []
+    assert prefetch.extract_tickers("0700.HK 和 sh600519") == ["0700.HK", "600519.SH"]
+
+
+def test_numeric_amounts_are_not_tickers(monkeypatch, tmp_path):
+    _use_master(monkeypatch, tmp_path)
+    # 600000 在代码表中，但这里是金额
+    assert prefetch.extract_tickers("本金600000元，再加 ¥300000 和 100000 股") == []
+    assert prefetch.extract_tickers("看看600000的走势") == ["600000.SH"]
+
+    # 代码表不可用时，不带前缀/后缀的6位数字一律不识别
+    master = SymbolMaster(path=str(tmp_path / "missing.json"))
+    monkeypatch.setattr(master, "_refresh_in_background", lambda: None)
+    monkeypatch.setattr(prefetch, "symbol_master", master)
+    assert prefetch.extract_tickers("用100000元回测300000和600000") == []
+    assert prefetch.extract_tickers("600519.SH 怎么样") == ["600519.SH"]
+
+
+def test_prefetch_runs_in_request_context(monkeypatch, tmp_path):
+    _use_master(monkeypatch, tmp_path)
+    seen = []
+    done = threading.Event()
+
+    def fake_price(ticker):
+        seen.append((ticker, current_market_context()))
+        done.set()
+
+    def fake_news(ticker):
+        pass
+
+    monkeypatch.setattr(prefetch, "get_stock_price", fake_price)
+    monkeypatch.setattr(prefetch, "fetch_news", fake_news)
+
+    with market_context() as context:
+        assert prefetch.Prefetcher(enabled=True).start("贵州茅台最近怎么样") == ["600519.SH"]
+    assert done.wait(1)
+    assert seen == [("600519.SH", context)]
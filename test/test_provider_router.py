@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from utils.provider_router import ProviderRouter, CircuitOpenError
+
+
+def test_fallback_and_circuit_breaker():
+    router = ProviderRouter(failure_threshold=2, reset_timeout=60)
+    calls = []
+
+    def tushare(ticker):
+        calls.append("tushare")
+        raise TimeoutError("proxy timeout")
+
+    def akshare(ticker):
+        calls.append("akshare")
+        return f"{ticker} from akshare"
+
+    candidates = [("tushare", tushare), ("akshare", akshare)]
+    for _ in range(2):
+        assert router.call(candidates, "600519.SH") == ("600519.SH from akshare", "akshare")
+    assert router.stats()["tushare"]["state"] == "open"
+
+    # 熔断后直接跳过 tushare
+    calls.clear()
+    router.call(candidates, "600519.SH")
+    assert calls == ["akshare"]
+
+
+def _down():
+    raise ConnectionError("down")
+
+
+def test_half_open_trial_recovers():
+    router = ProviderRouter(failure_threshold=1, reset_timeout=0)
+    outcomes = iter([ConnectionError("down"), "ok"])
+
+    def flaky():
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    with pytest.raises(ConnectionError):
+        router.call([("tushare", flaky), ("akshare", _down)])
+    assert router.stats()["tushare"]["state"] == "open"
+    assert router.call([("tushare", flaky), ("akshare", _down)]) == ("ok", "tushare")
+    assert router.stats()["tushare"]["state"] == "closed"
+
+
+def test_all_providers_open():
+    router = ProviderRouter(failure_threshold=1, reset_timeout=60)
+
+    candidates = [("tushare", _down), ("akshare", _down)]
+    with pytest.raises(ConnectionError):
+        router.call(candidates)
+    with pytest.raises(CircuitOpenError):
+        router.call(candidates)
+
+
+def test_invalid_tickers_do_not_open_circuit():
+    router = ProviderRouter(failure_threshold=2, reset_timeout=60)
+
+    def tushare(ticker):
+        raise ValueError(f"股票代码 {ticker} 不存在")
+
+    def akshare(ticker):
+        raise ValueError(f"无法获取股票 {ticker} 的历史数据")
+
+    for ticker in ("999991.SH", "999992.SH", "999993.SH"):
+        with pytest.raises(ValueError):
+            router.call([("tushare", tushare), ("akshare", akshare)], ticker)
+    assert router.stats()["tushare"]["state"] == "closed"
+    assert router.stats()["tushare"]["data_errors"] == 3
+
+    # 唯一的数据源即使连续故障也不熔断
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            router.call([("yfinance", _down)])
+    assert router.stats()["yfinance"]["state"] == "closed"
+
+
+def test_hedged_request_takes_fastest_answer(monkeypatch):
+    monkeypatch.setattr("utils.provider_router.DEFAULT_HEDGE_DELAY", 0.05)
+    router = ProviderRouter(hedge=True)
+
+    def slow():
+        time.sleep(1.0)
+        return "slow"
+
+    def fast():
+        return "fast"
+
+    start = time.perf_counter()
+    assert router.call([("tushare", slow), ("akshare", fast)]) == ("fast", "akshare")
+    assert time.perf_counter() - start < 0.5
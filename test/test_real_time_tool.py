@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+import tools.real_time_tool as real_time_tool
+from tools.stock_cache import StockCache
+
+
+def _hist(n=5, tz=None):
+    index = pd.date_range("2025-01-02", periods=n, freq="D", tz=tz)
+    return pd.DataFrame({"Close": [float(i + 1) for i in range(n)]}, index=index)
+
+
+def test_get_stock_prices_uses_bulk_endpoints(monkeypatch, tmp_path):
+    monkeypatch.setattr(real_time_tool, "stock_cache", StockCache(cache_dir=str(tmp_path)))
+    calls = []
+
+    def fake_tushare_bulk(tickers, start_date=None, end_date=None):
+        calls.append(("tushare", tuple(tickers)))
+        return {t: (_hist(), {"name": t}) for t in tickers}
+
+    def fake_yfinance_bulk(tickers, start_date=None, end_date=None):
+        calls.append(("yfinance", tuple(tickers)))
+        # 模拟批量接口漏掉一只股票
+        return {t: (_hist(tz="America/New_York"), {"name": t}) for t in tickers if t != "TSLA"}
+
+    def fake_yfinance_single(ticker, start_date=None, end_date=None):
+        calls.append(("yfinance_single", ticker))
+        return _hist(tz="America/New_York"), {"name": ticker}
+
+    monkeypatch.setattr(real_time_tool, "get_tushare_bulk_data", fake_tushare_bulk)
+    monkeypatch.setattr(real_time_tool, "get_yfinance_bulk_data", fake_yfinance_bulk)
+    monkeypatch.setattr(real_time_tool, "get_yfinance_stock_data", fake_yfinance_single)
+
+    panel, fundamentals = real_time_tool.get_stock_prices(
+        ["600519.SH", "000001.SZ", "AAPL", "MSFT", "TSLA"], columns=["Close"])
+
+    assert ("tushare", ("600519.SH", "000001.SZ")) in calls
+    assert ("yfinance", ("AAPL", "MSFT", "TSLA")) in calls
+    assert ("yfinance_single", "TSLA") in calls
+    assert set(fundamentals) == {"600519.SH", "000001.SZ", "AAPL", "MSFT", "TSLA"}
+    # A股与美股按交易日对齐
+    assert len(panel) == 5
+    assert list(panel["AAPL"]["Close"]) == list(panel["600519.SH"]["Close"])
+
+    # 再次请求全部命中缓存
+    calls.clear()
+    real_time_tool.get_stock_prices(["600519.SH", "AAPL"])
+    assert calls == []
+
+
+def test_market_context_loads_each_ticker_once(monkeypatch):
+    from tools.market_context import market_context
+    loads = []
+
+    def fake_load(ticker, market=None, use_cache=True, columns=None):
+        loads.append(ticker)
+        hist = pd.DataFrame({"Open": [1.0, 2.0], "Close": [1.5, 2.5]}, index=pd.date_range("2025-01-02", periods=2))
+        return hist, {"name": ticker}
+
+    monkeypatch.setattr(real_time_tool, "_load_stock_price", fake_load)
+
+    with market_context() as context:
+        hist, _ = real_time_tool.get_stock_price("AAPL")
+        close, _ = real_time_tool.get_stock_price("aapl", columns=["Close"])
+        panel, _ = real_time_tool.get_stock_prices(["AAPL"], columns=["Close"])
+        assert context.stats()["loads"] == 1
+
+    assert list(hist.columns) == ["Open", "Close"]
+    assert list(close.columns) == ["Close"]
+    assert list(panel.columns) == [("AAPL", "Close")]
+    # 上下文之外不再复用
+    real_time_tool.get_stock_price("AAPL")
+    assert loads == ["AAPL", "AAPL"]
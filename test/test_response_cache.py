@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.response_cache import ResponseCache
+from tools.stock_cache import stock_cache
+
+
+def _answer(ticker):
+    return [
+        {"role": "assistant", "content": None, "tool_calls": [
+            {"id": "1", "type": "function",
+             "function": {"name": "get_stock_price", "arguments": json.dumps({"ticker": ticker})}}]},
+        {"role": "tool", "tool_call_id": "1", "name": "get_stock_price", "content": "{\"price\": 10}"},
+        {"role": "assistant", "content": "AAPL looks fine"},
+    ]
+
+
+def test_exact_hit_invalidated_by_market_data(monkeypatch):
+    versions = {"AAPL": ("2024-01-02T10:00:00", True)}
+    monkeypatch.setattr(stock_cache, "fingerprint", lambda ticker, market=None: versions.get(ticker))
+    cache = ResponseCache(enabled=True)
+
+    cache.store([{"role": "user", "content": "How is AAPL doing?"}], _answer("aapl"))
+    hit = cache.lookup([{"role": "system", "content": "sys"}, {"role": "user", "content": "how is aapl  doing"}])
+    assert hit[-1]["content"] == "AAPL looks fine"
+
+    # 多轮对话不使用缓存
+    assert cache.lookup([{"role": "user", "content": "How is AAPL doing?"},
+                         {"role": "assistant", "content": "..."},
+                         {"role": "user", "content": "How is AAPL doing?"}]) is None
+
+    # 行情更新后回答失效
+    versions["AAPL"] = ("2024-01-02T10:05:00", True)
+    assert cache.lookup([{"role": "user", "content": "How is AAPL doing?"}]) is None
+    stats = cache.stats()
+    assert stats["exact_hits"] == 1 and stats["invalidated"] == 1 and stats["size"] == 0
+
+
+def test_semantic_hit_requires_same_tickers(monkeypatch):
+    monkeypatch.setattr(stock_cache, "fingerprint", lambda ticker, market=None: ("t", True))
+    vectors = {"analyze aapl": [1.0, 0.0], "please analyze aapl": [0.99, 0.05],
+               "please analyze msft": [0.99, 0.05]}
+    cache = ResponseCache(enabled=True, semantic=True, threshold=0.95,
+                          embed=lambda texts: [vectors[texts[0].lower()]])
+
+    cache.store([{"role": "user", "content": "Analyze AAPL"}], _answer("AAPL"))
+    assert cache.lookup([{"role": "user", "content": "Please analyze AAPL"}]) is not None
+    assert cache.lookup([{"role": "user", "content": "Please analyze MSFT"}]) is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_answers_with_tool_errors_are_not_cached(monkeypatch):
+    monkeypatch.setattr(stock_cache, "fingerprint", lambda ticker, market=None: ("t", True))
+    cache = ResponseCache(enabled=True)
+    for error in ["Error: timeout", "RAG Error: collection unavailable", "工具调用错误: 参数无效"]:
+        answer = _answer("AAPL")
+        answer[1]["content"] = error
+        cache.store([{"role": "user", "content": "How is AAPL doing?"}], answer)
+    assert cache.stats()["size"] == 0
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import sentiment_tool
+from tools.sentiment_store import SentimentStore, article_fingerprint
+
+
+def _news(*titles):
+    return [{"title": t, "summary": t, "publish_time": "2024-01-02 09:30", "source": "EastMoney"} for t in titles]
+
+
+def test_only_new_articles_are_sent_to_llm(monkeypatch, tmp_path):
+    news = {"items": _news("业绩预增", "高管减持")}
+    llm_batches = []
+
+    def fake_score(stock_name, items):
+        llm_batches.append([item["title"] for item in items])
+        return [{"score": 0.8 if "增" in item["title"] else -0.6,
+                 "label": "positive" if "增" in item["title"] else "negative",
+                 "driver": item["title"]} for item in items]
+
+    monkeypatch.setattr(sentiment_tool, "sentiment_store", SentimentStore(store_dir=str(tmp_path)))
+    monkeypatch.setattr(sentiment_tool, "fetch_news", lambda ticker: news["items"])
+    monkeypatch.setattr(sentiment_tool, "_score_articles", fake_score)
+
+    first = sentiment_tool.analyze_sentiment("600519.SH")
+    assert first["sentiment_score"] == 0.1
+    assert first["key_drivers"] == ["业绩预增", "高管减持"]
+
+    # 新闻没有变化：不请求 LLM
+    assert sentiment_tool.analyze_sentiment("600519")["sentiment_score"] == 0.1
+    # 新增一条新闻：只为它请求 LLM
+    news["items"] = _news("新品发布") + news["items"]
+    third = sentiment_tool.analyze_sentiment("600519")
+    assert llm_batches == [["业绩预增", "高管减持"], ["新品发布"]]
+    assert third["news_analysis"]["newly_analyzed"] == 1
+
+    # 评分已持久化，重启后仍可使用
+    restarted = SentimentStore(store_dir=str(tmp_path))
+    fingerprints = [article_fingerprint(item) for item in news["items"]]
+    assert len(restarted.get_many("600519", fingerprints)) == 3
+
+
+def test_batch_packs_tickers_and_falls_back_per_ticker(monkeypatch, tmp_path):
+    news = {"AAPL": _news("iPhone sales beat"), "MSFT": _news("Azure growth slows"), "TSLA": []}
+    batch_requests, single_requests = [], []
+
+    def fake_batch(groups):
+        batch_requests.append(sorted(groups))
+        if len(batch_requests) == 1:
+            raise ValueError("unparseable")
+        return {ticker: [{"score": 0.5, "label": "positive", "driver": "x"}] * len(items)
+                for ticker, items in groups.items()}
+
+    def fake_single(stock_name, items):
+        single_requests.append(stock_name)
+        return [{"score": -0.5, "label": "negative", "driver": "y"}] * len(items)
+
+    monkeypatch.setattr(sentiment_tool, "sentiment_store", SentimentStore(store_dir=str(tmp_path)))
+    monkeypatch.setattr(sentiment_tool, "fetch_news", lambda ticker: news[ticker])
+    monkeypatch.setattr(sentiment_tool, "_score_article_batch", fake_batch)
+    monkeypatch.setattr(sentiment_tool, "_score_articles", fake_single)
+
+    # 第一次批量请求解析失败：退回逐只股票请求
+    results = sentiment_tool.analyze_sentiment_batch(["AAPL", "MSFT", "TSLA"])
+    assert batch_requests == [["AAPL", "MSFT"]]
+    assert single_requests == ["AAPL", "MSFT"]
+    assert results["AAPL"]["sentiment_score"] == -0.5
+    assert results["TSLA"]["news_analysis"]["total_news_analyzed"] == 0
+
+    # 已评分的新闻不再请求，新新闻合并到一个请求中
+    news["AAPL"] = _news("Buyback announced") + news["AAPL"]
+    news["MSFT"] = _news("New CEO") + news["MSFT"]
+    results = sentiment_tool.analyze_sentiment_batch(["AAPL", "MSFT"])
+    assert batch_requests[1] == ["AAPL", "MSFT"]
+    assert results["MSFT"]["news_analysis"]["newly_analyzed"] == 1
+    assert results["MSFT"]["sentiment_score"] == 0.0
+
+
+def test_pack_groups_respects_size_limit():
+    groups = {"A": _news("a" * 50), "B": _news("b" * 50), "C": _news("c" * 50)}
+    size = len(json.dumps(groups["A"], ensure_ascii=False))
+    assert [list(p) for p in sentiment_tool._pack_groups(groups, size * 2)] == [["A", "B"], ["C"]]
+
+
+KEYWORDS = [
+    ([0.0, 0.0, 1.0], ("下滑", "暴跌", "调查", "减持", "下调", "missed", "plunge", "downgrade")),
+    ([1.0, 0.0, 0.0], ("增长", "大涨", "订单", "回购", "上调", "beat", "rally", "upgrade")),
+    ([0.0, 1.0, 0.0], ("股东大会", "董事会", "小幅", "披露", "shareholder", "call", "little changed")),
+]
+
+
+def _keyword_embed(texts):
+    vectors = []
+    for text in texts:
+        vector = next((v for v, words in KEYWORDS if any(w in text for w in words)), [1.0, 1.0, 1.0])
+        vectors.append(vector)
+    return vectors
+
+
+def test_local_mode_escalates_low_confidence_and_summary(monkeypatch, tmp_path):
+    from tools import local_sentiment
+    news = _news("季度营收大涨", "高管减持", "公司更名")
+    llm_batches = []
+
+    def fake_score(stock_name, items):
+        llm_batches.append([item["title"] for item in items])
+        return [{"score": 0.0, "label": "neutral", "driver": item["title"], "source": "llm"} for item in items]
+
+    scorer = local_sentiment.LocalSentimentScorer(embed=_keyword_embed)
+    monkeypatch.setattr(sentiment_tool, "get_local_scorer", lambda: scorer)
+    monkeypatch.setattr(sentiment_tool, "sentiment_store", SentimentStore(store_dir=str(tmp_path)))
+    monkeypatch.setattr(sentiment_tool, "fetch_news", lambda ticker: news)
+    monkeypatch.setattr(sentiment_tool, "_score_articles", fake_score)
+
+    # 只有无法判断的新闻交给 LLM
+    result = sentiment_tool.analyze_sentiment("600519", mode="local")
+    assert llm_batches == [["公司更名"]]
+    assert result["news_analysis"]["locally_scored"] == 2
+    assert result["sentiment_distribution"] == {"positive": 0.333, "neutral": 0.333, "negative": 0.333}
+
+    # 需要驱动因素时，只有本地评分的新闻也交给 LLM
+    sentiment_tool.analyze_sentiment("600519", mode="local", summary=True)
+    assert llm_batches[1] == ["季度营收大涨", "高管减持"]
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import threading
+import http.client
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.server import AlphaScoutService, create_server
+
+
+class FakeAgent:
+    def invoke(self, messages, stream=False):
+        answer = {"role": "assistant", "content": f"echo {messages[-1]['content']}"}
+        if stream:
+            return iter([{"type": "token", "content": answer["content"]},
+                         {"type": "done", "messages": messages + [answer]}])
+        return {"messages": messages + [answer]}
+
+
+def _request(port, method, path, body=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    conn.request(method, path, body=json.dumps(body) if body is not None else None,
+                 headers={"Content-Type": "application/json"})
+    response = conn.getresponse()
+    data = response.read().decode("utf-8")
+    conn.close()
+    return response.status, data
+
+
+def test_invoke_health_and_metrics():
+    service = AlphaScoutService(agent=FakeAgent())
+    server = create_server(service, "127.0.0.1", 0)
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        status, data = _request(port, "POST", "/invoke", {"question": "茅台"})
+        assert status == 200 and json.loads(data)["answer"] == "echo 茅台"
+
+        status, data = _request(port, "POST", "/invoke", {"question": "hi", "stream": True})
+        events = [json.loads(line) for line in data.splitlines()]
+        assert [e["type"] for e in events] == ["token", "done"]
+
+        assert _request(port, "POST", "/invoke", {})[0] == 400
+        assert json.loads(_request(port, "GET", "/health")[1])["status"] == "ok"
+        metrics = json.loads(_request(port, "GET", "/metrics")[1])
+        assert metrics["server"]["requests"] == 2
+        assert "hit_rate" in metrics["tool_cache"]
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from utils.single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    group = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def fetch(ticker):
+        calls.append(ticker)
+        started.set()
+        time.sleep(0.2)
+        return {"ticker": ticker}
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        leader = executor.submit(group.do, ("AAPL",), fetch, "AAPL")
+        started.wait()
+        followers = [executor.submit(group.do, ("AAPL",), fetch, "AAPL") for _ in range(4)]
+        results = [leader.result()] + [f.result() for f in followers]
+
+    assert calls == ["AAPL"]
+    assert all(r is results[0] for r in results)
+    assert group.stats()["shared"] == 4
+
+    # 调用结束后不再合并
+    group.do(("AAPL",), fetch, "AAPL")
+    assert len(calls) == 2
+
+
+def test_errors_are_shared():
+    group = SingleFlight()
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("provider down")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(group.do, "k", failing)
+        started.wait()
+        follower = executor.submit(group.do, "k", failing)
+        for future in (leader, follower):
+            with pytest.raises(ValueError):
+                future.result()
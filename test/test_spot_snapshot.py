@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+from types import SimpleNamespace
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+import tools.spot_snapshot as spot_module
+from tools.spot_snapshot import SpotSnapshot
+
+
+def test_snapshot_downloaded_once_and_indexed(monkeypatch):
+    calls = []
+
+    def fake_spot():
+        calls.append(1)
+        return pd.DataFrame({
+            '代码': ['600519', '000001'],
+            '名称': ['贵州茅台', '平安银行'],
+            '市盈率-动态': [25.1, '-'],
+            '总市值': [2.1, 0.3],
+        })
+
+    monkeypatch.setattr(spot_module.lazy_imports, "akshare", lambda: SimpleNamespace(stock_zh_a_spot_em=fake_spot))
+    snapshot = SpotSnapshot(ttl=60)
+
+    assert snapshot.get_fundamentals("600519") == {"name": "贵州茅台", "pe_ratio": 25.1, "market_cap": 2.1e8}
+    assert snapshot.get_fundamentals("000001") == {"name": "平安银行", "market_cap": 0.3e8}
+    assert snapshot.get_fundamentals("999999") == {}
+    assert len(calls) == 1
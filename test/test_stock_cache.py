@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import datetime
+from zoneinfo import ZoneInfo
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from tools.stock_cache import StockCache, is_fresh, is_market_open, delta_start, merge_history
+
+
+def _ts(tz, *args):
+    return datetime.datetime(*args, tzinfo=ZoneInfo(tz)).timestamp()
+
+
+def test_intraday_ttl():
+    # 2025-01-06 是周一
+    now = _ts("Asia/Shanghai", 2025, 1, 6, 10, 0)
+    assert is_market_open("cn", now)
+    assert is_fresh(now - 60, "cn", now=now, intraday_ttl=300)
+    assert not is_fresh(now - 600, "cn", now=now, intraday_ttl=300)
+
+
+def test_valid_until_next_session():
+    # 周五收盘后抓取的数据在周末一直有效
+    fetched = _ts("Asia/Shanghai", 2025, 1, 10, 15, 30)
+    saturday = _ts("Asia/Shanghai", 2025, 1, 11, 12, 0)
+    assert is_fresh(fetched, "cn", now=saturday)
+    # 收盘前抓取的数据收盘后过期
+    assert not is_fresh(_ts("Asia/Shanghai", 2025, 1, 10, 14, 0), "cn", now=saturday)
+    # 下周一开盘后按 TTL 过期
+    monday = _ts("Asia/Shanghai", 2025, 1, 13, 9, 45)
+    assert not is_fresh(fetched, "cn", now=monday, intraday_ttl=300)
+
+
+def test_cache_roundtrip_and_stats(tmp_path):
+    cache = StockCache(cache_dir=str(tmp_path))
+    hist = pd.DataFrame(
+        {"Close": [1.0, 2.0]},
+        index=pd.DatetimeIndex(["2025-01-02", "2025-01-03"], tz="America/New_York"),
+    )
+    assert cache.get("AAPL", "us") is None
+    cache.put("AAPL", hist, {"name": "Apple"})
+    cached_hist, fundamentals = cache.get("AAPL", "us")
+    assert fundamentals["name"] == "Apple"
+    assert list(cached_hist["Close"]) == [1.0, 2.0]
+
+    # 新实例从磁盘层读取
+    reloaded = StockCache(cache_dir=str(tmp_path))
+    disk_hist, _ = reloaded.get("AAPL", "us")
+    assert str(disk_hist.index.tz) == "America/New_York"
+
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def _bars(dates, closes):
+    return pd.DataFrame({"Close": closes}, index=pd.DatetimeIndex(dates))
+
+
+def test_merge_history_appends_and_dedupes():
+    cached = _bars(["2025-01-02", "2025-01-03", "2025-01-06"], [10.0, 11.0, 11.5])
+    # 增量从倒数第二根开始，最后一根盘中数据被覆盖
+    assert delta_start(cached) == "20250103"
+    delta = _bars(["2025-01-03", "2025-01-06", "2025-01-07"], [11.0, 12.0, 12.5])
+    merged = merge_history(cached, delta)
+    assert list(merged["Close"]) == [10.0, 11.0, 12.0, 12.5]
+
+
+def test_merge_history_detects_readjustment():
+    cached = _bars(["2025-01-02", "2025-01-03", "2025-01-06"], [10.0, 11.0, 11.5])
+    # 分红后复权价整体变化，重叠 K 线不一致
+    delta = _bars(["2025-01-03", "2025-01-06"], [10.8, 11.4])
+    assert merge_history(cached, delta) is None
+
+
+def test_partitioned_store_append_and_column_reads(tmp_path):
+    cache = StockCache(cache_dir=str(tmp_path))
+    hist = pd.DataFrame(
+        {"Open": [1.0, 2.0, 3.0], "Close": [1.5, 2.5, 3.5]},
+        index=pd.DatetimeIndex(["2024-12-30", "2024-12-31", "2025-01-02"]),
+    )
+    cache.put("600519.SH", hist, {"name": "贵州茅台"}, provider="tushare")
+    assert sorted(os.listdir(tmp_path / "600519.SH")) == ["2024.parquet", "2025.parquet", "meta.json"]
+
+    # 增量追加只重写 2025 分区
+    mtime_2024 = os.path.getmtime(tmp_path / "600519.SH" / "2024.parquet")
+    appended = pd.concat([hist, pd.DataFrame({"Open": [4.0], "Close": [4.5]},
+                                             index=pd.DatetimeIndex(["2025-01-03"]))])
+    cache.put("600519.SH", appended, {"name": "贵州茅台"}, provider="tushare", append_from="20250102")
+    assert os.path.getmtime(tmp_path / "600519.SH" / "2024.parquet") == mtime_2024
+
+    reloaded = StockCache(cache_dir=str(tmp_path))
+    close_only, fundamentals = reloaded.get("600519.SH", "cn", columns=["Close"])
+    assert list(close_only.columns) == ["Close"]
+    assert list(close_only["Close"]) == [1.5, 2.5, 3.5, 4.5]
+    assert reloaded.peek("600519.SH")["provider"] == "tushare"
+
+
+def test_migrates_legacy_csv_without_meta(tmp_path):
+    # 早期版本只写了 {ticker}.csv，同一只股票可能同时有 601658.csv 和 601658.SH.csv
+    legacy = {
+        "601658.csv": ("Date,Open,Close\n2024-12-16,6.6,6.69\n", 1000.0),
+        "601658.SH.csv": ("Date,Open,Close\n2024-12-16,6.6,6.69\n2024-12-17,6.67,6.67\n", 2000.0),
+        "AAPL.csv": ("Date,Open,Close\n2024-12-24 00:00:00-05:00,254.3,257.0\n", 3000.0),
+    }
+    for name, (content, mtime) in legacy.items():
+        (tmp_path / name).write_text(content, encoding="utf-8")
+        os.utime(tmp_path / name, (mtime, mtime))
+
+    cache = StockCache(cache_dir=str(tmp_path))
+    entry = cache.peek("601658.SH")
+    # 只保留较新的一份，抓取时间取文件修改时间
+    assert entry["fetched_at"] == 2000.0
+    assert list(entry["hist"]["Close"]) == [6.69, 6.67]
+    assert str(cache.peek("AAPL")["hist"].index.tz) == "America/New_York"
+    assert sorted(os.listdir(tmp_path)) == ["601658.SH", "AAPL"]
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import time
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.symbol_master import SymbolMaster
+
+
+def _master(tmp_path):
+    path = tmp_path / "symbol_master.json"
+    symbols = [
+        {"symbol": "600519.SH", "name": "贵州茅台"},
+        {"symbol": "601658.SH", "name": "邮储银行"},
+        {"symbol": "000001.SZ", "name": "平安银行"},
+        {"symbol": "0700.HK", "name": "腾讯控股"},
+    ]
+    path.write_text(json.dumps({"updated_at": time.time(), "symbols": symbols}, ensure_ascii=False), encoding="utf-8")
+    return SymbolMaster(path=str(path))
+
+
+def test_resolve_codes(tmp_path):
+    master = _master(tmp_path)
+    assert master.resolve("601658") == ("601658.SH", "tushare")
+    assert master.resolve("601658.sh") == ("601658.SH", "tushare")
+    assert master.resolve("sz000001") == ("000001.SZ", "tushare")
+    # 不在代码表中的代码按代码段推断
+    assert master.resolve("300750") == ("300750.SZ", "tushare")
+    assert master.resolve("430047") == ("430047.BJ", "tushare")
+    assert master.resolve("00700") == ("0700.HK", "yfinance")
+    assert master.resolve("1658.HK") == ("1658.HK", "yfinance")
+    assert master.resolve("aapl") == ("AAPL", "yfinance")
+
+
+def test_resolve_names(tmp_path):
+    master = _master(tmp_path)
+    assert master.resolve("贵州茅台") == ("600519.SH", "tushare")
+    assert master.resolve("邮储") == ("601658.SH", "tushare")
+    assert master.resolve("腾讯控股") == ("0700.HK", "yfinance")
+    # "银行" 匹配多家公司，不做猜测
+    assert master.resolve("银行") == ("银行", "tushare")
+
+
+def test_failed_download_is_not_retried_immediately(tmp_path):
+    master = SymbolMaster(path=str(tmp_path / "missing.json"))
+    downloads = []
+
+    def offline():
+        downloads.append(1)
+        raise ConnectionError("network down")
+
+    master._download = offline
+    # 下载失败后按代码段推断，RETRY_DELAY 内不再重复下载
+    for _ in range(3):
+        assert master.resolve("邮储银行") == ("邮储银行", "tushare")
+        assert master.resolve("601658") == ("601658.SH", "tushare")
+    assert len(downloads) == 1
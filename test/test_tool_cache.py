@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.tool_cache import ToolResultCache
+
+
+def test_key_normalization_ttl_and_lru():
+    cache = ToolResultCache(max_size=2)
+    key = cache.make_key("analyze_sentiment", {"ticker": " 600519.sh "})
+    assert key == cache.make_key("analyze_sentiment", {"ticker": "600519.SH"})
+
+    cache.put(key, {"score": 0.5}, ttl=60)
+    assert cache.get(key) == (True, {"score": 0.5})
+
+    cache.put("short", "x", ttl=0.05)
+    time.sleep(0.1)
+    assert cache.get("short") == (False, None)
+
+    cache.put("a", 1, ttl=60)
+    cache.put("b", 2, ttl=60)
+    assert cache.get(key)[0] is False
+
+
+def test_errors_not_cached_and_disk_tier(tmp_path):
+    cache = ToolResultCache(cache_dir=str(tmp_path))
+    cache.put("err", "Error executing tool: boom", ttl=60)
+    cache.put("ok", {"total_return": "5.0%"}, ttl=60)
+    assert cache.get("err")[0] is False
+
+    # 新进程（新实例）从磁盘命中
+    restarted = ToolResultCache(cache_dir=str(tmp_path))
+    assert restarted.get("ok") == (True, {"total_return": "5.0%"})
+    assert restarted.stats()["disk_hits"] == 1
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from utils.tracing import Tracer
+
+
+def test_nested_spans_across_threads_and_export(tmp_path):
+    tracer = Tracer(enabled=True)
+
+    def tool():
+        with tracer.span("tool.x", "tool") as span:
+            span.set(cache_hit=False)
+
+    with tracer.span("agent.invoke", "agent") as root:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(contextvars.copy_context().run, tool).result()
+        with pytest.raises(ValueError):
+            with tracer.span("provider.tushare", "provider"):
+                raise ValueError("boom")
+
+    spans = {s["name"]: s for s in tracer.spans()}
+    assert spans["tool.x"]["parent_id"] == root.span_id
+    assert spans["tool.x"]["attrs"] == {"cache_hit": False}
+    assert spans["provider.tushare"]["attrs"]["error"] == "ValueError: boom"
+    assert len({s["trace_id"] for s in spans.values()}) == 1
+
+    assert tracer.export_jsonl(str(tmp_path / "trace.jsonl")) == 3
+    lines = (tmp_path / "trace.jsonl").read_text(encoding="utf-8").splitlines()
+    assert json.loads(lines[-1])["name"] == "agent.invoke"
+
+    tracer.export_chrome_trace(str(tmp_path / "trace.json"))
+    events = json.loads((tmp_path / "trace.json").read_text(encoding="utf-8"))["traceEvents"]
+    assert {e["ph"] for e in events} == {"X"}
+    assert all(e["dur"] >= 0 for e in events)
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer(enabled=False)
+    with tracer.span("x") as span:
+        span.set(a=1)
+    tracer.start_span("y").finish()
+    assert tracer.spans() == []
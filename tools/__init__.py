@@ -1,6 +1,6 @@
-from .real_time_tool import get_stock_price
+from .real_time_tool import get_stock_price, get_stock_prices
 from .sentiment_tool import analyze_sentiment
 from .rag_tool import query_financial_reports
 from .visualization_tool import plot_stock_history
 
-__all__ = ["get_stock_price", "analyze_sentiment", "query_financial_reports", "plot_stock_history"]
\ No newline at end of file
+__all__ = ["get_stock_price", "get_stock_prices", "analyze_sentiment", "query_financial_reports", "plot_stock_history"]
\ No newline at end of file
@@ -11,7 +11,7 @@ def backtest_strategy(ticker: str, initial_capital: float = 100000, strategy: st
     """
     print(f"🔧 Tool: Backtesting strategy '{strategy}' for {ticker}...")
     
-    hist, fundamentals = get_stock_price(ticker)
+    hist, fundamentals = get_stock_price(ticker, columns=['Close'])
     if hist.empty or len(hist) < 200:
         return "Error: Insufficient historical data for backtesting (at least 200 days required)."
         
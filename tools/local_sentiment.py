@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+本地新闻情绪评分（不请求 LLM）
+
+使用 RAG 同款多语言 sentence-transformers 模型在 CPU 上编码新闻标题，与正面/中性/负面三组锚点句的
+相似度经 softmax 得到各类概率：score = P(正面) - P(负面)，confidence = 最大类别概率。
+置信度低于 LOCAL_SENTIMENT_CONFIDENCE 的新闻交给 LLM 评分。
+"""
+import os
+import threading
+from typing import List, Optional
+
+# 低于该置信度的新闻需要 LLM 评分
+LOCAL_SENTIMENT_CONFIDENCE = float(os.getenv("LOCAL_SENTIMENT_CONFIDENCE", "0.6"))
+# softmax 温度，越小各类概率差距越大
+LOCAL_SENTIMENT_TEMPERATURE = float(os.getenv("LOCAL_SENTIMENT_TEMPERATURE", "0.05"))
+
+ANCHORS = {
+    "positive": [
+        "公司业绩大幅增长，净利润超出市场预期",
+        "股价大涨，创历史新高",
+        "获得大额订单，营收持续高增长",
+        "公司宣布回购股份并提高分红",
+        "机构上调评级至买入，目标价上调",
+        "Earnings beat expectations and revenue surged",
+        "Shares rally to a record high after strong guidance",
+        "Analysts upgrade the stock to buy",
+    ],
+    "neutral": [
+        "公司召开年度股东大会",
+        "公司发布关于董事会换届的公告",
+        "今日股价小幅波动，成交量平稳",
+        "公司将于下周披露季度报告",
+        "The company will hold its annual shareholder meeting",
+        "The company announced the date of its quarterly earnings call",
+        "Shares were little changed in quiet trading",
+    ],
+    "negative": [
+        "公司业绩大幅下滑，净利润亏损",
+        "股价暴跌，跌停",
+        "公司遭监管立案调查并被处罚",
+        "大股东及高管减持股份",
+        "机构下调评级，目标价下调",
+        "Earnings missed estimates and the company cut guidance",
+        "Shares plunge after a regulatory investigation",
+        "Analysts downgrade the stock to sell",
+    ],
+}
+
+
+def article_text(item: dict) -> str:
+    """用于编码的新闻文本：标题 + 摘要开头"""
+    title = item.get("title") or ""
+    summary = (item.get("summary") or "").rstrip(".")
+    return f"{title}。{summary[:120]}" if summary and summary != title else title
+
+
+class LocalSentimentScorer:
+    """锚点相似度情绪评分器，embedding 模型在第一次评分时加载"""
+
+    def __init__(self, embed=None, temperature: float = LOCAL_SENTIMENT_TEMPERATURE,
+                 confidence: float = LOCAL_SENTIMENT_CONFIDENCE):
+        self._embed = embed
+        self.temperature = temperature
+        self.confidence = confidence
+        self._anchors = None
+        self._lock = threading.Lock()
+
+    def _encode(self, texts: List[str]):
+        import numpy as np
+        vectors = np.asarray(self._embed(texts), dtype=float)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _ensure_anchors(self):
+        with self._lock:
+            if self._anchors is None:
+                if self._embed is None:
+                    from tools.rag_tool import get_embedding_function
+                    self._embed = get_embedding_function()
+                self._anchors = [(label, self._encode(sentences)) for label, sentences in ANCHORS.items()]
+        return self._anchors
+
+    def score(self, news_items: List[dict]) -> List[dict]:
+        """按输入顺序返回 [{"score", "label", "driver", "confidence", "source"}]"""
+        if not news_items:
+            return []
+        import numpy as np
+        from tools.sentiment_store import label_for
+
+        anchors = self._ensure_anchors()
+        vectors = self._encode([article_text(item) for item in news_items])
+        # 每类取与最相近的锚点的相似度
+        similarity = np.stack([(vectors @ anchor.T).max(axis=1) for _, anchor in anchors], axis=1)
+        logits = similarity / self.temperature
+        probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+        probs /= probs.sum(axis=1, keepdims=True)
+
+        index = {label: i for i, (label, _) in enumerate(anchors)}
+        results = []
+        for row in probs:
+            score = round(float(row[index["positive"]] - row[index["negative"]]), 3)
+            results.append({"score": score, "label": label_for(score), "driver": "",
+                            "confidence": round(float(row.max()), 3), "source": "local"})
+        return results
+
+    def confident(self, result: dict) -> bool:
+        return result["confidence"] >= self.confidence
+
+
+_scorer: Optional[LocalSentimentScorer] = None
+_scorer_lock = threading.Lock()
+
+
+def get_local_scorer() -> LocalSentimentScorer:
+    """进程级共享的评分器（延迟创建，避免导入时加载模型）"""
+    global _scorer
+    with _scorer_lock:
+        if _scorer is None:
+            _scorer = LocalSentimentScorer()
+        return _scorer
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+请求级行情数据上下文
+
+一次对话请求中，get_stock_price / backtest_strategy / analyze_portfolio / plot_stock_history
+经常先后请求同一只股票。Agent 在处理请求时通过 market_context() 建立一个上下文，
+上下文存放在 contextvars 中并随工具线程传递，同一请求内每只股票的历史行情和基本面只加载一次。
+"""
+import threading
+import contextvars
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar("market_context", default=None)
+
+
+class MarketDataContext:
+    """{标准代码: (hist, fundamentals)}，同一只股票并发请求时只有一个线程加载"""
+
+    def __init__(self):
+        self._entries = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+
+    def _ticker_lock(self, ticker: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(ticker, threading.Lock())
+
+    def peek(self, ticker: str):
+        """返回已加载的 (hist, fundamentals)，未加载返回 None"""
+        with self._lock:
+            entry = self._entries.get(ticker)
+            if entry is not None:
+                self.hits += 1
+            return entry
+
+    def store(self, ticker: str, entry: tuple):
+        with self._lock:
+            self._entries.setdefault(ticker, entry)
+
+    def get_or_load(self, ticker: str, loader):
+        """返回已加载的数据，未加载时调用 loader() 加载并保存；加载失败的结果不保存"""
+        entry = self.peek(ticker)
+        if entry is not None:
+            return entry
+        with self._ticker_lock(ticker):
+            entry = self.peek(ticker)
+            if entry is not None:
+                return entry
+            entry = loader()
+            with self._lock:
+                self.loads += 1
+                self._entries[ticker] = entry
+            return entry
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"tickers": len(self._entries), "hits": self.hits, "loads": self.loads}
+
+
+def current_market_context():
+    """返回当前请求的行情上下文，不在请求中时返回 None"""
+    return _current.get()
+
+
+def new_market_context() -> contextvars.Context:
+    """返回一个已设置新行情上下文的 contextvars.Context，用于在 ctx.run 中执行（例如流式生成器）"""
+    ctx = contextvars.copy_context()
+    ctx.run(_current.set, MarketDataContext())
+    return ctx
+
+
+@contextmanager
+def market_context():
+    """在 with 块内建立新的请求级行情上下文"""
+    context = MarketDataContext()
+    token = _current.set(context)
+    try:
+        yield context
+    finally:
+        _current.reset(token)
@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+本地新闻库
+
+增量收录东方财富个股新闻、财联社全球快讯和 yfinance 新闻，按 标题/发布时间/来源/正文 去重，
+并建立 股票 -> 新闻 的倒排索引：除了抓取时对应的股票，正文中出现的6位代码和公司名称（来自代码表）
+也会被索引，因此按股票查询新闻只是一次索引查找，不再对整份快讯做 str.contains 扫描。
+
+后台线程每 NEWS_STORE_REFRESH 秒刷新一次财联社快讯和最近查询过的股票。
+新闻库以追加日志 (JSON Lines) 保存在本地，每次收录只追加新增/变更的条目，日志过长时再整体压缩；重启后可直接使用。
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import datetime
+import threading
+from collections import OrderedDict
+from typing import List, Iterable
+
+from utils import lazy_imports
+from tools.sentiment_store import article_fingerprint
+
+NEWS_STORE_PATH = os.getenv("NEWS_STORE_PATH", "data_source/news_store.jsonl")
+# 最多保留的新闻条数，超出时淘汰最早收录的
+NEWS_STORE_MAX_ITEMS = int(os.getenv("NEWS_STORE_MAX_ITEMS", "5000"))
+# 后台刷新间隔（秒），0 表示不启动后台刷新
+NEWS_STORE_REFRESH = int(os.getenv("NEWS_STORE_REFRESH", "120"))
+# 股票在最近多少秒内被查询过才会被后台刷新
+WATCH_TTL = 3600
+
+A_SHARE_SUFFIXES = ('.SH', '.SZ', '.BJ')
+_CODE_PATTERN = re.compile(r'(?<!\d)\d{6}(?!\d)')
+
+
+def news_key(ticker: str) -> str:
+    """新闻索引的 key：A股使用6位代码，600519 与 600519.SH 共享同一份新闻"""
+    ticker = ticker.strip().upper()
+    if ticker.endswith(A_SHARE_SUFFIXES) or (ticker.isdigit() and len(ticker) == 6):
+        return ticker.split('.')[0]
+    return ticker
+
+
+def is_a_share(ticker: str) -> bool:
+    ticker = ticker.strip().upper()
+    return ticker.endswith(A_SHARE_SUFFIXES) or (ticker.isdigit() and len(ticker) == 6)
+
+
+def item_fingerprint(item: dict) -> str:
+    """
+    新闻库去重指纹：在 article_fingerprint（标题+发布时间+来源）基础上加入正文。
+    各公司的同名公告（如"关于召开股东大会的通知"）标题、时间和来源可能完全相同，不能合并为一条。
+    """
+    body = str(item.get("content") or item.get("summary") or "").strip()
+    return hashlib.sha1(f"{article_fingerprint(item)}|{body}".encode("utf-8")).hexdigest()
+
+
+class NameMatcher:
+    """
+    公司名称匹配：{名称: 新闻 key} 按名称长度分组做字典查找，
+    正文每个位置对每种名称长度只查一次，耗时与代码表中的公司数量无关。
+    """
+
+    def __init__(self, names: dict):
+        self._names = names
+        self._lengths = sorted({len(name) for name in names})
+        # 代码表中的全部 key，用于过滤正文里的6位数字
+        self.keys = set(names.values())
+
+    def find(self, text: str) -> set:
+        found = set()
+        for length in self._lengths:
+            for start in range(len(text) - length + 1):
+                key = self._names.get(text[start:start + length])
+                if key is not None:
+                    found.add(key)
+        return found
+
+
+# ---------- 数据源 ----------
+
+def fetch_eastmoney(code: str) -> list:
+    """东方财富个股新闻（最新10条）"""
+    print(f"Fetching A-share news for {code}...")
+    news_df = lazy_imports.akshare().stock_news_em(symbol=code)
+    items = []
+    for _, row in news_df.head(10).iterrows():
+        items.append({
+            "title": row.get('新闻标题', ''),
+            "summary": (row.get('新闻内容', '') or '')[:200] + "...",
+            "publish_time": str(row.get('发布时间', '')),
+            "source": row.get('文章来源', 'EastMoney')
+        })
+    return items
+
+
+def fetch_cailianshe() -> list:
+    """财联社全球快讯（整份滚动列表）"""
+    print("Fetching Cailianshe rolling news...")
+    news_df = lazy_imports.akshare().stock_info_global_cls()
+    items = []
+    for _, row in news_df.iterrows():
+        content = row.get('内容', '') or ''
+        items.append({
+            # 快讯常常没有标题，使用正文开头
+            "title": row.get('标题', '') or content[:40],
+            "summary": content[:200] + "...",
+            "content": content,
+            "publish_time": f"{row.get('发布日期', '')} {row.get('发布时间', '')}",
+            "source": "Cailianshe"
+        })
+    return items
+
+
+def fetch_yfinance(ticker: str) -> list:
+    """yfinance 新闻（最新10条）"""
+    print(f"Fetching US share news for {ticker}...")
+    news = lazy_imports.yfinance().Ticker(ticker).news
+    items = []
+    for item in news[:10]:
+        items.append({
+            "title": item.get('title', ''),
+            "summary": item.get('publisher', '') + ": " + item.get('title', ''), # yf news often has no content body in simple call
+            "publish_time": str(datetime.datetime.fromtimestamp(item.get('providerPublishTime', 0))) if item.get('providerPublishTime') else '',
+            "source": item.get('publisher', 'Yahoo Finance')
+        })
+    return items
+
+
+class NewsStore:
+    """去重的新闻库 + 股票倒排索引，线程安全"""
+
+    def __init__(self, path: str = NEWS_STORE_PATH, max_items: int = NEWS_STORE_MAX_ITEMS,
+                 refresh_interval: int = NEWS_STORE_REFRESH, names=None):
+        self.path = path
+        self.max_items = max_items
+        self.refresh_interval = refresh_interval
+        # names: 返回 {标准代码: 公司名称} 的函数，默认使用代码表
+        self._names = names
+        self._items = OrderedDict()
+        self._index = {}
+        self._watched = {}
+        self._feed_updated_at = 0.0
+        self._loaded = False
+        self._thread = None
+        self._lock = threading.RLock()
+        # 名称匹配器只在代码表刷新后重建
+        self._matcher = None
+        self._matcher_version = None
+        self._matcher_lock = threading.Lock()
+        # 日志文件的行数，超过 max_items 的两倍时压缩；写文件时持有 _file_lock
+        self._log_lines = 0
+        self._file_lock = threading.Lock()
+
+    # ---------- 索引 ----------
+
+    def _name_matcher(self) -> NameMatcher:
+        """返回公司名称匹配器，代码表版本变化时才重建"""
+        if self._names is None:
+            from tools.symbol_master import symbol_master
+            symbol_master.ensure_loaded()
+            names, version = symbol_master.names, symbol_master.version
+        else:
+            names, version = self._names, None
+        with self._matcher_lock:
+            if self._matcher is None or self._matcher_version != version:
+                self._matcher = NameMatcher({name: news_key(symbol) for symbol, name in names().items()
+                                             if name and len(name) >= 2})
+                self._matcher_version = version
+            return self._matcher
+
+    @staticmethod
+    def _keys_for(item: dict, matcher: NameMatcher) -> set:
+        text = f"{item.get('title', '')} {item.get('content') or item.get('summary', '')}"
+        # 代码表不可用时接受所有6位数字
+        keys = {code for code in _CODE_PATTERN.findall(text) if not matcher.keys or code in matcher.keys}
+        if any('一' <= ch <= '鿿' for ch in text):
+            keys |= matcher.find(text)
+        return keys
+
+    def _add(self, fp: str, item: dict, keys: Iterable[str]):
+        """调用方需持有 self._lock"""
+        item["keys"] = sorted(set(item.get("keys", [])) | set(keys))
+        self._items[fp] = item
+        for key in item["keys"]:
+            self._index.setdefault(key, set()).add(fp)
+
+    def _evict(self):
+        while len(self._items) > self.max_items:
+            fp, item = self._items.popitem(last=False)
+            for key in item["keys"]:
+                postings = self._index.get(key)
+                if postings:
+                    postings.discard(fp)
+                    if not postings:
+                        del self._index[key]
+
+    def ingest(self, items: list, keys: Iterable[str] = ()) -> int:
+        """收录新闻并建立索引，keys 为抓取时对应的股票；返回新增条数"""
+        self._load()
+        keys = {news_key(k) for k in keys}
+        matcher = self._name_matcher()
+        candidates = [(item, item_fingerprint(item)) for item in items if item.get("title")]
+        with self._lock:
+            fresh = [(item, fp) for item, fp in candidates if fp not in self._items]
+        # 扫描正文在锁外进行，锁内只更新字典
+        scanned = {fp: self._keys_for(item, matcher) for item, fp in fresh}
+
+        added, changed = 0, []
+        with self._lock:
+            for item, fp in candidates:
+                if fp in self._items:
+                    # 已收录：只补充索引，例如快讯中的新闻后来又出现在个股新闻里
+                    existing = self._items[fp]
+                    new_keys = keys - set(existing["keys"])
+                    if new_keys:
+                        self._add(fp, existing, new_keys)
+                        changed.append((fp, existing))
+                    continue
+                found = scanned[fp] if fp in scanned else self._keys_for(item, matcher)
+                item = dict(item, ingested_at=time.time())
+                self._add(fp, item, keys | found)
+                changed.append((fp, item))
+                added += 1
+            self._evict()
+            lines = [json.dumps([fp, item], ensure_ascii=False, default=str) for fp, item in changed]
+        self._append(lines)
+        return added
+
+    # ---------- 查询 ----------
+
+    def lookup(self, ticker: str, limit: int = 10) -> List[dict]:
+        """按股票返回最新的新闻，按发布时间倒序；第一次查询时启动后台刷新"""
+        self._load()
+        self.start_background()
+        key = news_key(ticker)
+        with self._lock:
+            self._watched[key] = (ticker, time.time())
+            items = [self._items[fp] for fp in self._index.get(key, ())]
+        items.sort(key=lambda item: (str(item.get("publish_time", "")), item["ingested_at"]), reverse=True)
+        return [{k: v for k, v in item.items() if k not in ("keys", "content", "ingested_at")}
+                for item in items[:limit]]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"items": len(self._items), "indexed_keys": len(self._index),
+                    "watched": len(self._watched), "feed_updated_at": self._feed_updated_at}
+
+    # ---------- 刷新 ----------
+
+    def refresh_feed(self) -> int:
+        """增量收录财联社快讯"""
+        items = fetch_cailianshe()
+        self._feed_updated_at = time.time()
+        return self.ingest(items)
+
+    def refresh_ticker(self, ticker: str) -> int:
+        """
+        收录单只股票的个股新闻（A股：东方财富，其他：yfinance）。
+        东方财富失败时，如财联社快讯已过期则刷新快讯，仍可按代码和公司名称查到相关新闻。
+        """
+        key = news_key(ticker)
+        with self._lock:
+            self._watched[key] = (ticker, time.time())
+        if not is_a_share(ticker):
+            return self.ingest(fetch_yfinance(ticker), keys=[key])
+        try:
+            return self.ingest(fetch_eastmoney(key), keys=[key])
+        except Exception as e:
+            print(f"Warning: Primary news source failed ({e}). Using Cailianshe news store...")
+            if time.time() - self._feed_updated_at >= self.refresh_interval:
+                try:
+                    return self.refresh_feed()
+                except Exception as e2:
+                    print(f"Fallback source also failed: {e2}")
+            return 0
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.refresh_feed()
+            except Exception as e:
+                print(f"⚠️  新闻库刷新失败: {e}")
+            now = time.time()
+            with self._lock:
+                watched = [ticker for ticker, seen in self._watched.values() if now - seen < WATCH_TTL]
+            for ticker in watched:
+                try:
+                    self.refresh_ticker(ticker)
+                except Exception as e:
+                    print(f"⚠️  新闻库刷新失败 {ticker}: {e}")
+
+    def start_background(self) -> bool:
+        """启动后台刷新线程（只启动一次）"""
+        if self.refresh_interval <= 0:
+            return False
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._refresh_loop, name="news-store", daemon=True)
+                self._thread.start()
+        return True
+
+    # ---------- 持久化 ----------
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not self.path or not os.path.exists(self.path):
+                return
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        fp, item = json.loads(line)
+                        # 同一条新闻可能出现多次（后续补充的索引），合并 key
+                        self._add(fp, self._items.get(fp, item), item.get("keys", []))
+                        self._log_lines += 1
+                self._evict()
+            except Exception as e:
+                print(f"⚠️  读取新闻库失败 {self.path}: {e}")
+
+    def _append(self, lines: List[str]):
+        """追加新增/变更的条目；日志超过 max_items 的两倍时整体压缩"""
+        if not self.path or not lines:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._file_lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            self._log_lines += len(lines)
+            if self._log_lines > 2 * self.max_items:
+                self._compact()
+
+    def _compact(self):
+        """调用方需持有 self._file_lock；快照也在其中获取，避免覆盖掉并发追加的条目"""
+        with self._lock:
+            lines = [json.dumps([fp, item], ensure_ascii=False, default=str) for fp, item in self._items.items()]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+        os.replace(tmp_path, self.path)
+        self._log_lines = len(lines)
+
+
+# 进程级共享实例
+news_store = NewsStore()
@@ -2,7 +2,7 @@ import pandas as pd
 import numpy as np
 import os
 from typing import Dict, List, Any
-from tools.real_time_tool import get_stock_price
+from tools.real_time_tool import get_stock_prices
 from utils.error_handlers import tool_error_handler
 
 @tool_error_handler
@@ -21,33 +21,36 @@ def analyze_portfolio(holdings: Dict[str, float]):
     portfolio_data = []
     total_current_value = 0
     
-    # Fetch historical data and current price
-    prices_df = pd.DataFrame()
+    # Fetch historical data and current price for all holdings in one batched call
+    panel, fundamentals_map = get_stock_prices(list(holdings.keys()), columns=['Close'])
+    returns_map = {}
     
     for ticker, shares in holdings.items():
-        try:
-            hist, fundamentals = get_stock_price(ticker)
-            if hist.empty:
-                print(f"Warning: No data for {ticker}")
-                continue
-                
-            current_price = hist['Close'].iloc[-1]
-            stock_value = current_price * shares
-            total_current_value += stock_value
-            
-            # Align daily returns
-            returns = hist['Close'].pct_change().dropna()
-            prices_df[ticker] = returns
+        if ticker not in fundamentals_map:
+            print(f"Warning: No data for {ticker}")
+            continue
+        
+        close = panel[ticker]['Close'].dropna()
+        if close.empty:
+            print(f"Warning: No data for {ticker}")
+            continue
             
-            portfolio_data.append({
-                "ticker": ticker,
-                "name": fundamentals.get("name", ticker),
-                "shares": shares,
-                "price": round(float(current_price), 2),
-                "value": round(float(stock_value), 2)
-            })
-        except Exception as e:
-            print(f"Error fetching {ticker}: {e}")
+        current_price = close.iloc[-1]
+        stock_value = current_price * shares
+        total_current_value += stock_value
+        
+        # Align daily returns
+        returns_map[ticker] = close.pct_change().dropna()
+        
+        portfolio_data.append({
+            "ticker": ticker,
+            "name": fundamentals_map[ticker].get("name", ticker),
+            "shares": shares,
+            "price": round(float(current_price), 2),
+            "value": round(float(stock_value), 2)
+        })
+    
+    prices_df = pd.DataFrame(returns_map)
             
     if prices_df.empty:
         return "Error: Could not retrieve historical data for portfolio analysis."
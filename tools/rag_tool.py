@@ -1,16 +1,17 @@
 import os
 import json
-from pypdf import PdfReader
-import chromadb
-from chromadb.utils import embedding_functions
+import threading
+
+from utils.tracing import tracer
 
 # 路径配置
 DB_PATH = "./data_source/vector_db"
 DATA_PATH = "./data_source/rag_data"
 
-# 确保目录存在
-os.makedirs(DB_PATH, exist_ok=True)
-os.makedirs(DATA_PATH, exist_ok=True)
+def _ensure_dirs():
+    # 确保目录存在（首次使用时创建，导入模块时不触碰文件系统）
+    os.makedirs(DB_PATH, exist_ok=True)
+    os.makedirs(DATA_PATH, exist_ok=True)
 
 class SimpleTextSplitter:
     def __init__(self, chunk_size=1000, chunk_overlap=200):
@@ -28,14 +29,52 @@ class SimpleTextSplitter:
             start += self.chunk_size - self.chunk_overlap
         return chunks
 
+# 进程内复用的客户端、embedding 模型和 collection，避免每次查询重新加载
+_client = None
+_embedding_func = None
+_collection = None
+_lock = threading.Lock()
+# 导入数据耗时较长且内部会获取 _lock，单独用一把锁保证只有一个线程在导入
+_collection_lock = threading.Lock()
+
 def get_chroma_client():
-    return chromadb.PersistentClient(path=DB_PATH)
+    global _client
+    with _lock:
+        if _client is None:
+            import chromadb
+            _ensure_dirs()
+            _client = chromadb.PersistentClient(path=DB_PATH)
+        return _client
 
 def get_embedding_function():
-    # 使用 sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2
-    return embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-    )
+    global _embedding_func
+    with _lock:
+        if _embedding_func is None:
+            from chromadb.utils import embedding_functions
+            # 使用 sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2
+            _embedding_func = embedding_functions.SentenceTransformerEmbeddingFunction(
+                model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+            )
+        return _embedding_func
+
+def get_collection():
+    """返回已完成导入的 collection，首次调用时导入数据"""
+    global _collection
+    with _collection_lock:
+        if _collection is None:
+            collection = ingest_data()
+            if collection.count() == 0:
+                # 没有导入任何文档（rag_data 为空或解析失败）：不缓存，下次调用重新导入
+                return collection
+            _collection = collection
+        return _collection
+
+def warm_up():
+    """预加载向量库和 embedding 模型（常驻服务启动时调用），返回文档块数量"""
+    collection = get_collection()
+    # SentenceTransformer 在第一次编码时才真正加载模型
+    get_embedding_function()(["warm up"])
+    return collection.count()
 
 def ingest_data():
     client = get_chroma_client()
@@ -51,6 +90,7 @@ def ingest_data():
     if collection.count() > 0:
         return collection
 
+    from pypdf import PdfReader
     splitter = SimpleTextSplitter()
     
     for filename in os.listdir(DATA_PATH):
@@ -95,11 +135,14 @@ def query_financial_reports(query: str):
     Use this to find specific details from annual reports or research papers.
     """
     try:
-        collection = ingest_data()
-        results = collection.query(
-            query_texts=[query],
-            n_results=3
-        )
+        # 首次调用时的向量库/embedding 模型加载单独计时
+        with tracer.span("rag.load", "rag"):
+            collection = get_collection()
+        with tracer.span("rag.query", "rag"):
+            results = collection.query(
+                query_texts=[query],
+                n_results=3
+            )
         
         if not results['documents'] or not results['documents'][0]:
             return "No relevant information found in internal reports."
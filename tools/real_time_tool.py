@@ -1,29 +1,56 @@
 # -*- coding: utf-8 -*-
-import yfinance as yf
-import tushare as ts
-import akshare as ak
 import pandas as pd
 import os
 from dotenv import load_dotenv
 import datetime
+from concurrent.futures import ThreadPoolExecutor
+from tools.spot_snapshot import spot_snapshot
+from tools.symbol_master import canonicalize_ticker
+from tools.market_context import current_market_context
+from utils import lazy_imports
+from utils.single_flight import single_flight
+from utils.provider_router import ProviderRouter
+from tools.stock_cache import stock_cache, detect_market, delta_start, merge_history, MARKET_SESSIONS
 # 加载环境变量
 load_dotenv()
 
-# 初始化tushare
-# 从环境变量获取tushare token，如果没有则使用默认值
-TS_TOKEN = os.getenv("TS_TOKEN", "your_tushare_token_here")
-ts.set_token(TS_TOKEN)
+# tushare / yfinance / akshare 在第一次请求时才导入，token 和代理设置见 utils.lazy_imports
 
-proxy = 'http://127.0.0.1:7890' # 代理设置，此处修改
-os.environ['HTTP_PROXY'] = proxy
-os.environ['HTTPS_PROXY'] = proxy
+# 数据源路由：按数据源统计延迟和错误率并熔断，PROVIDER_HEDGE=1 时启用对冲请求
+provider_router = ProviderRouter(hedge=os.getenv("PROVIDER_HEDGE", "0") == "1")
 
-def get_tushare_stock_data(ticker: str):
-    """通过tushare获取国内股票数据"""
+# 返回给调用方的历史窗口（天），缓存中保留增量累积的全部数据
+HISTORY_DAYS = 365
+
+def _date_range(start_date: str = None, end_date: str = None):
+    """返回 (start_date, end_date)，格式为 YYYYMMDD，缺省为最近 HISTORY_DAYS 天"""
+    now = datetime.datetime.now()
+    end_date = end_date or now.strftime("%Y%m%d")
+    start_date = start_date or (now - datetime.timedelta(days=HISTORY_DAYS)).strftime("%Y%m%d")
+    return start_date, end_date
+
+def _format_tushare_daily(hist: pd.DataFrame) -> pd.DataFrame:
+    """将 tushare daily 数据转换为与yfinance类似的DataFrame格式"""
+    hist['trade_date'] = pd.to_datetime(hist['trade_date'])
+    hist = hist.set_index('trade_date')
+    hist = hist.sort_index()
+    
+    # 重命名列以匹配yfinance的格式
+    return hist.rename(columns={
+        'open': 'Open',
+        'high': 'High',
+        'low': 'Low',
+        'close': 'Close',
+        'vol': 'Volume'
+    })
+
+@single_flight
+def get_tushare_stock_data(ticker: str, start_date: str = None, end_date: str = None):
+    """通过tushare获取国内股票数据，start_date/end_date 为 YYYYMMDD，缺省为最近一年"""
     print(f"🔧 Tool: Fetching data from tushare for {ticker}...")
     
     # 创建tushare pro接口
-    pro = ts.pro_api()
+    pro = lazy_imports.tushare().pro_api()
     
     try:
         # 获取股票基本信息
@@ -32,30 +59,15 @@ def get_tushare_stock_data(ticker: str):
         if stock_basic.empty:
             raise ValueError(f"股票代码 {ticker} 不存在")
         
-        # 获取历史行情数据（最近一年）
-        # 计算一年前的日期
-        import datetime
-        end_date = datetime.datetime.now().strftime("%Y%m%d")
-        start_date = (datetime.datetime.now() - datetime.timedelta(days=365)).strftime("%Y%m%d")
+        # 获取历史行情数据（默认最近一年）
+        start_date, end_date = _date_range(start_date, end_date)
         
         hist = pro.daily(ts_code=ticker, start_date=start_date, end_date=end_date)
         
         if hist.empty:
             raise ValueError(f"无法获取股票 {ticker} 的历史数据")
         
-        # 转换为与yfinance类似的DataFrame格式
-        hist['trade_date'] = pd.to_datetime(hist['trade_date'])
-        hist = hist.set_index('trade_date')
-        hist = hist.sort_index()
-        
-        # 重命名列以匹配yfinance的格式
-        hist = hist.rename(columns={
-            'open': 'Open',
-            'high': 'High',
-            'low': 'Low',
-            'close': 'Close',
-            'vol': 'Volume'
-        })
+        hist = _format_tushare_daily(hist)
         
         # 获取基本面数据
         fundamentals = {
@@ -81,32 +93,125 @@ def get_tushare_stock_data(ticker: str):
         print(f"❌ Error fetching data from tushare: {e}")
         raise
 
-def get_yfinance_stock_data(ticker: str):
-    """通过yfinance获取国外股票数据"""
-    print(f"🔧 Tool: Fetching data from yfinance for {ticker}...")
-    stock = yf.Ticker(ticker)
+@single_flight
+def get_tushare_bulk_data(tickers: list, start_date: str = None, end_date: str = None) -> dict:
+    """
+    通过tushare批量获取多只带后缀A股的数据，ts_code 以逗号拼接。
+    返回 {ticker: (hist, fundamentals)}，没有数据的股票不在结果中。
+    """
+    print(f"🔧 Tool: Fetching bulk data from tushare for {tickers}...")
+    pro = lazy_imports.tushare().pro_api()
+    start_date, end_date = _date_range(start_date, end_date)
     
-    # 获取最近1年数据用于画图和分析
-    hist = stock.history(period="1y")
+    # pro.daily 单次最多返回 6000 行，按预计K线数量分批
+    days = (datetime.datetime.strptime(end_date, "%Y%m%d") - datetime.datetime.strptime(start_date, "%Y%m%d")).days
+    chunk_size = max(1, 5000 // (days * 5 // 7 + 1))
     
-    if hist.empty:
-        raise ValueError(f"无法获取股票 {ticker} 的历史数据")
+    frames = []
+    for i in range(0, len(tickers), chunk_size):
+        chunk = ",".join(tickers[i:i + chunk_size])
+        frames.append(pro.daily(ts_code=chunk, start_date=start_date, end_date=end_date))
+    daily = pd.concat(frames)
+    if daily.empty:
+        return {}
     
-    # 获取基本面
-    info = stock.info
-    fundamentals = {
+    # 股票名称与行业：一次获取全部上市股票
+    stock_basic = pro.stock_basic(exchange='', list_status='L', fields='ts_code,name,industry').set_index('ts_code')
+    try:
+        daily_basic = pro.daily_basic(ts_code=",".join(tickers), trade_date=end_date).set_index('ts_code')
+    except:
+        daily_basic = pd.DataFrame()
+    
+    results = {}
+    for ticker, hist in daily.groupby('ts_code'):
+        if ticker not in stock_basic.index:
+            continue
+        fundamentals = {
+            "name": stock_basic.at[ticker, 'name'],
+            "sector": stock_basic.at[ticker, 'industry'],
+            "pe_ratio": None,
+            "market_cap": None,
+            "forward_pe": None
+        }
+        if ticker in daily_basic.index:
+            fundamentals["pe_ratio"] = daily_basic.at[ticker, 'pe_ttm']
+            fundamentals["market_cap"] = daily_basic.at[ticker, 'circ_mv'] * 10000  # 转换为元
+        results[ticker] = (_format_tushare_daily(hist.copy()), fundamentals)
+    return results
+
+def _yfinance_range(start_date: str = None, end_date: str = None) -> dict:
+    """将 YYYYMMDD 日期范围转换为 yfinance 的参数"""
+    if start_date is None and end_date is None:
+        # 获取最近1年数据用于画图和分析
+        return {"period": "1y"}
+    start_date, end_date = _date_range(start_date, end_date)
+    # yfinance 的 end 不包含当天
+    end = datetime.datetime.strptime(end_date, "%Y%m%d") + datetime.timedelta(days=1)
+    return {"start": datetime.datetime.strptime(start_date, "%Y%m%d").strftime("%Y-%m-%d"),
+            "end": end.strftime("%Y-%m-%d")}
+
+def _yfinance_fundamentals(ticker: str) -> dict:
+    info = lazy_imports.yfinance().Ticker(ticker).info
+    return {
         "name": info.get("longName"),
         "sector": info.get("sector"),
         "pe_ratio": info.get("trailingPE"),
         "market_cap": info.get("marketCap"),
         "forward_pe": info.get("forwardPE")
     }
+
+@single_flight
+def get_yfinance_stock_data(ticker: str, start_date: str = None, end_date: str = None):
+    """通过yfinance获取国外股票数据，start_date/end_date 为 YYYYMMDD，缺省为最近一年"""
+    print(f"🔧 Tool: Fetching data from yfinance for {ticker}...")
+    stock = lazy_imports.yfinance().Ticker(ticker)
+    
+    hist = stock.history(**_yfinance_range(start_date, end_date))
+    
+    if hist.empty:
+        raise ValueError(f"无法获取股票 {ticker} 的历史数据")
+    
+    # 获取基本面
+    fundamentals = _yfinance_fundamentals(ticker)
     
     return hist, fundamentals
 
-def get_akshare_stock_data(ticker: str):
-    """通过akshare获取国内股票数据，作为tushare的备用"""
+@single_flight
+def get_yfinance_bulk_data(tickers: list, start_date: str = None, end_date: str = None) -> dict:
+    """
+    通过 yf.download 一次下载多只股票的历史数据，基本面并发获取。
+    同一批次的股票应属于同一时区（调用方按市场分组）。
+    返回 {ticker: (hist, fundamentals)}，没有数据的股票不在结果中。
+    """
+    print(f"🔧 Tool: Fetching bulk data from yfinance for {tickers}...")
+    data = lazy_imports.yfinance().download(tickers, group_by='ticker', actions=True, auto_adjust=True, ignore_tz=False,
+                       progress=False, threads=True, **_yfinance_range(start_date, end_date))
+    
+    histories = {}
+    for ticker in tickers:
+        if ticker not in data.columns.get_level_values(0):
+            continue
+        hist = data[ticker].dropna(how='all')
+        if not hist.empty:
+            histories[ticker] = hist
+    
+    def safe_fundamentals(ticker):
+        try:
+            return _yfinance_fundamentals(ticker)
+        except Exception as e:
+            print(f"⚠️  无法获取 {ticker} 的基本面: {e}")
+            return None
+    
+    with ThreadPoolExecutor(max_workers=min(8, len(histories) or 1)) as executor:
+        infos = dict(zip(histories, executor.map(safe_fundamentals, histories)))
+    # 基本面获取失败的股票交由调用方单独重试
+    return {ticker: (hist, infos[ticker]) for ticker, hist in histories.items() if infos[ticker] is not None}
+
+@single_flight
+def get_akshare_stock_data(ticker: str, start_date: str = None, end_date: str = None):
+    """通过akshare获取国内股票数据，作为tushare的备用，start_date/end_date 为 YYYYMMDD，缺省为最近一年"""
     print(f"🔧 Tool: Fetching data from akshare for {ticker}...")
+    ak = lazy_imports.akshare()
     
     # 转换股票代码格式：000001.SZ -> 000001
     # akshare使用的是纯数字代码
@@ -121,33 +226,8 @@ def get_akshare_stock_data(ticker: str):
         "forward_pe": None
     }
     
-    # 获取实时行情数据，包含股票名称、市盈率和市值
-    try:
-        # 获取所有A股的实时行情
-        all_stocks = ak.stock_zh_a_spot_em()
-        
-        # 根据股票代码筛选
-        stock_spot = all_stocks[all_stocks['代码'] == stock_code]
-        
-        # 从实时行情中获取股票信息
-        if not stock_spot.empty:
-            # 股票名称
-            if '名称' in stock_spot.columns:
-                fundamentals["name"] = stock_spot['名称'].iloc[0]
-            
-            # 市盈率（TTM）
-            if '市盈率-动态' in stock_spot.columns:
-                pe_value = stock_spot['市盈率-动态'].iloc[0]
-                if pe_value != '-':
-                    fundamentals["pe_ratio"] = float(pe_value)
-            
-            # 市值（亿元），转换为元
-            if '总市值' in stock_spot.columns:
-                market_cap_value = stock_spot['总市值'].iloc[0]
-                if market_cap_value != '-':
-                    fundamentals["market_cap"] = float(market_cap_value) * 1e8
-    except Exception as e:
-        print(f"⚠️  无法获取实时行情数据: {e}")
+    # 从共享的全市场行情快照中获取股票名称、市盈率和市值
+    fundamentals.update(spot_snapshot.get_fundamentals(stock_code))
     
     # 使用其他函数获取行业信息
     if fundamentals["sector"] == "未知":
@@ -180,9 +260,8 @@ def get_akshare_stock_data(ticker: str):
     
     # 获取历史行情数据
     try:
-        # 设置日期范围为最近一年
-        end_date = datetime.datetime.now().strftime("%Y%m%d")
-        start_date = (datetime.datetime.now() - datetime.timedelta(days=365)).strftime("%Y%m%d")
+        # 日期范围默认为最近一年
+        start_date, end_date = _date_range(start_date, end_date)
         
         # 使用stock_zh_a_hist函数获取历史数据
         hist = ak.stock_zh_a_hist(
@@ -235,58 +314,245 @@ def get_akshare_stock_data(ticker: str):
     
     return create_empty_hist(), fundamentals
 
-def get_stock_price(ticker: str, market: str = None):
+def _fetch_from_providers(ticker: str, market: str = None, start_date: str = None, end_date: str = None):
+    """按市场选择数据源获取数据，返回 (hist, fundamentals, provider)"""
+    # Detect market type roughly
+    is_a_share = any(ticker.endswith(suffix) for suffix in ['.SH', '.SZ', '.BJ']) or (ticker.isdigit() and len(ticker) == 6)
+    
+    # 根据市场参数或股票代码判断（代码已经过 symbol master 规范化，A股总是带交易所后缀）
+    if market == 'cn' or (market is None and is_a_share):
+        candidates = [("tushare", get_tushare_stock_data), ("akshare", get_akshare_stock_data)]
+    else:
+        candidates = [("yfinance", get_yfinance_stock_data)]
+    
+    # akshare 失败时返回全 0 的占位数据，视为失败
+    (hist, fundamentals), provider = provider_router.call(
+        candidates, ticker, start_date, end_date, is_valid=lambda result: _has_prices(result[0]))
+    return hist, fundamentals, provider
+
+def _has_prices(hist: pd.DataFrame) -> bool:
+    # akshare 失败时返回全 0 的占位数据
+    return not hist.empty and (hist['Close'] != 0).any()
+
+def _window(hist: pd.DataFrame, columns: list = None) -> pd.DataFrame:
+    """截取最近 HISTORY_DAYS 天，并只保留需要的列"""
+    if columns is not None:
+        hist = hist[list(columns)]
+    if hist.empty:
+        return hist
+    return hist[hist.index >= hist.index[-1] - pd.Timedelta(days=HISTORY_DAYS)]
+
+def _store_fetched(ticker: str, market: str, cached_entry: dict, start_date: str, fetched: tuple, columns: list = None):
+    """
+    将数据源返回的 (hist, fundamentals, provider) 与缓存合并并写回，返回 (hist, fundamentals)。
+    start_date 不为 None 表示 fetched 只包含该日期之后的增量数据。
+    """
+    hist, fundamentals, provider = fetched
+    append_from = None
+    if start_date is not None and _has_prices(hist):
+        merged = None
+        if provider == cached_entry.get("provider"):
+            merged = merge_history(cached_entry["hist"], hist)
+        if merged is None:
+            # 复权价格发生调整（如分红）或数据源切换，增量数据无法拼接
+            print(f"🔄 缓存与数据源不一致，全量重新获取 {ticker}")
+            hist, fundamentals, provider = _fetch_from_providers(ticker, market)
+        else:
+            print(f"📈 Incremental update for {ticker} since {start_date}")
+            hist = merged
+            append_from = start_date
+    elif start_date is not None:
+        print(f"⚠️  未获取到增量数据，使用过期缓存 {ticker}")
+        return _window(cached_entry["hist"], columns), dict(cached_entry["fundamentals"])
+        
+    # Save to local cache
+    if _has_prices(hist):
+        stock_cache.put(ticker, hist, fundamentals, provider=provider, append_from=append_from)
+            
+    return _window(hist, columns), fundamentals
+
+def get_stock_price(ticker: str, market: str = None, use_cache: bool = True, columns: list = None):
     """获取股票实时价格和简要基本面
     
     Args:
-        ticker: 股票代码
+        ticker: 股票代码，支持无后缀代码、带后缀代码、港股代码或中文公司名
         market: 市场标识，可选值为 'cn'（中国市场）或 'us'（美国市场）
                 如果不指定，将根据股票代码自动判断
+        use_cache: 是否读取本地缓存，为 False 时强制从数据源全量获取（结果仍会写入缓存）
+        columns: 只返回指定的行情列，例如 ['Close']；命中缓存时只从磁盘读取这些列
+    
+    在请求级行情上下文（见 tools.market_context）中调用时，同一只股票在整个请求内只加载一次。
     """
+    ticker = canonicalize_ticker(ticker, market)
+    context = current_market_context()
+    if context is None or not use_cache:
+        return _load_stock_price(ticker, market, use_cache, columns)
+    
+    entry = context.peek(ticker)
+    if entry is not None:
+        print(f"⚡ Request context hit for {ticker}")
+    else:
+        # 上下文中保存全部列，供之后需要不同列的工具复用
+        entry = context.get_or_load(ticker, lambda: _load_stock_price(ticker, market, True))
+    hist, fundamentals = entry
+    return _window(hist, columns), dict(fundamentals)
+
+def _load_stock_price(ticker: str, market: str = None, use_cache: bool = True, columns: list = None):
+    """get_stock_price 的实现，ticker 已规范化"""
     print(f"🔧 Tool: Fetching data for {ticker}...")
     
-    # Create cache directory
-    cache_dir = "data_source/stock_cache"
-    os.makedirs(cache_dir, exist_ok=True)
+    cache_market = market if market in MARKET_SESSIONS else detect_market(ticker)
+    cached_entry = None
+    if use_cache:
+        cached = stock_cache.get(ticker, cache_market, columns=columns)
+        if cached is not None:
+            print(f"⚡ Cache hit for {ticker}")
+            hist, fundamentals = cached
+            return _window(hist), fundamentals
+        cached_entry = stock_cache.peek(ticker)
+    else:
+        stock_cache.record_bypass()
     
-    result = None
-    # Detect market type roughly
-    is_a_share = any(ticker.endswith(suffix) for suffix in ['.SH', '.SZ', '.BJ']) or (ticker.isdigit() and len(ticker) == 6)
+    # 缓存过期时只请求最后一根 K 线之后的增量数据
+    start_date = delta_start(cached_entry["hist"]) if cached_entry else None
+    try:
+        fetched = _fetch_from_providers(ticker, market, start_date=start_date)
+    except Exception as e:
+        if cached_entry is None:
+            raise
+        print(f"⚠️  数据源获取失败，使用过期缓存: {e}")
+        return _window(cached_entry["hist"], columns), dict(cached_entry["fundamentals"])
     
-    # 根据市场参数或股票代码判断
-    if market == 'cn' or (market is None and is_a_share):
-        # For A-shares, if suffix is missing, try to add it or use Akshare directly
-        if not any(ticker.endswith(suffix) for suffix in ['.SH', '.SZ', '.BJ']) and ticker.isdigit() and len(ticker) == 6:
-            # 6-digit without suffix
-            try:
-                # Try Tushare with .SH first, then .SZ
-                try:
-                    result = get_tushare_stock_data(f"{ticker}.SH")
-                except:
-                    result = get_tushare_stock_data(f"{ticker}.SZ")
-            except:
-                print(f"🔄 Tushare suffix prediction failed, using Akshare for {ticker}")
-                result = get_akshare_stock_data(ticker)
+    return _store_fetched(ticker, market, cached_entry, start_date, fetched, columns)
+
+def _fetch_bulk(provider: str, tickers: list, cached_entries: dict, columns: list = None) -> dict:
+    """
+    使用数据源的批量接口获取一组股票，返回 {ticker: (hist, fundamentals)}。
+    所有股票都有缓存时只请求增量区间（取最早的起始日期）。
+    """
+    starts = [delta_start(cached_entries[t]["hist"]) if cached_entries.get(t) else None for t in tickers]
+    start_date = None if None in starts else min(starts)
+    
+    bulk_fetch = get_tushare_bulk_data if provider == "tushare" else get_yfinance_bulk_data
+    fetched, _ = provider_router.call([(provider, bulk_fetch)], tickers, start_date=start_date)
+    
+    results = {}
+    for ticker, (hist, fundamentals) in fetched.items():
+        try:
+            results[ticker] = _store_fetched(ticker, None, cached_entries.get(ticker), start_date,
+                                             (hist, fundamentals, provider), columns)
+        except Exception as e:
+            print(f"Error fetching {ticker}: {e}")
+    return results
+
+def get_stock_prices(tickers: list, use_cache: bool = True, columns: list = None, max_workers: int = 8):
+    """批量获取多只股票的行情和基本面
+    
+    先查询缓存；未命中的股票按市场分组，带后缀的A股使用 tushare 逗号拼接的 ts_code 批量请求，
+    美股/港股使用 yf.download 批量下载，其余股票（如无后缀代码）以及批量接口未返回的股票并发单独获取。
+    各组并发执行，总耗时取决于最慢的数据源而不是股票数量。
+    
+    Args:
+        tickers: 股票代码列表
+        use_cache: 是否读取本地缓存
+        columns: 只返回指定的行情列，例如 ['Close']
+        max_workers: 并发线程数
+    
+    Returns:
+        (panel, fundamentals)：panel 为按日期对齐的 DataFrame，列为 (ticker, 字段) 的 MultiIndex；
+        fundamentals 为 {ticker: dict}，均以调用方传入的代码为键。获取失败的股票不在结果中。
+    """
+    requested = list(dict.fromkeys(tickers))
+    canonical = {t: canonicalize_ticker(t) for t in requested}
+    tickers = list(dict.fromkeys(canonical.values()))
+    print(f"🔧 Tool: Fetching data for {tickers}...")
+    
+    results = {}
+    cached_entries = {}
+    groups = {"tushare": [], "yfinance_us": [], "yfinance_hk": [], "single": []}
+    # 在请求级行情上下文中读取全部列，加载结果写回上下文
+    context = current_market_context() if use_cache else None
+    fetch_columns = None if context is not None else columns
+    for ticker in tickers:
+        market = detect_market(ticker)
+        if context is not None:
+            entry = context.peek(ticker)
+            if entry is not None:
+                results[ticker] = entry
+                continue
+        if use_cache:
+            cached = stock_cache.get(ticker, market, columns=fetch_columns)
+            if cached is not None:
+                hist, fundamentals = cached
+                results[ticker] = (_window(hist), fundamentals)
+                continue
+            cached_entries[ticker] = stock_cache.peek(ticker)
+        
+        if market == "cn":
+            groups["tushare" if "." in ticker else "single"].append(ticker)
         else:
+            groups[f"yfinance_{market}"].append(ticker)
+    
+    def fetch_single(ticker):
+        try:
+            return ticker, get_stock_price(ticker, use_cache=use_cache, columns=fetch_columns)
+        except Exception as e:
+            print(f"Error fetching {ticker}: {e}")
+            return ticker, None
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        single_futures = [executor.submit(fetch_single, t) for t in groups["single"]]
+        bulk_futures = {}
+        for group, group_tickers in groups.items():
+            if group == "single" or not group_tickers:
+                continue
+            provider = "tushare" if group == "tushare" else "yfinance"
+            # 只有一只股票时直接走单只股票的路径
+            if len(group_tickers) == 1:
+                single_futures.append(executor.submit(fetch_single, group_tickers[0]))
+                continue
+            if not use_cache:
+                for _ in group_tickers:
+                    stock_cache.record_bypass()
+            future = executor.submit(_fetch_bulk, provider, group_tickers, cached_entries, fetch_columns)
+            bulk_futures[future] = group_tickers
+        
+        for future, group_tickers in bulk_futures.items():
             try:
-                result = get_tushare_stock_data(ticker)
+                results.update(future.result())
             except Exception as e:
-                print(f"🔄 Tushare获取失败，尝试使用Akshare: {e}")
-                result = get_akshare_stock_data(ticker)
-    elif market == 'us' or (market is None and not is_a_share):
-        result = get_yfinance_stock_data(ticker)
-    else:
-        result = get_yfinance_stock_data(ticker)
+                print(f"⚠️  批量获取失败，改为逐个获取: {e}")
+            # 批量接口未返回的股票单独获取
+            single_futures.extend(executor.submit(fetch_single, t) for t in group_tickers if t not in results)
         
-    # Save to local cache
-    if result:
-        hist, fundamentals = result
-        if not hist.empty:
-            cache_path = os.path.join(cache_dir, f"{ticker}.csv")
-            hist.to_csv(cache_path)
-            print(f"💾 Data cached to {cache_path}")
-            
-    return result
+        for future in single_futures:
+            ticker, result = future.result()
+            if result is not None:
+                results[ticker] = result
+    
+    if context is not None:
+        for symbol, entry in results.items():
+            context.store(symbol, entry)
+    
+    histories = {}
+    fundamentals = {}
+    for ticker in requested:
+        symbol = canonical[ticker]
+        if symbol not in results or results[symbol][0].empty:
+            continue
+        hist, info = results[symbol]
+        if context is not None:
+            hist = _window(hist, columns)
+        fundamentals[ticker] = dict(info)
+        hist = hist.copy()
+        # 不同市场的时区不同，按当地交易日对齐
+        if getattr(hist.index, "tz", None) is not None:
+            hist.index = hist.index.tz_localize(None)
+        hist.index = hist.index.normalize()
+        histories[ticker] = hist
+    
+    panel = pd.concat(histories, axis=1).sort_index() if histories else pd.DataFrame()
+    return panel, fundamentals
 
 if __name__ == "__main__":
     # 测试用例
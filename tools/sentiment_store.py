@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+单条新闻情绪评分的本地缓存
+
+analyze_sentiment 每次拿到的前 10 条新闻大多已经分析过。每条新闻按 标题/发布时间/来源 计算指纹，
+评分结果按股票保存在 {store_dir}/{key}.json，整体情绪由各条新闻的缓存评分重新汇总，
+只有新出现的新闻才需要请求 LLM。
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import List, Dict
+
+SENTIMENT_STORE_DIR = os.getenv("SENTIMENT_STORE_DIR", "data_source/sentiment_scores")
+# 每只股票最多保留的新闻评分条数，超出时淘汰最早评分的
+MAX_ITEMS_PER_TICKER = int(os.getenv("SENTIMENT_STORE_MAX_ITEMS", "500"))
+
+LABELS = ("positive", "neutral", "negative")
+
+
+def article_fingerprint(item: dict) -> str:
+    """新闻指纹：标题 + 发布时间 + 来源"""
+    raw = "|".join(str(item.get(field) or "").strip() for field in ("title", "publish_time", "source"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def label_for(score: float) -> str:
+    if score > 0.2:
+        return "positive"
+    if score < -0.2:
+        return "negative"
+    return "neutral"
+
+
+def aggregate_scores(ticker: str, news_items: List[dict], scores: List[dict]) -> dict:
+    """由各条新闻的评分汇总出 analyze_sentiment 的返回结构"""
+    total = len(scores)
+    sentiment_score = round(sum(s["score"] for s in scores) / total, 3)
+    counts = {label: sum(1 for s in scores if s["label"] == label) for label in LABELS}
+    distribution = {label: round(count / total, 3) for label, count in counts.items()}
+
+    # 影响最大的非中性新闻作为主要驱动因素
+    ranked = sorted((s for s in scores if s["label"] != "neutral" and s.get("driver")),
+                    key=lambda s: abs(s["score"]), reverse=True)
+    key_drivers = []
+    for s in ranked:
+        if s["driver"] not in key_drivers:
+            key_drivers.append(s["driver"])
+        if len(key_drivers) >= 5:
+            break
+
+    summary = f"近期 {total} 条新闻中正面 {counts['positive']} 条、中性 {counts['neutral']} 条、负面 {counts['negative']} 条"
+    if key_drivers:
+        summary += "，主要因素：" + "；".join(key_drivers[:3])
+    return {
+        "ticker": ticker,
+        "sentiment_score": sentiment_score,
+        "sentiment_distribution": distribution,
+        "key_drivers": key_drivers,
+        "summary_analysis": summary + "。",
+        "news_analysis": {
+            "total_news_analyzed": total,
+            "top_news": news_items[:3]
+        }
+    }
+
+
+class SentimentStore:
+    """{股票: {新闻指纹: 评分}}，按股票懒加载并持久化为 JSON，线程安全"""
+
+    def __init__(self, store_dir: str = SENTIMENT_STORE_DIR, max_items: int = MAX_ITEMS_PER_TICKER):
+        self.store_dir = store_dir
+        self.max_items = max_items
+        self._scores = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.store_dir, f"{key}.json")
+
+    def _load(self, key: str) -> Dict[str, dict]:
+        """调用方需持有 self._lock"""
+        if key not in self._scores:
+            scores = {}
+            if self.store_dir and os.path.exists(self._path(key)):
+                try:
+                    with open(self._path(key), "r", encoding="utf-8") as f:
+                        scores = json.load(f)
+                except Exception as e:
+                    print(f"⚠️  读取新闻评分缓存失败 {self._path(key)}: {e}")
+            self._scores[key] = scores
+        return self._scores[key]
+
+    def get_many(self, key: str, fingerprints: List[str]) -> Dict[str, dict]:
+        """返回已评分的新闻 {指纹: 评分}"""
+        with self._lock:
+            scores = self._load(key)
+            found = {fp: scores[fp] for fp in fingerprints if fp in scores}
+            self._stats["hits"] += len(found)
+            self._stats["misses"] += len(fingerprints) - len(found)
+        return found
+
+    def put_many(self, key: str, new_scores: Dict[str, dict]):
+        if not new_scores:
+            return
+        now = time.time()
+        with self._lock:
+            scores = self._load(key)
+            for fp, score in new_scores.items():
+                scores[fp] = dict(score, scored_at=now)
+            if len(scores) > self.max_items:
+                newest = sorted(scores.items(), key=lambda kv: kv[1].get("scored_at", 0), reverse=True)
+                scores = dict(newest[:self.max_items])
+                self._scores[key] = scores
+            if self.store_dir:
+                os.makedirs(self.store_dir, exist_ok=True)
+                tmp_path = self._path(key) + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(scores, f, ensure_ascii=False)
+                os.replace(tmp_path, self._path(key))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(self._stats, tickers=len(self._scores),
+                        hit_rate=round(self._stats["hits"] / lookups, 4) if lookups else 0.0)
+
+
+# 进程级共享实例
+sentiment_store = SentimentStore()
@@ -1,169 +1,277 @@
 # -*- coding: utf-8 -*-
 from utils.error_handlers import tool_error_handler
+from utils.single_flight import single_flight_group
+from utils.tool_cache import ToolResultCache
+from utils.llm_gateway import llm_gateway
+from tools.sentiment_store import sentiment_store, article_fingerprint, aggregate_scores, label_for
+from tools.local_sentiment import get_local_scorer
+from tools.news_store import news_store, news_key
 import os
-import akshare as ak
-import yfinance as yf
-from openai import OpenAI
 import json
-import datetime
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# Proxy settings (consistent with other tools)
-proxy = 'http://127.0.0.1:7890'
-os.environ['HTTP_PROXY'] = proxy
-os.environ['HTTPS_PROXY'] = proxy
+# 新闻缓存有效期（秒），预取和后续的情绪分析共享同一份新闻
+NEWS_TTL = int(os.getenv("NEWS_CACHE_TTL", "300"))
+news_cache = ToolResultCache(max_size=256, cache_dir="")
+# 批量情绪分析：并发获取新闻的线程数，以及单个 LLM 请求中新闻内容的最大字符数
+NEWS_FETCH_WORKERS = int(os.getenv("NEWS_FETCH_WORKERS", "8"))
+SENTIMENT_BATCH_MAX_CHARS = int(os.getenv("SENTIMENT_BATCH_MAX_CHARS", "24000"))
+# 评分方式：llm 每条新闻都由 LLM 评分；local 先用本地 embedding 模型评分，只有低置信度的新闻交给 LLM
+SENTIMENT_MODE = os.getenv("SENTIMENT_MODE", "llm")
+
+def _download_news(ticker: str) -> list:
+    """刷新本地新闻库中该股票的个股新闻，再按代码/公司名称从索引中取最新10条"""
+    news_store.refresh_ticker(ticker)
+    return news_store.lookup(ticker, limit=10)
+
+def fetch_news(ticker: str) -> list:
+    """获取新闻，NEWS_TTL 秒内重复请求直接返回缓存；并发的相同请求只下载一次"""
+    key = news_key(ticker)
+    hit, news_items = news_cache.get(key)
+    if hit:
+        return news_items
+    news_items = single_flight_group.do(("news", key), _download_news, ticker)
+    # 空结果可能是数据源临时失败，不缓存
+    if news_items:
+        news_cache.put(key, news_items, NEWS_TTL)
+    return news_items
+
+def _parse_json(content: str):
+    """解析模型输出的 JSON（处理 ```json 代码块）"""
+    content = content.strip()
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0].strip()
+    elif "```" in content:
+        content = content.split("```")[1].strip()
+    return json.loads(content)
+
+SCORE_PROMPT = """You are a financial sentiment analyst. Score each of the following news items for a specific stock separately.
+    
+    Output a JSON object {"items": [...]} with one entry per news item:
+    - id (the id of the news item)
+    - score (float -1.0 to 1.0, where >0 is positive, <0 is negative)
+    - driver (the factor behind the score in a short phrase, in Chinese)
+    
+    Focus on the impact on the stock price in the short to medium term.
+    """
+
+BATCH_SCORE_PROMPT = """You are a financial sentiment analyst. The input maps several stock tickers to their latest news items.
+    Score each news item separately for the stock it is listed under.
+    
+    Output a JSON object {"items": [...]} with one entry per news item:
+    - ticker (the stock the news item is listed under)
+    - id (the id of the news item)
+    - score (float -1.0 to 1.0, where >0 is positive, <0 is negative)
+    - driver (the factor behind the score in a short phrase, in Chinese)
+    
+    Focus on the impact on the stock price in the short to medium term.
+    """
+
+def _chat_json(system_prompt: str, user_prompt: str):
+    """请求 LLM 并解析返回的 JSON"""
+    response = llm_gateway.chat(
+        [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=0
+    )
+    return _parse_json(response.choices[0].message.content)
+
+def _item_score(entry: dict) -> dict:
+    score = max(-1.0, min(1.0, float(entry["score"])))
+    return {"score": score, "label": label_for(score), "driver": entry.get("driver", ""), "source": "llm"}
+
+def _ordered_scores(by_id: dict, count: int, name: str) -> list:
+    missing = [i for i in range(count) if i not in by_id]
+    if missing:
+        raise ValueError(f"LLM did not score news items {missing} of {name}")
+    return [by_id[i] for i in range(count)]
+
+def _score_articles(stock_name: str, news_items: list) -> list:
+    """请求 LLM 为每条新闻单独评分，按输入顺序返回 [{"score", "label", "driver"}]"""
+    indexed = [dict(item, id=i) for i, item in enumerate(news_items)]
+    news_text = json.dumps(indexed, ensure_ascii=False, indent=2)
+    user_prompt = f"Stock: {stock_name}\n\nNews Items:\n{news_text}"
+
+    by_id = {}
+    for entry in _chat_json(SCORE_PROMPT, user_prompt).get("items", []):
+        try:
+            by_id[int(entry["id"])] = _item_score(entry)
+        except (KeyError, TypeError, ValueError):
+            continue
+    return _ordered_scores(by_id, len(news_items), stock_name)
+
+def _score_article_batch(groups: dict) -> dict:
+    """一次请求为多只股票的新闻评分：{ticker: [新闻]} -> {ticker: [评分]}，缺任何一条都视为失败"""
+    payload = {ticker: [dict(item, id=i) for i, item in enumerate(items)] for ticker, items in groups.items()}
+    user_prompt = "News Items by Stock:\n" + json.dumps(payload, ensure_ascii=False, indent=2)
+
+    by_ticker = {ticker: {} for ticker in groups}
+    for entry in _chat_json(BATCH_SCORE_PROMPT, user_prompt).get("items", []):
+        try:
+            by_ticker[str(entry["ticker"])][int(entry["id"])] = _item_score(entry)
+        except (KeyError, TypeError, ValueError):
+            continue
+    return {ticker: _ordered_scores(by_ticker[ticker], len(items), ticker) for ticker, items in groups.items()}
+
+def _pack_groups(groups: dict, max_chars: int) -> list:
+    """把 {ticker: [新闻]} 按序列化长度装入尽量少的请求，单只股票不拆分"""
+    packs, current, size = [], {}, 0
+    for ticker, items in groups.items():
+        length = len(json.dumps(items, ensure_ascii=False))
+        if current and size + length > max_chars:
+            packs.append(current)
+            current, size = {}, 0
+        current[ticker] = items
+        size += length
+    if current:
+        packs.append(current)
+    return packs
+
+def _local_prepass(ticker: str, new_items: dict, scores: dict) -> dict:
+    """本地模型为新新闻评分，置信度足够的直接采用并缓存，返回仍需 LLM 评分的新闻"""
+    try:
+        scorer = get_local_scorer()
+        local_scores = scorer.score(list(new_items.values()))
+    except Exception as e:
+        print(f"⚠️  本地情绪模型不可用，使用 LLM 评分: {e}")
+        return new_items
+    accepted = {fp: score for fp, score in zip(new_items, local_scores) if scorer.confident(score)}
+    sentiment_store.put_many(news_key(ticker), accepted)
+    scores.update(accepted)
+    return {fp: item for fp, item in new_items.items() if fp not in accepted}
+
+def _pending_articles(ticker: str, mode: str = None, summary: bool = None):
+    """
+    返回 (新闻, 指纹, 已有的评分, 需要 LLM 评分的新闻 {指纹: 新闻}, 本地评分的条数)。
+    需要摘要和驱动因素 (summary) 时，只有本地评分、没有驱动因素的新闻也交给 LLM。
+    """
+    mode = mode or SENTIMENT_MODE
+    if summary is None:
+        summary = mode != "local"
+    news_items = fetch_news(ticker)
+    fingerprints = [article_fingerprint(item) for item in news_items]
+    scores = sentiment_store.get_many(news_key(ticker), fingerprints)
+    new_items = {fp: item for fp, item in zip(fingerprints, news_items)
+                 if fp not in scores or (summary and scores[fp].get("source") == "local")}
+    local_count = 0
+    if mode == "local" and not summary and new_items:
+        remaining = _local_prepass(ticker, new_items, scores)
+        local_count = len(new_items) - len(remaining)
+        new_items = remaining
+    return news_items, fingerprints, scores, new_items, local_count
+
+def _no_news_result(ticker: str) -> dict:
+    return {
+        "ticker": ticker,
+        "sentiment_score": 0.5,
+        "sentiment_distribution": {"neutral": 1.0},
+        "news_analysis": {"total_news_analyzed": 0, "note": "No recent news found."}
+    }
+
+def _sentiment_result(ticker: str, news_items: list, fingerprints: list, scores: dict,
+                      newly_analyzed: int, local_count: int = 0) -> dict:
+    result = aggregate_scores(ticker, news_items, [scores[fp] for fp in fingerprints])
+    result["news_analysis"]["newly_analyzed"] = newly_analyzed
+    if local_count:
+        result["news_analysis"]["locally_scored"] = local_count
+    return result
 
 @tool_error_handler
-def analyze_sentiment(ticker: str):
+def analyze_sentiment(ticker: str, summary: bool = None, mode: str = None):
     """
     Analyzes market sentiment for a given stock ticker by fetching latest news 
     and using an LLM to evaluate sentiment.
     Supports A-shares (via AkShare) and US shares (via yfinance).
+    每条新闻的评分缓存在本地，只有没评过分的新闻才会请求 LLM。
+    mode="local"（或 SENTIMENT_MODE=local）时先用本地模型评分，低置信度或 summary=True 时才请求 LLM。
     """
     print(f"🔧 Tool: Analyzing sentiment for {ticker}...")
     
-    news_items = []
     stock_name = ticker
     
     # 1. Fetch News
     try:
-        # Detect market type roughly
-        is_a_share = any(ticker.endswith(suffix) for suffix in ['.SH', '.SZ', '.BJ']) or (ticker.isdigit() and len(ticker) == 6)
-        
-        if is_a_share:
-            # A-Share: AkShare
-            # Clean ticker for AkShare (e.g. 600519.SH -> 600519)
-            code = ticker.split('.')[0]
-            print(f"Fetching A-share news for {code}...")
-            
-            try:
-                # Primary source: EastMoney specific stock news
-                news_df = ak.stock_news_em(symbol=code)
-                # Take top 10 latest news
-                if not news_df.empty:
-                    recent_news = news_df.head(10)
-                    for _, row in recent_news.iterrows():
-                        news_items.append({
-                            "title": row.get('新闻标题', ''),
-                            "summary": (row.get('新闻内容', '') or '')[:200] + "...", 
-                            "publish_time": row.get('发布时间', ''),
-                            "source": row.get('文章来源', 'EastMoney')
-                        })
-            except Exception as e:
-                print(f"Warning: Primary news source failed ({e}). Trying fallback (Cailianshe)...")
-                # Fallback: Cailianshe Global Rolling News filtered by stock code/name
-                try:
-                    news_df = ak.stock_info_global_cls()
-                    mask = news_df['内容'].str.contains(code) | news_df['标题'].str.contains(code)
-                    filtered_news = news_df[mask]
-                    
-                    if not filtered_news.empty:
-                        for _, row in filtered_news.head(5).iterrows():
-                            news_items.append({
-                                "title": row.get('标题', ''),
-                                "summary": row.get('内容', '')[:200] + "...",
-                                "publish_time": f"{row.get('发布日期', '')} {row.get('发布时间', '')}",
-                                "source": "Cailianshe"
-                            })
-                except Exception as e2:
-                    print(f"Fallback source also failed: {e2}")
-        else:
-            # US Share: yfinance
-            print(f"Fetching US share news for {ticker}...")
-            stock = yf.Ticker(ticker)
-            news = stock.news
-            stock_name = ticker
-            
-            # Take top 10
-            for item in news[:10]:
-                news_items.append({
-                    "title": item.get('title', ''),
-                    "summary": item.get('publisher', '') + ": " + item.get('title', ''), # yf news often has no content body in simple call
-                    "publish_time": str(datetime.datetime.fromtimestamp(item.get('providerPublishTime', 0))) if item.get('providerPublishTime') else '',
-                    "source": item.get('publisher', 'Yahoo Finance')
-                })
-                
+        news_items, fingerprints, scores, new_items, local_count = _pending_articles(ticker, mode, summary)
     except Exception as e:
         return f"Error fetching news: {str(e)}"
 
     if not news_items:
-        return {
-            "ticker": ticker,
-            "sentiment_score": 0.5,
-            "sentiment_distribution": {"neutral": 1.0},
-            "news_analysis": {"total_news_analyzed": 0, "note": "No recent news found."}
-        }
-
-    # 2. Analyze with LLM
-    print(f"Analyzing {len(news_items)} news items with LLM...")
-    
-    # Load env vars
-    api_key = os.getenv("api_key")
-    api_base = os.getenv("api_base")
-    
-    if not api_key:
-        return "Error: api_key not found in .env"
-        
-    client = OpenAI(
-        api_key=api_key,
-        base_url=api_base
-    )
-    
-    news_text = json.dumps(news_items, ensure_ascii=False, indent=2)
-    
-    system_prompt = """You are a financial sentiment analyst. Analyze the following news items for a specific stock.
-    (Note: The user wants to use Chinese for the final report if the input is Chinese, but the component structure should be English keys)
-    
-    Output a JSON object with:
-    - sentiment_score (float -1.0 to 1.0, where >0 is positive, <0 is negative)
-    - sentiment_distribution (positive, neutral, negative probabilities summing to 1.0)
-    - summary_analysis (brief explanation of the driving factors, in Chinese)
-    - key_drivers (list of strings, max 5 items, in Chinese)
-    
-    Focus on the impact on the stock price in the short to medium term.
+        return _no_news_result(ticker)
+
+    # 2. Reuse cached per-article scores, analyze only new articles with LLM
+    if new_items:
+        print(f"Analyzing {len(new_items)}/{len(news_items)} new news items with LLM...")
+        try:
+            new_scores = dict(zip(new_items, _score_articles(stock_name, list(new_items.values()))))
+        except Exception as e:
+            return f"Error in LLM analysis: {str(e)}"
+        sentiment_store.put_many(news_key(ticker), new_scores)
+        scores.update(new_scores)
+    else:
+        print(f"All {len(news_items)} news items already scored, skipping LLM")
+
+    return _sentiment_result(ticker, news_items, fingerprints, scores, len(new_items), local_count)
+
+@tool_error_handler
+def analyze_sentiment_batch(tickers: list, summary: bool = None, mode: str = None):
     """
-    
-    user_prompt = f"Stock: {stock_name}\n\nNews Items:\n{news_text}"
-    
-    try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0
-        )
-        
-        # Parse output (handling potential code blocks)
-        content = response.choices[0].message.content.strip()
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0].strip()
-        elif "```" in content:
-            content = content.split("```")[1].strip()
-            
-        analysis_result = json.loads(content)
-        
-        # Combine with metadata
-        final_result = {
-            "ticker": ticker,
-            "sentiment_score": analysis_result.get("sentiment_score", 0),
-            "sentiment_distribution": analysis_result.get("sentiment_distribution", {}),
-            "key_drivers": analysis_result.get("key_drivers", []),
-            "summary_analysis": analysis_result.get("summary_analysis", ""),
-            "news_analysis": {
-                "total_news_analyzed": len(news_items),
-                "top_news": news_items[:3] # Return top 3 for context
-            }
-        }
-        
-        return final_result
-        
-    except Exception as e:
-        return f"Error in LLM analysis: {str(e)}"
+    Analyzes market sentiment for several tickers at once (e.g. a watchlist sweep).
+    并发获取各股票的新闻，把所有未评分的新闻装入尽量少的 LLM 请求（按 SENTIMENT_BATCH_MAX_CHARS 分批）；
+    某一批的结果无法解析时，这一批退回逐只股票请求。
+    summary / mode 与 analyze_sentiment 相同。返回 {ticker: analyze_sentiment 的结果或错误信息}。
+    """
+    tickers = list(dict.fromkeys(t.strip() for t in tickers if t and t.strip()))
+    print(f"🔧 Tool: Analyzing sentiment for {len(tickers)} tickers...")
+
+    # 1. Fetch news concurrently
+    pending, results = {}, {}
+    with ThreadPoolExecutor(max_workers=max(1, min(NEWS_FETCH_WORKERS, len(tickers))),
+                            thread_name_prefix="news") as executor:
+        futures = {ticker: executor.submit(_pending_articles, ticker, mode, summary) for ticker in tickers}
+        for ticker, future in futures.items():
+            try:
+                pending[ticker] = future.result()
+            except Exception as e:
+                results[ticker] = f"Error fetching news: {str(e)}"
+
+    # 2. Score unseen articles of all tickers in packed requests
+    groups = {ticker: list(p[3].values()) for ticker, p in pending.items() if p[3]}
+    new_scores = {}
+    packs = _pack_groups(groups, SENTIMENT_BATCH_MAX_CHARS)
+    if packs:
+        print(f"Analyzing {sum(len(items) for items in groups.values())} new news items "
+              f"of {len(groups)} tickers in {len(packs)} LLM request(s)...")
+    for pack in packs:
+        try:
+            new_scores.update(_score_article_batch(pack))
+            continue
+        except Exception as e:
+            print(f"⚠️  Batched sentiment request failed ({e}), falling back to per-ticker requests")
+        for ticker, items in pack.items():
+            try:
+                new_scores[ticker] = _score_articles(ticker, items)
+            except Exception as e:
+                results[ticker] = f"Error in LLM analysis: {str(e)}"
+
+    # 3. Aggregate per ticker
+    for ticker, (news_items, fingerprints, scores, new_items, local_count) in pending.items():
+        if ticker in results:
+            continue
+        if not news_items:
+            results[ticker] = _no_news_result(ticker)
+            continue
+        if new_items:
+            item_scores = dict(zip(new_items, new_scores[ticker]))
+            sentiment_store.put_many(news_key(ticker), item_scores)
+            scores.update(item_scores)
+        results[ticker] = _sentiment_result(ticker, news_items, fingerprints, scores, len(new_items), local_count)
+    return {ticker: results[ticker] for ticker in tickers}
 
 if __name__ == "__main__":
     # Test
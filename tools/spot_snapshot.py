@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+A股实时行情快照 (进程级共享)
+
+ak.stock_zh_a_spot_em() 一次返回全市场约 5000 只股票，每个 TTL 只下载一次，
+并按股票代码建立字典索引，供任意数量的股票查询名称、市盈率和市值。
+"""
+import os
+import math
+import time
+import threading
+
+from utils import lazy_imports
+
+# 快照有效期（秒），可通过环境变量覆盖
+SPOT_TTL = int(os.getenv("SPOT_SNAPSHOT_TTL", "300"))
+# 下载失败后的重试间隔（秒），避免每只股票都触发一次失败的全市场下载
+RETRY_DELAY = 30
+
+SPOT_COLUMNS = ['名称', '最新价', '市盈率-动态', '总市值']
+
+
+def _to_float(value):
+    if value is None or value == '-':
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+class SpotSnapshot:
+    """按代码索引的全市场行情快照，线程安全，同一时刻只有一个线程下载"""
+
+    def __init__(self, ttl: int = SPOT_TTL):
+        self.ttl = ttl
+        self._rows = {}
+        self._fetched_at = 0.0
+        self._failed_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh_if_needed(self):
+        now = time.time()
+        if now - self._fetched_at < self.ttl or now - self._failed_at < RETRY_DELAY:
+            return
+        with self._lock:
+            now = time.time()
+            if now - self._fetched_at < self.ttl or now - self._failed_at < RETRY_DELAY:
+                return
+            print("🔧 Tool: Refreshing A-share spot snapshot...")
+            try:
+                all_stocks = lazy_imports.akshare().stock_zh_a_spot_em()
+                columns = [c for c in SPOT_COLUMNS if c in all_stocks.columns]
+                rows = all_stocks.drop_duplicates('代码').set_index('代码')[columns].to_dict('index')
+            except Exception as e:
+                self._failed_at = now
+                print(f"⚠️  无法获取实时行情数据: {e}")
+                return
+            self._rows = rows
+            self._fetched_at = now
+
+    def get(self, code: str):
+        """返回代码对应的原始行情字段，未找到返回 None"""
+        self._refresh_if_needed()
+        return self._rows.get(code)
+
+    def get_fundamentals(self, code: str) -> dict:
+        """返回 name / pe_ratio / market_cap（元），缺失的字段不包含在结果中"""
+        row = self.get(code)
+        if row is None:
+            return {}
+        fundamentals = {}
+        if row.get('名称'):
+            fundamentals["name"] = row['名称']
+        pe_ratio = _to_float(row.get('市盈率-动态'))
+        if pe_ratio is not None:
+            fundamentals["pe_ratio"] = pe_ratio
+        # 市值（亿元），转换为元
+        market_cap = _to_float(row.get('总市值'))
+        if market_cap is not None:
+            fundamentals["market_cap"] = market_cap * 1e8
+        return fundamentals
+
+
+# 进程级共享快照
+spot_snapshot = SpotSnapshot()
@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+"""
+行情数据本地缓存 (read-through)
+
+get_stock_price 在访问 Tushare/AkShare/yfinance 之前先查询本缓存：
+- 盘中：缓存在 INTRADAY_TTL 秒内有效
+- 收盘后/休市：在收盘后抓取的数据一直有效，直到下一个交易时段开盘
+缓存分为进程内内存层和 data_source/stock_cache 下按年份分区的 Parquet 列式存储。
+缓存过期后只向数据源请求最后一根 K 线之后的增量数据，合并去重后写回。
+"""
+import os
+import re
+import json
+import time
+import datetime
+import threading
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.tracing import tracer
+
+CACHE_DIR = "data_source/stock_cache"
+
+# 旧版 CSV 缓存中带时区偏移的时间戳，如 2024-12-24 00:00:00-05:00
+_TZ_OFFSET = re.compile(r'[+-]\d{2}:\d{2}$')
+
+# 盘中缓存有效期（秒），可通过环境变量覆盖
+INTRADAY_TTL = int(os.getenv("STOCK_CACHE_INTRADAY_TTL", "300"))
+
+# 各市场交易时段（当地时间），不考虑节假日
+MARKET_SESSIONS = {
+    "cn": ("Asia/Shanghai", [((9, 30), (11, 30)), ((13, 0), (15, 0))]),
+    "hk": ("Asia/Hong_Kong", [((9, 30), (12, 0)), ((13, 0), (16, 0))]),
+    "us": ("America/New_York", [((9, 30), (16, 0))]),
+}
+
+
+def detect_market(ticker: str) -> str:
+    """根据股票代码粗略判断所属市场：'cn' / 'hk' / 'us'"""
+    if any(ticker.endswith(suffix) for suffix in ['.SH', '.SZ', '.BJ']) or (ticker.isdigit() and len(ticker) == 6):
+        return "cn"
+    if ticker.endswith(".HK"):
+        return "hk"
+    return "us"
+
+
+def _local_now(market: str, now: float = None) -> datetime.datetime:
+    tz_name, _ = MARKET_SESSIONS[market]
+    ts = time.time() if now is None else now
+    return datetime.datetime.fromtimestamp(ts, ZoneInfo(tz_name))
+
+
+def is_market_open(market: str, now: float = None) -> bool:
+    """判断市场当前是否处于交易时段"""
+    local = _local_now(market, now)
+    if local.weekday() >= 5:
+        return False
+    _, sessions = MARKET_SESSIONS[market]
+    minutes = local.hour * 60 + local.minute
+    return any(start[0] * 60 + start[1] <= minutes < end[0] * 60 + end[1] for start, end in sessions)
+
+
+def last_session_close(market: str, now: float = None) -> datetime.datetime:
+    """返回不晚于 now 的最近一次交易时段结束时间（含午间休市）"""
+    local = _local_now(market, now)
+    _, sessions = MARKET_SESSIONS[market]
+    for days_back in range(8):
+        day = local - datetime.timedelta(days=days_back)
+        if day.weekday() >= 5:
+            continue
+        for _, (hour, minute) in reversed(sessions):
+            close = day.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if close <= local:
+                return close
+    return local - datetime.timedelta(days=7)
+
+
+def is_fresh(fetched_at: float, market: str, now: float = None, intraday_ttl: int = None) -> bool:
+    """
+    判断在 fetched_at 时刻抓取的数据在 now 时刻是否仍然有效。
+    盘中按 TTL 过期；休市期间，只要数据是在最近一次收盘之后抓取的就有效。
+    """
+    now = time.time() if now is None else now
+    ttl = INTRADAY_TTL if intraday_ttl is None else intraday_ttl
+    if market not in MARKET_SESSIONS:
+        return now - fetched_at < ttl
+    if is_market_open(market, now):
+        return now - fetched_at < ttl
+    return fetched_at >= last_session_close(market, now).timestamp()
+
+
+def delta_start(hist: pd.DataFrame):
+    """
+    增量请求的起始日期 (YYYYMMDD)。
+    从倒数第二根 K 线开始请求：最后一根可能是盘中未完成的 K 线，需要覆盖；
+    倒数第二根作为重叠校验，用于发现复权价格的变化。
+    """
+    if len(hist) < 2:
+        return None
+    return hist.index[-2].strftime("%Y%m%d")
+
+
+def merge_history(cached: pd.DataFrame, delta: pd.DataFrame, rtol: float = 1e-4):
+    """
+    将增量数据合并进缓存序列，重复日期以新数据为准。
+    若重叠的已完成 K 线收盘价不一致（如分红导致复权价整体调整），返回 None，调用方应全量重新获取。
+    """
+    if delta is None or delta.empty:
+        return cached
+
+    # 不同接口返回的时区可能不同（如 yf.download 与 Ticker.history），统一为缓存的时区
+    cached_tz, delta_tz = getattr(cached.index, "tz", None), getattr(delta.index, "tz", None)
+    if (cached_tz is None) != (delta_tz is None):
+        return None
+    if cached_tz is not None and str(cached_tz) != str(delta_tz):
+        delta = delta.tz_convert(cached_tz)
+
+    # 最后一根缓存 K 线可能是盘中数据，不参与校验
+    overlap = cached.index[:-1].intersection(delta.index)
+    if len(overlap) > 0:
+        old_close = cached.loc[overlap, 'Close'].astype(float)
+        new_close = delta.loc[overlap, 'Close'].astype(float)
+        if ((old_close - new_close).abs() > rtol * old_close.abs()).any():
+            return None
+
+    merged = pd.concat([cached, delta])
+    return merged[~merged.index.duplicated(keep='last')].sort_index()
+
+
+def _json_default(value):
+    # numpy 标量等无法直接序列化的类型
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+class StockCache:
+    """
+    行情缓存：内存层 + 磁盘层。
+    磁盘层为按股票、年份分区的 Parquet 列式存储：
+        {cache_dir}/{ticker}/{year}.parquet 与 {cache_dir}/{ticker}/meta.json
+    增量追加只重写受影响的年份分区；读取时通过内存映射只加载需要的列。
+    记录命中/未命中/绕过次数，线程安全。
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, intraday_ttl: int = INTRADAY_TTL):
+        self.cache_dir = cache_dir
+        self.intraday_ttl = intraday_ttl
+        self._memory = {}
+        self._meta = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "bypass": 0}
+
+    def _ticker_dir(self, ticker: str) -> str:
+        return os.path.join(self.cache_dir, ticker)
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _read_meta(self, ticker: str):
+        with self._lock:
+            meta = self._meta.get(ticker)
+        if meta is not None:
+            return meta
+        meta_path = os.path.join(self._ticker_dir(ticker), "meta.json")
+        if not os.path.exists(meta_path):
+            return self._migrate_csv(ticker)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except Exception as e:
+            print(f"⚠️  读取缓存元数据失败 {meta_path}: {e}")
+            return None
+        with self._lock:
+            self._meta[ticker] = meta
+        return meta
+
+    def _read_frame(self, ticker: str, columns: list = None):
+        """从年份分区读取数据，columns 为 None 时读取全部列"""
+        ticker_dir = self._ticker_dir(ticker)
+        files = sorted(f for f in os.listdir(ticker_dir) if f.endswith(".parquet"))
+        if not files:
+            return None
+        read_columns = None if columns is None else ["Date"] + list(columns)
+        tables = [pq.read_table(os.path.join(ticker_dir, f), columns=read_columns, memory_map=True) for f in files]
+        table = pa.concat_tables(tables, promote_options="default") if len(tables) > 1 else tables[0]
+        return table.to_pandas().set_index("Date")
+
+    def _migrate_csv(self, ticker: str):
+        """
+        将旧版 CSV 缓存迁移为分区存储：{ticker}.csv + {ticker}.meta.json，
+        以及更早版本没有元数据、按未规范化代码命名的 CSV（如 601658.csv），后者以文件修改时间作为抓取时间。
+        同一股票有多份旧缓存时只迁移最新的一份，其余旧文件一并删除。
+        """
+        names = [ticker]
+        code = ticker.split('.')[0]
+        if code != ticker and detect_market(ticker) == "cn":
+            names.append(code)
+        legacy = []
+        for name in names:
+            csv_path = os.path.join(self.cache_dir, f"{name}.csv")
+            meta_path = os.path.join(self.cache_dir, f"{name}.meta.json")
+            if not os.path.exists(csv_path):
+                continue
+            try:
+                if os.path.exists(meta_path):
+                    with open(meta_path, "r", encoding="utf-8") as f:
+                        meta = json.load(f)
+                else:
+                    meta = {"fetched_at": os.path.getmtime(csv_path)}
+            except Exception as e:
+                print(f"⚠️  迁移旧缓存失败 {csv_path}: {e}")
+                continue
+            legacy.append((meta, csv_path, meta_path))
+        if not legacy:
+            return None
+
+        meta, csv_path, _ = max(legacy, key=lambda item: item[0]["fetched_at"])
+        try:
+            hist = pd.read_csv(csv_path, index_col=0)
+            index_tz = meta.get("index_tz")
+            if not index_tz and len(hist) and _TZ_OFFSET.search(str(hist.index[0])):
+                # 没有元数据的 yfinance 数据带时区偏移，按所在市场的时区解析
+                index_tz = MARKET_SESSIONS[detect_market(ticker)][0]
+            if index_tz:
+                hist.index = pd.to_datetime(hist.index, utc=True).tz_convert(index_tz)
+            else:
+                hist.index = pd.to_datetime(hist.index)
+        except Exception as e:
+            print(f"⚠️  迁移旧缓存失败 {csv_path}: {e}")
+            return None
+        self.put(ticker, hist, meta.get("fundamentals", {}), provider=meta.get("provider"),
+                 fetched_at=meta["fetched_at"])
+        for _, old_csv, old_meta in legacy:
+            os.remove(old_csv)
+            if os.path.exists(old_meta):
+                os.remove(old_meta)
+        return self._read_meta(ticker)
+
+    def _entry(self, meta: dict, hist: pd.DataFrame) -> dict:
+        return {"hist": hist, "fundamentals": meta.get("fundamentals", {}),
+                "fetched_at": meta["fetched_at"], "provider": meta.get("provider")}
+
+    def get(self, ticker: str, market: str, columns: list = None):
+        """返回新鲜的 (hist, fundamentals)，未命中或已过期返回 None；columns 指定只读取部分列"""
+        with tracer.span("cache.stock", "cache", ticker=ticker) as span:
+            meta = self._read_meta(ticker)
+            if meta is None:
+                self._count("misses")
+                span.set(hit=False)
+                return None
+            if not is_fresh(meta["fetched_at"], market, intraday_ttl=self.intraday_ttl):
+                self._count("misses")
+                self._count("stale")
+                span.set(hit=False, stale=True)
+                return None
+
+            entry = self.peek(ticker, columns=columns)
+            if entry is None:
+                self._count("misses")
+                span.set(hit=False)
+                return None
+            self._count("hits")
+            span.set(hit=True)
+            return entry["hist"].copy(), dict(entry["fundamentals"])
+
+    def peek(self, ticker: str, columns: list = None):
+        """不论新鲜与否返回缓存条目（用于增量更新），不计入命中统计"""
+        with self._lock:
+            entry = self._memory.get(ticker)
+        if entry is not None:
+            if columns is None:
+                return entry
+            return dict(entry, hist=entry["hist"][list(columns)])
+
+        meta = self._read_meta(ticker)
+        if meta is None:
+            return None
+        try:
+            hist = self._read_frame(ticker, columns)
+        except Exception as e:
+            print(f"⚠️  读取缓存失败 {self._ticker_dir(ticker)}: {e}")
+            return None
+        if hist is None:
+            return None
+        entry = self._entry(meta, hist)
+        # 只有完整读取时才放入内存层
+        if columns is None:
+            with self._lock:
+                self._memory[ticker] = entry
+        return entry
+
+    def put(self, ticker: str, hist: pd.DataFrame, fundamentals: dict, provider: str = None,
+            fetched_at: float = None, append_from: str = None):
+        """
+        写入内存层和磁盘层，provider 记录数据来源，增量合并时只合并同源数据。
+        append_from (YYYYMMDD) 表示 hist 只在该日期之后发生了变化，只重写对应年份之后的分区；
+        为 None 时视为全量替换，删除旧分区。
+        """
+        entry = {
+            "hist": hist.copy(),
+            "fundamentals": dict(fundamentals or {}),
+            "fetched_at": time.time() if fetched_at is None else fetched_at,
+            "provider": provider,
+        }
+        meta = {
+            "fetched_at": entry["fetched_at"],
+            "provider": provider,
+            "fundamentals": entry["fundamentals"],
+        }
+        # 经过一次 JSON 往返，保证内存中的元数据与磁盘一致
+        meta = json.loads(json.dumps(meta, ensure_ascii=False, default=_json_default))
+
+        ticker_dir = self._ticker_dir(ticker)
+        os.makedirs(ticker_dir, exist_ok=True)
+        frame = hist.rename_axis("Date").reset_index()
+        years = frame["Date"].dt.year
+        first_year = int(append_from[:4]) if append_from else None
+
+        with self._lock:
+            if first_year is None:
+                for f in os.listdir(ticker_dir):
+                    if f.endswith(".parquet"):
+                        os.remove(os.path.join(ticker_dir, f))
+            for year in sorted(years.unique()):
+                if first_year is not None and year < first_year:
+                    continue
+                table = pa.Table.from_pandas(frame[years == year], preserve_index=False)
+                tmp_path = os.path.join(ticker_dir, f"{year}.parquet.tmp")
+                pq.write_table(table, tmp_path)
+                os.replace(tmp_path, os.path.join(ticker_dir, f"{year}.parquet"))
+            with open(os.path.join(ticker_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            self._meta[ticker] = meta
+            self._memory[ticker] = entry
+        print(f"💾 Data cached to {ticker_dir}")
+
+    def fingerprint(self, ticker: str, market: str = None):
+        """
+        返回缓存数据的版本标识 (fetched_at, 是否新鲜)，没有缓存时返回 None。
+        用于判断基于该股票数据生成的结果（如缓存的回答）是否仍然有效。
+        """
+        meta = self._read_meta(ticker)
+        if meta is None:
+            return None
+        market = market or detect_market(ticker)
+        return meta["fetched_at"], is_fresh(meta["fetched_at"], market, intraday_ttl=self.intraday_ttl)
+
+    def record_bypass(self):
+        self._count("bypass")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+    def clear(self):
+        """清空内存层（磁盘文件保留）"""
+        with self._lock:
+            self._memory.clear()
+            self._meta.clear()
+
+
+# 进程级共享缓存
+stock_cache = StockCache()
+
+
+def get_cache_stats() -> dict:
+    return stock_cache.stats()
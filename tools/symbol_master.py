@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+本地股票代码表 (symbol master)
+
+在任何网络请求之前把用户输入（无后缀代码、带后缀代码、港股代码、中文公司名）
+规范化为唯一的标准代码和数据源，避免 .SH/.SZ 试错以及缓存中出现 601658 与 601658.SH 两份数据。
+代码表来自 tushare stock_basic（失败时使用 AkShare 列表），保存在本地并每天刷新一次。
+"""
+import os
+import re
+import json
+import time
+import threading
+
+from utils import lazy_imports
+
+SYMBOL_MASTER_PATH = "data_source/symbol_master.json"
+# 代码表刷新间隔（秒）
+REFRESH_INTERVAL = 24 * 3600
+# 下载失败后的重试间隔（秒），避免断网时每次查询都等待一次失败的全量下载
+RETRY_DELAY = 300
+
+A_SHARE_SUFFIXES = ('.SH', '.SZ', '.BJ')
+
+_HK_PATTERN = re.compile(r'^(?:HK)?0*(\d{1,5})(?:\.HK)?$')
+_PREFIXED_A_SHARE = re.compile(r'^(SH|SZ|BJ)(\d{6})$')
+
+
+def infer_a_share_suffix(code: str) -> str:
+    """根据代码段推断交易所后缀（代码表不可用时使用）"""
+    if code.startswith(('4', '8', '92')):
+        return '.BJ'
+    if code.startswith(('5', '6', '9')):
+        return '.SH'
+    return '.SZ'
+
+
+def _contains_cjk(text: str) -> bool:
+    return any('一' <= ch <= '鿿' for ch in text)
+
+
+class SymbolMaster:
+    """代码 -> 标准代码、名称 -> 标准代码的内存索引，线程安全"""
+
+    def __init__(self, path: str = SYMBOL_MASTER_PATH, refresh_interval: int = REFRESH_INTERVAL):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self._by_code = {}
+        self._by_name = {}
+        self._names = {}
+        self._updated_at = 0.0
+        self._failed_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    # ---------- 加载与刷新 ----------
+
+    def _index(self, symbols: list, updated_at: float):
+        by_code, by_name, names = {}, {}, {}
+        for item in symbols:
+            symbol, name = item["symbol"], item.get("name")
+            by_code[symbol.split('.')[0]] = symbol
+            if name:
+                by_name[name] = symbol
+                names[symbol] = name
+        with self._lock:
+            self._by_code, self._by_name, self._names = by_code, by_name, names
+            self._updated_at = updated_at
+
+    def _load_from_disk(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._index(data["symbols"], data["updated_at"])
+            return True
+        except Exception as e:
+            print(f"⚠️  读取代码表失败 {self.path}: {e}")
+            return False
+
+    def _download(self) -> list:
+        """下载A股（及港股）代码表"""
+        symbols = []
+        ak = lazy_imports.akshare()
+        try:
+            pro = lazy_imports.tushare().pro_api()
+            stock_basic = pro.stock_basic(exchange='', list_status='L', fields='ts_code,name')
+            symbols = [{"symbol": row.ts_code, "name": row.name} for row in stock_basic.itertuples()]
+        except Exception as e:
+            print(f"⚠️  tushare 代码表获取失败，使用 AkShare: {e}")
+        if not symbols:
+            code_name = ak.stock_info_a_code_name()
+            symbols = [{"symbol": row.code + infer_a_share_suffix(row.code), "name": row.name}
+                       for row in code_name.itertuples()]
+        try:
+            hk_spot = ak.stock_hk_spot_em()
+            symbols += [{"symbol": f"{int(code):04d}.HK", "name": name}
+                        for code, name in zip(hk_spot['代码'], hk_spot['名称'])]
+        except Exception as e:
+            print(f"⚠️  港股代码表获取失败: {e}")
+        return symbols
+
+    def refresh(self):
+        """从数据源重新下载代码表并写入本地"""
+        print("🔧 Tool: Refreshing symbol master...")
+        symbols = self._download()
+        updated_at = time.time()
+        self._index(symbols, updated_at)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"updated_at": updated_at, "symbols": symbols}, f, ensure_ascii=False)
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                self._failed_at = time.time()
+                print(f"⚠️  代码表刷新失败: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def ensure_loaded(self, blocking: bool = False) -> bool:
+        """
+        保证代码表可用。本地文件过期时后台刷新，不阻塞查询；
+        本地没有代码表时，blocking=True 会同步下载，否则只在后台下载。
+        返回当前是否有可用的代码表。
+        """
+        if not self._updated_at:
+            self._load_from_disk()
+        if time.time() - self._updated_at < self.refresh_interval:
+            return True
+        if time.time() - self._failed_at < RETRY_DELAY:
+            return bool(self._updated_at)
+        if self._updated_at or not blocking:
+            self._refresh_in_background()
+            return bool(self._updated_at)
+        try:
+            self.refresh()
+        except Exception as e:
+            self._failed_at = time.time()
+            print(f"⚠️  代码表下载失败: {e}")
+        return bool(self._updated_at)
+
+    # ---------- 查询 ----------
+
+    def lookup_name(self, name: str):
+        """按公司名称查找标准代码，先精确匹配，再匹配唯一包含该名称的公司"""
+        self.ensure_loaded(blocking=True)
+        symbol = self._by_name.get(name)
+        if symbol:
+            return symbol
+        matches = [s for n, s in self._by_name.items() if name in n]
+        return matches[0] if len(matches) == 1 else None
+
+    def is_listed(self, code: str) -> bool:
+        """6位代码是否在代码表中；代码表尚不可用时返回 True"""
+        if not self.ensure_loaded():
+            return True
+        return code in self._by_code
+
+    def name_of(self, symbol: str):
+        self.ensure_loaded()
+        return self._names.get(symbol)
+
+    @property
+    def version(self) -> float:
+        """代码表版本（更新时间），代码表刷新后变化"""
+        return self._updated_at
+
+    def names(self) -> dict:
+        """返回 {标准代码: 名称}"""
+        self.ensure_loaded()
+        return dict(self._names)
+
+    def resolve(self, text: str, market: str = None):
+        """
+        将用户输入规范化为 (标准代码, 数据源)，数据源为 'tushare'（A股）或 'yfinance'（美股/港股）。
+        market 可强制指定 'cn' / 'us'；无法识别的中文名称原样返回。
+        """
+        raw = text.strip()
+        ticker = raw.upper()
+
+        if market == 'us':
+            return ticker, "yfinance"
+
+        # 带后缀的A股代码：600519.sh -> 600519.SH
+        if ticker.endswith(A_SHARE_SUFFIXES) and ticker[:-3].isdigit():
+            return ticker, "tushare"
+        # 带前缀的A股代码：SH600519 -> 600519.SH
+        prefixed = _PREFIXED_A_SHARE.match(ticker)
+        if prefixed:
+            return f"{prefixed.group(2)}.{prefixed.group(1)}", "tushare"
+        # 无后缀的6位代码
+        if ticker.isdigit() and len(ticker) == 6:
+            self.ensure_loaded()
+            symbol = self._by_code.get(ticker) or ticker + infer_a_share_suffix(ticker)
+            return symbol, "tushare"
+        # 港股代码：00700 / 0700.HK / HK00700 -> 0700.HK
+        if market != 'cn' and (ticker.endswith('.HK') or ticker.startswith('HK') or ticker.isdigit()):
+            hk = _HK_PATTERN.match(ticker)
+            if hk:
+                return f"{int(hk.group(1)):04d}.HK", "yfinance"
+        # 中文公司名
+        if _contains_cjk(raw):
+            symbol = self.lookup_name(raw)
+            if symbol:
+                return symbol, "yfinance" if symbol.endswith('.HK') else "tushare"
+            return raw, "tushare"
+
+        return ticker, "tushare" if market == 'cn' else "yfinance"
+
+
+# 进程级共享代码表
+symbol_master = SymbolMaster()
+
+
+def canonicalize_ticker(ticker: str, market: str = None) -> str:
+    """返回标准代码"""
+    return symbol_master.resolve(ticker, market)[0]
@@ -0,0 +1,62 @@
+"""
+重量级第三方库的延迟导入
+
+yfinance / tushare / akshare 各需要约 1 秒导入，导入 core.agent 时不再加载它们，
+而是在第一次调用数据源时才导入；代理环境变量和 tushare token 也在那时才设置。
+"""
+import os
+import threading
+
+# 代理设置，此处修改（也可通过环境变量 ALPHA_SCOUT_PROXY 覆盖，设为空字符串则不设置代理）
+# 环境变量在第一次调用数据源时才读取，此时 .env 已由 load_dotenv() 加载
+DEFAULT_PROXY = 'http://127.0.0.1:7890'
+
+_lock = threading.Lock()
+_proxy_applied = False
+_tushare_ready = False
+
+
+def apply_proxy():
+    """设置数据源使用的代理（只设置一次）"""
+    global _proxy_applied
+    with _lock:
+        if _proxy_applied:
+            return
+        proxy = os.getenv("ALPHA_SCOUT_PROXY", DEFAULT_PROXY)
+        if proxy:
+            os.environ['HTTP_PROXY'] = proxy
+            os.environ['HTTPS_PROXY'] = proxy
+        _proxy_applied = True
+
+
+def tushare():
+    """导入 tushare 并设置 token"""
+    global _tushare_ready
+    apply_proxy()
+    import tushare as ts
+    with _lock:
+        if not _tushare_ready:
+            # 从环境变量获取tushare token，如果没有则使用默认值
+            ts.set_token(os.getenv("TS_TOKEN", "your_tushare_token_here"))
+            _tushare_ready = True
+    return ts
+
+
+def akshare():
+    apply_proxy()
+    import akshare as ak
+    return ak
+
+
+def yfinance():
+    apply_proxy()
+    import yfinance as yf
+    return yf
+
+
+def pyplot():
+    """导入 matplotlib.pyplot，使用非交互式后端，避免Tkinter相关错误"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
@@ -0,0 +1,285 @@
+"""
+LLM 网关
+
+Agent 和情绪分析工具共用的模型入口：
+- 进程内只创建一对 OpenAI / AsyncOpenAI 客户端，连接池在所有调用之间复用
+- 全局并发上限 (LLM_MAX_CONCURRENCY) 和每分钟 token 预算 (LLM_TPM)，同时沿用 rate_limiters 的 "llm" 请求速率
+- 429 / 5xx / 连接错误 / 超时按带抖动的指数退避重试，不再直接变成工具错误
+- 记录每次调用的延迟和 token 用量（tracing span + stats()）
+模型名称通过环境变量 LLM_MODEL 配置。
+"""
+import os
+import time
+import random
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterator
+
+from utils.tracing import tracer
+from utils.rate_limiter import rate_limiters, TokenBucket
+
+LLM_MODEL = os.getenv("LLM_MODEL", "deepseek-chat")
+# 同时进行中的模型请求数上限
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# 等待并发槽位的最长时间（秒），超时抛出 TimeoutError
+LLM_SLOT_TIMEOUT = float(os.getenv("LLM_SLOT_TIMEOUT", "300"))
+# 每分钟 token 预算（提示 + 生成），0 表示不限制
+LLM_TPM = int(os.getenv("LLM_TPM", "0"))
+# 可重试错误的最大重试次数，以及退避的初始/最大等待（秒）
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE = float(os.getenv("LLM_RETRY_BASE", "1.0"))
+LLM_RETRY_MAX = 30.0
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {"APIConnectionError", "APITimeoutError", "Timeout", "ConnectionError"}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """限流、服务端错误、连接错误和超时可以重试；参数错误、鉴权失败等不重试"""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return type(error).__name__ in RETRYABLE_ERRORS
+
+
+def backoff_delay(attempt: int, base: float = LLM_RETRY_BASE, error: BaseException = None) -> float:
+    """指数退避 + 随机抖动；服务端返回 Retry-After 时以其为下限"""
+    delay = min(LLM_RETRY_MAX, base * (2 ** attempt)) * random.uniform(0.5, 1.5)
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        delay = max(delay, float(headers.get("retry-after", 0)))
+    except (TypeError, ValueError):
+        pass
+    return min(delay, LLM_RETRY_MAX)
+
+
+class LLMGateway:
+    """共享的模型客户端，线程安全，同时支持同步、异步和流式调用"""
+
+    def __init__(self, model: str = LLM_MODEL, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 tpm: int = LLM_TPM, max_retries: int = LLM_MAX_RETRIES, retry_base: float = LLM_RETRY_BASE,
+                 slot_timeout: float = LLM_SLOT_TIMEOUT, client=None, async_client=None):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.slot_timeout = slot_timeout
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self._client = client
+        self._async_client = async_client
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # 异步调用在这些线程中阻塞等待槽位，不占用事件循环，也不占用默认线程池
+        self._slot_waiters = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm-slot")
+        # 按分钟预算换算成每秒补充的令牌，允许一分钟的突发
+        self._tpm = TokenBucket(tpm / 60.0, capacity=tpm) if tpm > 0 else TokenBucket(0)
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "errors": 0, "retries": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                       "total_latency": 0.0, "max_latency": 0.0, "in_flight": 0}
+
+    # ---------- 客户端 ----------
+
+    @staticmethod
+    def _credentials() -> dict:
+        api_key = os.getenv("api_key")
+        if not api_key:
+            raise RuntimeError("api_key not found in .env")
+        # 重试由网关负责，关闭 SDK 自带的重试
+        return {"api_key": api_key, "base_url": os.getenv("api_base"), "max_retries": 0}
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                # OpenAI SDK 导入较慢，第一次调用时才导入
+                from openai import OpenAI
+                self._client = OpenAI(**self._credentials())
+            return self._client
+
+    @property
+    def async_client(self):
+        with self._lock:
+            if self._async_client is None:
+                from openai import AsyncOpenAI
+                self._async_client = AsyncOpenAI(**self._credentials())
+            return self._async_client
+
+    # ---------- 记账 ----------
+
+    def _begin(self):
+        with self._lock:
+            self._stats["in_flight"] += 1
+
+    def _end(self, latency: float, error: bool = False):
+        with self._lock:
+            self._stats["in_flight"] -= 1
+            self._stats["calls"] += 1
+            self._stats["errors"] += int(error)
+            self._stats["total_latency"] += latency
+            self._stats["max_latency"] = max(self._stats["max_latency"], latency)
+
+    def record_usage(self, usage, span=None):
+        prompt = getattr(usage, "prompt_tokens", None) or 0
+        completion = getattr(usage, "completion_tokens", None) or 0
+        with self._lock:
+            self._stats["prompt_tokens"] += prompt
+            self._stats["completion_tokens"] += completion
+        self._tpm.consume(prompt + completion)
+        if span is not None:
+            span.set(prompt_tokens=prompt, completion_tokens=completion)
+
+    def _retry(self, attempt: int, error: BaseException) -> float:
+        """返回重试前需要等待的秒数；不可重试或次数用尽时返回 None"""
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        with self._lock:
+            self._stats["retries"] += 1
+        delay = backoff_delay(attempt, self.retry_base, error)
+        print(f"⚠️  LLM request failed ({type(error).__name__}), retrying in {delay:.1f}s "
+              f"({attempt + 1}/{self.max_retries})")
+        return delay
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        finished = stats["calls"]
+        stats["avg_latency"] = round(stats.pop("total_latency") / finished, 3) if finished else 0.0
+        stats["max_latency"] = round(stats["max_latency"], 3)
+        stats["model"] = self.model
+        return stats
+
+    # ---------- 并发槽位 ----------
+
+    def _acquire_slot_blocking(self):
+        """阻塞等待一个并发槽位，超过 slot_timeout 抛出 TimeoutError"""
+        if not self._slots.acquire(timeout=self.slot_timeout):
+            raise TimeoutError(f"LLM concurrency slot not available within {self.slot_timeout}s")
+
+    async def _acquire_slot(self):
+        """异步等待并发槽位：与同步调用共享同一个信号量，在等待线程中阻塞，事件循环不轮询"""
+        if self._slots.acquire(blocking=False):
+            return
+        waiter = self._slot_waiters.submit(self._acquire_slot_blocking)
+        try:
+            await asyncio.wrap_future(waiter)
+        except asyncio.CancelledError:
+            # 调用被取消时等待线程仍可能拿到槽位，拿到后立即归还
+            waiter.add_done_callback(
+                lambda f: f.cancelled() or f.exception() is not None or self._slots.release())
+            raise
+
+    # ---------- 调用 ----------
+
+    def _create(self, span, messages, kwargs):
+        """占用并发槽位并发出一次请求，可重试错误按退避重试"""
+        attempt = 0
+        while True:
+            wait = rate_limiters.acquire("llm") + self._tpm.acquire(0)
+            self._acquire_slot_blocking()
+            self._begin()
+            start = time.perf_counter()
+            try:
+                response = self.client.chat.completions.create(model=self.model, messages=messages, **kwargs)
+            except Exception as e:
+                self._end(time.perf_counter() - start, error=True)
+                delay = self._retry(attempt, e)
+                if delay is None:
+                    raise
+            else:
+                self._end(time.perf_counter() - start)
+                span.set(rate_limit_wait=wait, retries=attempt)
+                return response
+            finally:
+                self._slots.release()
+            time.sleep(delay)
+            attempt += 1
+
+    def chat(self, messages: List[Dict[str, Any]], **kwargs):
+        """非流式调用，返回 OpenAI 响应对象"""
+        with tracer.span("llm.chat", "llm", model=self.model) as span:
+            response = self._create(span, messages, kwargs)
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                self.record_usage(usage, span)
+        return response
+
+    def stream(self, messages: List[Dict[str, Any]], span=None, **kwargs) -> Iterator[Any]:
+        """
+        流式调用，逐个产出 chunk；连接建立前的错误会重试，产出 chunk 之后的错误直接抛出。
+        迭代结束（或生成器关闭）前一直占用一个并发槽位。
+        """
+        own_span = span is None
+        if own_span:
+            span = tracer.start_span("llm.chat", "llm", model=self.model, stream=True)
+        kwargs.setdefault("stream_options", {"include_usage": True})
+        attempt = 0
+        while True:
+            wait = rate_limiters.acquire("llm") + self._tpm.acquire(0)
+            self._acquire_slot_blocking()
+            self._begin()
+            start = time.perf_counter()
+            try:
+                response = self.client.chat.completions.create(model=self.model, messages=messages,
+                                                               stream=True, **kwargs)
+                break
+            except Exception as e:
+                self._slots.release()
+                self._end(time.perf_counter() - start, error=True)
+                delay = self._retry(attempt, e)
+                if delay is None:
+                    if own_span:
+                        span.finish(error=e)
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+        span.set(rate_limit_wait=wait, retries=attempt)
+        error = False
+        try:
+            for chunk in response:
+                usage = getattr(chunk, "usage", None)
+                if usage is not None:
+                    self.record_usage(usage, span)
+                yield chunk
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self._slots.release()
+            self._end(time.perf_counter() - start, error=error)
+            if own_span:
+                span.finish()
+
+    async def achat(self, messages: List[Dict[str, Any]], **kwargs):
+        """chat 的异步版本，基于 AsyncOpenAI"""
+        with tracer.span("llm.chat", "llm", model=self.model) as span:
+            attempt = 0
+            while True:
+                wait = await rate_limiters.aacquire("llm") + await self._tpm.aacquire(0)
+                await self._acquire_slot()
+                self._begin()
+                start = time.perf_counter()
+                try:
+                    response = await self.async_client.chat.completions.create(
+                        model=self.model, messages=messages, **kwargs)
+                except Exception as e:
+                    self._end(time.perf_counter() - start, error=True)
+                    delay = self._retry(attempt, e)
+                    if delay is None:
+                        raise
+                else:
+                    self._end(time.perf_counter() - start)
+                    span.set(rate_limit_wait=wait, retries=attempt)
+                    break
+                finally:
+                    self._slots.release()
+                await asyncio.sleep(delay)
+                attempt += 1
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                self.record_usage(usage, span)
+        return response
+
+
+# 进程级共享实例
+llm_gateway = LLMGateway()
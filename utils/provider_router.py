@@ -0,0 +1,232 @@
+import time
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from utils.tracing import tracer
+from utils.rate_limiter import rate_limiters
+
+# 样本不足时的对冲延迟（秒）
+DEFAULT_HEDGE_DELAY = 2.0
+# 计算 p95 所需的最少样本数
+MIN_SAMPLES = 5
+
+
+class CircuitOpenError(RuntimeError):
+    """数据源熔断中，本次请求未发出"""
+
+
+class InvalidProviderData(ValueError):
+    """数据源返回了无法使用的数据（例如 akshare 失败时的全 0 占位数据）"""
+
+
+def is_provider_failure(error: BaseException) -> bool:
+    """
+    是否是数据源本身的故障：网络/代理错误、超时、5xx，或 is_valid 校验失败。
+    "股票代码不存在"、"无法获取历史数据" 等针对单只股票的数据错误说明数据源可用，不计入熔断。
+    """
+    if isinstance(error, InvalidProviderData):
+        return True
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if status is not None:
+        return status >= 500
+    return isinstance(error, (OSError, TimeoutError))
+
+
+class ProviderStats:
+    """
+    单个数据源的延迟/错误统计和熔断器。
+    连续失败 failure_threshold 次后熔断 (open)，reset_timeout 秒后放行一次试探请求 (half_open)，
+    试探成功则恢复 (closed)，失败则继续熔断。
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 60.0, window: int = 50):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.latencies = deque(maxlen=window)
+        self.successes = 0
+        self.failures = 0
+        self.data_errors = 0
+        self.consecutive_failures = 0
+        self.state = "closed"
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self.latencies.append(latency)
+            self.successes += 1
+            self.consecutive_failures = 0
+            self.state = "closed"
+            self._trial_in_flight = False
+
+    def record_data_error(self):
+        """数据源正常响应但该股票没有数据：不计入熔断，半开状态下视为试探成功"""
+        with self._lock:
+            self.data_errors += 1
+            self.consecutive_failures = 0
+            self.state = "closed"
+            self._trial_in_flight = False
+
+    def record_failure(self, trip: bool = True):
+        """trip=False 时只计数不熔断（没有备用数据源时熔断只会让所有请求失败）"""
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if trip and (self.state == "half_open" or self.consecutive_failures >= self.failure_threshold):
+                if self.state != "open":
+                    print(f"⚠️  数据源 {self.name} 熔断")
+                self.state = "open"
+                self.opened_at = time.time()
+            self._trial_in_flight = False
+
+    def p95(self):
+        with self._lock:
+            samples = sorted(self.latencies)
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def snapshot(self) -> dict:
+        p95 = self.p95()
+        with self._lock:
+            total = self.successes + self.failures
+            return {
+                "state": self.state,
+                "successes": self.successes,
+                "failures": self.failures,
+                "data_errors": self.data_errors,
+                "error_rate": round(self.failures / total, 4) if total else 0.0,
+                "p95_latency": round(p95, 3) if p95 is not None else None,
+            }
+
+
+class ProviderRouter:
+    """
+    按优先级依次尝试多个数据源，跳过熔断中的数据源。
+    hedge=True 时，若当前数据源在其 p95 延迟内没有返回，就同时启动下一个数据源，取最先成功的结果。
+    """
+
+    def __init__(self, hedge: bool = False, failure_threshold: int = 3, reset_timeout: float = 60.0,
+                 max_workers: int = 16):
+        self.hedge = hedge
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._providers = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="provider")
+
+    def stats_for(self, name: str) -> ProviderStats:
+        with self._lock:
+            if name not in self._providers:
+                self._providers[name] = ProviderStats(name, self.failure_threshold, self.reset_timeout)
+            return self._providers[name]
+
+    def stats(self) -> dict:
+        with self._lock:
+            providers = dict(self._providers)
+        return {name: stats.snapshot() for name, stats in providers.items()}
+
+    def _timed(self, name, fn, is_valid, args, kwargs, trip=True):
+        stats = self.stats_for(name)
+        with tracer.span(f"provider.{name}", "provider", function=getattr(fn, "__name__", str(fn))) as span:
+            # 限速等待不计入数据源延迟
+            span.set(rate_limit_wait=rate_limiters.acquire(name))
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+                if is_valid is not None and not is_valid(result):
+                    raise InvalidProviderData(f"数据源 {name} 返回了无效数据")
+            except Exception as e:
+                if is_provider_failure(e):
+                    stats.record_failure(trip)
+                else:
+                    stats.record_data_error()
+                raise
+            stats.record_success(time.perf_counter() - start)
+            return result
+
+    def _hedge_delay(self, name: str) -> float:
+        p95 = self.stats_for(name).p95()
+        return DEFAULT_HEDGE_DELAY if p95 is None else p95
+
+    def call(self, candidates: list, *args, is_valid=None, **kwargs):
+        """
+        candidates: [(数据源名称, 函数), ...]，按优先级排列。
+        is_valid: 可选的结果校验函数，返回 False 视为失败。
+        返回 (结果, 数据源名称)；全部失败时抛出最后一个异常，全部熔断时抛出 CircuitOpenError。
+        只有一个数据源时不使用熔断：没有备用数据源可切换，熔断只会让所有请求失败。
+        """
+        if len(candidates) == 1:
+            name, fn = candidates[0]
+            return self._timed(name, fn, is_valid, args, kwargs, trip=False), name
+        if self.hedge:
+            return self._call_hedged(candidates, is_valid, args, kwargs)
+
+        last_error = None
+        for name, fn in candidates:
+            # 熔断检查放在真正发出请求之前，半开状态的试探名额不会被白白占用
+            if not self.stats_for(name).allow():
+                print(f"⚡ 跳过熔断中的数据源 {name}")
+                continue
+            try:
+                return self._timed(name, fn, is_valid, args, kwargs), name
+            except Exception as e:
+                print(f"🔄 数据源 {name} 获取失败: {e}")
+                last_error = e
+        raise last_error or CircuitOpenError(f"数据源均处于熔断状态: {[name for name, _ in candidates]}")
+
+    def _call_hedged(self, candidates, is_valid, args, kwargs):
+        pending = {}
+        remaining = list(candidates)
+        last_error = None
+
+        def launch():
+            """启动下一个未熔断的数据源，返回其名称；没有可用数据源时返回 None"""
+            while remaining:
+                name, fn = remaining.pop(0)
+                if not self.stats_for(name).allow():
+                    print(f"⚡ 跳过熔断中的数据源 {name}")
+                    continue
+                # 每个任务使用独立的上下文副本，保证 contextvars 在线程中可见
+                ctx = contextvars.copy_context()
+                future = self._executor.submit(ctx.run, self._timed, name, fn, is_valid, args, kwargs)
+                pending[future] = name
+                return name
+            return None
+
+        last_launched = launch()
+        while pending:
+            timeout = self._hedge_delay(last_launched) if remaining else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = launch()
+                if hedged:
+                    print(f"⏱️  数据源 {last_launched} 超过 p95 延迟，对冲请求 {hedged}")
+                    last_launched = hedged
+                continue
+            for future in done:
+                name = pending.pop(future)
+                error = future.exception()
+                if error is None:
+                    return future.result(), name
+                print(f"🔄 数据源 {name} 获取失败: {error}")
+                last_error = error
+            # 有数据源失败时立即启动下一个，不必等待对冲延迟
+            last_launched = launch() or last_launched
+        raise last_error or CircuitOpenError(f"数据源均处于熔断状态: {[name for name, _ in candidates]}")
@@ -0,0 +1,89 @@
+import os
+import time
+import asyncio
+import threading
+
+# 各资源的默认速率（每秒请求数），0 表示不限速；可通过环境变量 RATE_LIMIT_<NAME> 覆盖，例如 RATE_LIMIT_LLM=2
+DEFAULT_RATES = {
+    "llm": 0,
+    "tushare": 0,
+    "yfinance": 0,
+    "akshare": 0,
+}
+
+
+class TokenBucket:
+    """
+    令牌桶限速器：以 rate 个/秒的速度补充令牌，最多积累 capacity 个（允许的突发量）。
+    rate <= 0 时不限速。
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: float) -> float:
+        """预占令牌，返回需要等待的秒数（令牌不足时允许余额为负，后来者排在其后）"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self, tokens: float = 1) -> float:
+        """阻塞直到获得令牌，返回等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, tokens: float = 1) -> float:
+        """acquire 的异步版本，等待时不阻塞事件循环"""
+        if self.rate <= 0:
+            return 0.0
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def consume(self, tokens: float):
+        """只记账不等待：按实际用量事后扣除（例如请求完成后才知道 token 数），余额为负时后续 acquire 需等待"""
+        if self.rate > 0:
+            self._reserve(tokens)
+
+
+class RateLimiters:
+    """按名称管理令牌桶，首次使用时从环境变量读取速率"""
+
+    def __init__(self, rates: dict = None):
+        self._rates = dict(DEFAULT_RATES, **(rates or {}))
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> TokenBucket:
+        with self._lock:
+            if name not in self._buckets:
+                rate = float(os.getenv(f"RATE_LIMIT_{name.upper()}", self._rates.get(name, 0)))
+                self._buckets[name] = TokenBucket(rate)
+            return self._buckets[name]
+
+    def configure(self, name: str, rate: float, capacity: float = None):
+        """运行时修改速率（例如批处理时按配额调整）"""
+        with self._lock:
+            self._buckets[name] = TokenBucket(rate, capacity)
+
+    def acquire(self, name: str, tokens: float = 1) -> float:
+        return self.get(name).acquire(tokens)
+
+    async def aacquire(self, name: str, tokens: float = 1) -> float:
+        return await self.get(name).aacquire(tokens)
+
+
+# 进程级共享实例
+rate_limiters = RateLimiters()
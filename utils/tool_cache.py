@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# 内存中最多保留的结果条数
+TOOL_CACHE_SIZE = int(os.getenv("TOOL_CACHE_SIZE", "512"))
+# 磁盘缓存目录，为空时只使用内存缓存
+TOOL_CACHE_DIR = os.getenv("TOOL_CACHE_DIR", "")
+
+# 视为错误、不写入缓存的结果前缀
+ERROR_PREFIXES = ("Error", "RAG Error", "工具调用错误")
+
+
+def normalize_arguments(arguments: dict) -> str:
+    """参数规范化：去除字符串首尾空格、股票代码统一大写、按键排序"""
+    normalized = {}
+    for key, value in arguments.items():
+        if isinstance(value, str):
+            value = value.strip()
+            if key == "ticker":
+                value = value.upper()
+        elif key == "tickers" and isinstance(value, list):
+            value = [v.strip().upper() if isinstance(v, str) else v for v in value]
+        normalized[key] = value
+    return json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+
+
+def is_error_result(result) -> bool:
+    return isinstance(result, str) and result.startswith(ERROR_PREFIXES)
+
+
+class ToolResultCache:
+    """
+    工具结果缓存：按 (工具名, 规范化参数) 为 key，每条记录带过期时间，超出容量时按 LRU 淘汰。
+    配置 cache_dir 后，可 JSON 序列化的结果同时写入磁盘，进程重启后仍可命中。
+    """
+
+    def __init__(self, max_size: int = TOOL_CACHE_SIZE, cache_dir: str = TOOL_CACHE_DIR):
+        self.max_size = max_size
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "disk_hits": 0}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(tool_name: str, arguments: dict) -> str:
+        return f"{tool_name}:{normalize_arguments(arguments)}"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _remember(self, key: str, expires_at: float, result):
+        self._entries[key] = (expires_at, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _read_disk(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if record.get("key") != key or record["expires_at"] <= time.time():
+            return None
+        return record
+
+    def get(self, key: str):
+        """返回 (是否命中, 结果)"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return True, entry[1]
+                del self._entries[key]
+
+        if self.cache_dir:
+            record = self._read_disk(key)
+            if record is not None:
+                with self._lock:
+                    self._remember(key, record["expires_at"], record["result"])
+                    self._stats["hits"] += 1
+                    self._stats["disk_hits"] += 1
+                return True, record["result"]
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return False, None
+
+    def put(self, key: str, result, ttl: float):
+        if ttl <= 0 or is_error_result(result):
+            return
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._remember(key, expires_at, result)
+        if self.cache_dir:
+            try:
+                payload = json.dumps({"key": key, "expires_at": expires_at, "result": result}, ensure_ascii=False)
+                with open(self._path(key), "w", encoding="utf-8") as f:
+                    f.write(payload)
+            except (OSError, TypeError, ValueError) as e:
+                print(f"⚠️  工具结果写入磁盘缓存失败: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(self._stats, size=len(self._entries),
+                        hit_rate=round(self._stats["hits"] / lookups, 4) if lookups else 0.0)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# 进程级共享实例
+tool_result_cache = ToolResultCache()
@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import uuid
+import functools
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+# 设为 0 可关闭追踪
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "1") == "1"
+# 内存中保留的已结束 span 数量
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "10000"))
+# 设置后每个结束的 span 以 JSON 行追加写入该文件
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", "")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """一次计时的操作。attrs 记录延迟以外的信息，如 token 数、缓存是否命中"""
+
+    __slots__ = ("name", "category", "trace_id", "span_id", "parent_id", "thread_id",
+                 "start_time", "_start", "duration", "attrs", "_tracer")
+
+    def __init__(self, tracer, name: str, category: str, parent, attrs: dict):
+        self._tracer = tracer
+        self.name = name
+        self.category = category
+        self.span_id = uuid.uuid4().hex[:16]
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.parent_id = parent.span_id if parent is not None else None
+        self.thread_id = threading.get_ident()
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.attrs = dict(attrs)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def finish(self, error: BaseException = None):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._start
+        if error is not None:
+            self.attrs["error"] = f"{type(error).__name__}: {error}"
+        self._tracer._record(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "category": self.category,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "thread_id": self.thread_id,
+            "start_time": self.start_time,
+            "duration": self.duration,
+            "attrs": self.attrs,
+        }
+
+
+class _NoopSpan:
+    def set(self, **attrs):
+        return self
+
+    def elapsed(self) -> float:
+        return 0.0
+
+    def finish(self, error: BaseException = None):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """
+    span 追踪：with tracer.span(...) 建立的 span 通过 contextvars 自动成为其中新 span 的父节点，
+    工具线程池复制上下文后同样可以关联到所属请求。结束的 span 保存在内存中，可导出为
+    JSON 行或 Chrome trace 格式（chrome://tracing / Perfetto 打开）。
+    """
+
+    def __init__(self, enabled: bool = TRACE_ENABLED, buffer_size: int = TRACE_BUFFER_SIZE,
+                 jsonl_path: str = TRACE_JSONL_PATH):
+        self.enabled = enabled
+        self.jsonl_path = jsonl_path
+        self._spans = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+
+    def start_span(self, name: str, category: str = "", parent=None, **attrs):
+        """创建 span 但不设为当前 span，需手动 finish()；用于无法使用 with 的场景（如生成器）"""
+        if not self.enabled:
+            return _NOOP_SPAN
+        if parent is None:
+            parent = _current_span.get()
+        return Span(self, name, category, parent if isinstance(parent, Span) else None, attrs)
+
+    @contextmanager
+    def span(self, name: str, category: str = "", **attrs):
+        span = self.start_span(name, category, **attrs)
+        if span is _NOOP_SPAN:
+            yield span
+            return
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.finish(error=e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.finish()
+
+    def _record(self, span: Span):
+        with self._lock:
+            self._spans.append(span)
+            if self.jsonl_path:
+                try:
+                    with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+                except OSError as e:
+                    print(f"⚠️  写入追踪文件失败: {e}")
+
+    def spans(self, trace_id: str = None) -> list:
+        with self._lock:
+            spans = list(self._spans)
+        return [s.to_dict() for s in spans if trace_id is None or s.trace_id == trace_id]
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+    def export_jsonl(self, path: str, trace_id: str = None) -> int:
+        spans = self.spans(trace_id)
+        with open(path, "w", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span, ensure_ascii=False, default=str) + "\n")
+        return len(spans)
+
+    def chrome_trace(self, trace_id: str = None) -> dict:
+        """Chrome trace event 格式：每个 span 为一个完整事件 (ph = X)，时间单位为微秒"""
+        events = [{
+            "name": span["name"],
+            "cat": span["category"],
+            "ph": "X",
+            "ts": span["start_time"] * 1e6,
+            "dur": span["duration"] * 1e6,
+            "pid": os.getpid(),
+            "tid": span["thread_id"],
+            "args": dict(span["attrs"], trace_id=span["trace_id"], span_id=span["span_id"],
+                         parent_id=span["parent_id"]),
+        } for span in self.spans(trace_id)]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path: str, trace_id: str = None) -> int:
+        trace = self.chrome_trace(trace_id)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(trace, f, ensure_ascii=False, default=str)
+        return len(trace["traceEvents"])
+
+
+# 进程级共享实例
+tracer = Tracer()
+
+
+def current_span():
+    return _current_span.get()
+
+
+def set_current_span(context: contextvars.Context, span):
+    """在给定的 contextvars 上下文中设置当前 span（用于显式传递上下文的流式路径）"""
+    if isinstance(span, Span):
+        context.run(_current_span.set, span)
+
+
+def traced(name: str = None, category: str = ""):
+    """装饰器：为函数调用建立 span"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(span_name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator